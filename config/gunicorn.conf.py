@@ -0,0 +1,29 @@
+# gunicorn 部署前端 Web UI（gevent 协程 worker）
+#
+#   gunicorn -c config/gunicorn.conf.py front:app
+#
+# gevent worker 会在加载 app 前自动 monkey-patch，requests/urllib3 的上游 IO 变为协作式，
+# 单个 worker 即可承载大量并发 SSE 流。注意：限流、并发上限和 proxy_ask 缓存都是进程内状态，
+# 按 worker 各自计算。
+import os
+import secrets
+
+from dotenv import load_dotenv
+
+_root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(dotenv_path=os.path.join(_root_dir, "config", ".env"))
+
+chdir = os.path.join(_root_dir, "src")
+bind = f"127.0.0.1:{os.getenv('PORT_FRONTEND', '51209')}"
+worker_class = "gevent"
+workers = int(os.getenv("FRONT_WORKERS", "2"))
+worker_connections = int(os.getenv("FRONT_MAX_CONNECTIONS", "1000"))
+# 流式回复可能持续数分钟，不能按同步 worker 的 30 秒超时杀掉
+timeout = 300
+graceful_timeout = 30
+keepalive = 5
+
+# Flask session 用 secret_key 签名：多个 worker 必须共用同一个 key，
+# 否则登录后落到另一个 worker 的请求会被当成未登录。未配置时由 master 生成一个，
+# 各 worker fork 时继承（重启 master 后已有登录会失效）
+os.environ.setdefault("FLASK_SECRET_KEY", secrets.token_hex(32))
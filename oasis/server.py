@@ -136,6 +136,10 @@ async def get_topic(topic_id: str):
     if not forum:
         raise HTTPException(404, "Topic not found")
 
+    return await _build_topic_detail(forum)
+
+
+async def _build_topic_detail(forum) -> TopicDetail:
     posts = await forum.browse()
     return TopicDetail(
         topic_id=forum.topic_id,
@@ -159,6 +163,54 @@ async def get_topic(topic_id: str):
     )
 
 
+@app.get("/topics/{topic_id}/events")
+async def stream_topic_events(topic_id: str):
+    """
+    Structured SSE stream for UI clients.
+    Each `data:` frame is a full TopicDetail JSON snapshot, sent only when
+    posts, votes, round or status changed; `: ping` comments keep idle
+    connections alive. Ends with `data: [DONE]`.
+    """
+    forum = discussions.get(topic_id)
+    if not forum:
+        raise HTTPException(404, "Topic not found")
+
+    async def event_generator():
+        last_sig = None
+        idle_ticks = 0
+        while True:
+            detail = await _build_topic_detail(forum)
+            sig = (
+                detail.status,
+                detail.current_round,
+                len(detail.posts),
+                sum(p.upvotes + p.downvotes for p in detail.posts),
+                detail.conclusion,
+            )
+            if sig != last_sig:
+                last_sig = sig
+                idle_ticks = 0
+                yield f"data: {detail.model_dump_json()}\n\n"
+            else:
+                idle_ticks += 1
+                if idle_ticks % 15 == 0:
+                    yield ": ping\n\n"
+            if forum.status not in ("pending", "discussing"):
+                break
+            await asyncio.sleep(1)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @app.get("/topics/{topic_id}/stream")
 async def stream_topic(topic_id: str):
     """
@@ -1,8 +1,15 @@
 import os
 import json
-import copy
+import logging
+import time
+import string
+import functools
 import asyncio
-from typing import Annotated, TypedDict, Optional
+from typing import Annotated, Callable, TypedDict, Optional
+
+import httpx
+import orjson
+from cachetools import LRUCache, TTLCache
 
 # LangGraph related
 from langgraph.graph import StateGraph, START, END
@@ -17,9 +24,12 @@ from langchain_core.runnables import RunnableConfig
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.prebuilt import ToolNode
 
+# 热路径（每次工具调用 / 路由）日志走 logging，默认级别下 debug 日志几乎零开销
+logger = logging.getLogger(__name__)
+
 
 # --- Tools that need automatic username injection ---
-USER_INJECTED_TOOLS = {
+USER_INJECTED_TOOLS = frozenset({
     # File management tools
     "list_files", "read_file", "write_file", "append_file", "delete_file",
     # Command execution tools
@@ -32,14 +42,104 @@ USER_INJECTED_TOOLS = {
     # OASIS forum tools
     "post_to_oasis", "list_oasis_topics",
     "list_oasis_experts", "add_oasis_expert", "update_oasis_expert", "delete_oasis_expert",
+})
+
+
+def _inject_username(args: dict, state) -> None:
+    # Get user_id directly from state (injected by mainagent) instead of
+    # parsing thread_id, because user_id itself may contain the separator.
+    args["username"] = state.get("user_id") or "anonymous"
+
+
+def _inject_alarm_context(args: dict, state) -> None:
+    _inject_username(args, state)
+    # 给 add_alarm 额外注入 session_id，让闹钟记住设置时的会话
+    args["session_id"] = state.get("session_id") or "default"
+
+
+# 工具名 -> 参数注入函数（一次查表完成全部注入）；模块加载时构建一次
+TOOL_ARG_INJECTORS: dict[str, Callable[[dict, dict], None]] = {
+    **{name: _inject_username for name in USER_INJECTED_TOOLS},
+    "add_alarm": _inject_alarm_context,
 }
 
 
+# 被禁用工具的统一回复模板
+_BLOCKED_TOOL_TEMPLATE = (
+    "❌ 工具 '{}' 当前已被禁用。这通常是为了保护您的系统安全或优化当前会话资源。"
+    "如果您确实需要此功能，请在管理面板中将其开启。"
+    "同时，您可以告诉我您的最终目标，我会尝试用其他已启用的工具为您寻找替代方案。"
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _normalize_external_tool(tool_json: str) -> tuple[str, dict] | None:
+    """
+    将外部工具定义（规范化 JSON 串）转为 (工具名, OpenAI function 格式 dict)。
+    支持 OpenAI 标准格式: {"type":"function","function":{...}} 或简化格式 {"name":...,"parameters":...}
+    无名称的定义返回 None。同一定义只转换一次，返回的 dict 为共享对象，不应修改。
+    """
+    ext_tool = json.loads(tool_json)
+    if ext_tool.get("type") == "function":
+        func_def = ext_tool.get("function", {})
+    else:
+        func_def = ext_tool
+    if not func_def.get("name"):
+        return None
+    # 以 OpenAI function 格式传入 bind_tools（LangChain 支持 dict 格式）
+    return func_def["name"], {
+        "type": "function",
+        "function": {
+            "name": func_def["name"],
+            "description": func_def.get("description", ""),
+            "parameters": func_def.get("parameters", {"type": "object", "properties": {}}),
+        },
+    }
+
+
+def compile_prompt_template(template: str) -> Callable[..., str]:
+    """
+    将 str.format 风格的 prompt 模板预先拆分为 静态片段 + 字段名，
+    返回的渲染函数只做一次 join，不再每次重新解析模板。
+    含格式说明/转换符（如 {x!r}、{x:>10}）或属性/下标访问的模板退回 template.format。
+    """
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError:
+        return template.format
+    for _, field, spec, conversion in parsed:
+        if field is not None and (spec or conversion or not field.isidentifier()):
+            return template.format
+
+    literals = tuple(literal for literal, _, _, _ in parsed)
+    fields = tuple(field for _, field, _, _ in parsed)
+
+    def render(**kwargs) -> str:
+        parts = []
+        for literal, field in zip(literals, fields):
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(kwargs[field]))
+        return "".join(parts)
+
+    return render
+
+
+def freeze_enabled_tools(names) -> Optional[frozenset[str]]:
+    """
+    入口处把 enabled_tools 一次性转为 frozenset 放进 state，
+    各节点再调用 frozenset() 时直接返回同一对象（O(1)），不再每轮重建集合。
+    None 表示全部启用。
+    """
+    return frozenset(names) if names is not None else None
+
+
 # --- State definition ---
 class AgentState(TypedDict):
     messages: Annotated[list, add_messages]
     trigger_source: str
-    enabled_tools: Optional[list[str]]
+    # 启用的工具集合（None = 全部）；入口用 freeze_enabled_tools 生成，旧 checkpoint 中可能为 list
+    enabled_tools: Optional[frozenset[str]]
     user_id: Optional[str]
     session_id: Optional[str]
     # 外部调用方传入的 tools 定义（OpenAI function calling 格式）
@@ -47,6 +147,74 @@ class AgentState(TypedDict):
     external_tools: Optional[list[dict]]
 
 
+class LLMCircuitBreaker:
+    """
+    简单熔断器：上游 LLM 连续失败 fail_max 次后进入熔断状态，
+    reset_timeout 秒内的调用直接短路，不再把请求堆到不可用的上游。
+    熔断期满后进入半开状态，只放行一次试探调用（其余调用继续短路），
+    试探成功则恢复，失败则重新熔断。
+    只有"上游不可用"类的失败才应调用 record_failure（见 is_llm_unavailable）。
+    """
+    def __init__(self, fail_max: int = 5, reset_timeout: float = 30.0):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    def allow_request(self) -> bool:
+        """是否放行本次调用；半开状态下只有第一个调用方拿到试探名额"""
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.fail_max:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        """试探调用以不计入熔断的方式结束（请求错误、被取消）时交还名额，下一次调用继续试探"""
+        self._probing = False
+
+
+def is_llm_unavailable(exc: BaseException) -> bool:
+    """
+    判断 LLM 调用异常是否属于上游不可用：连接失败、超时、5xx、429。
+    请求本身的问题（400 参数错误、401 密钥失效、上下文超长等）重试也不会好，不计入熔断。
+    """
+    if isinstance(exc, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        # google api_core 的异常把 HTTP 状态放在 code 上
+        status = getattr(exc, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    # openai / anthropic 等 SDK 的连接、超时异常不带状态码
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class LLMUnavailableError(RuntimeError):
+    """熔断打开时 _call_model 直接抛出，由 mainagent 的流式 / 非流式错误路径把提示返回给客户端"""
+
+
+# 上游不可用类错误在计入熔断前先重试：最多 LLM_RETRY_ATTEMPTS 次，间隔 LLM_RETRY_BACKOFF * 2^n 秒
+LLM_RETRY_ATTEMPTS = 2
+LLM_RETRY_BACKOFF = 0.5
+
+
 class UserAwareToolNode:
     """
     Custom tool node:
@@ -58,10 +226,6 @@ class UserAwareToolNode:
         self._get_mcp_tools = get_mcp_tools_fn
 
     async def __call__(self, state, config: RunnableConfig):
-        # Get user_id directly from state (injected by mainagent) instead of
-        # parsing thread_id, because user_id itself may contain the separator.
-        user_id = state.get("user_id") or "anonymous"
-
         last_message = state["messages"][-1]
         if not hasattr(last_message, "tool_calls") or not last_message.tool_calls:
             return {"messages": []}
@@ -69,42 +233,40 @@ class UserAwareToolNode:
         # Get currently enabled tool set
         enabled_names = state.get("enabled_tools")
         if enabled_names is not None:
-            enabled_set = set(enabled_names)
+            enabled_set = frozenset(enabled_names)
         else:
             enabled_set = None  # None = all allowed
 
         # Separate blocked and allowed calls
-        modified_message = copy.deepcopy(last_message)
+        # 只浅拷贝需要改写的 tool_call / args 字典，原消息（checkpoint 中的对象）保持不变
         blocked_calls = []
         allowed_calls = []
-        for tc in modified_message.tool_calls:
-            if enabled_set is not None and tc["name"] not in enabled_set:
+        for tc in last_message.tool_calls:
+            name = tc["name"]
+            if enabled_set is not None and name not in enabled_set:
                 blocked_calls.append(tc)
-                print(f">>> [tools] 🚫 拦截禁用工具调用: {tc['name']}")
+                logger.debug(">>> [tools] 🚫 拦截禁用工具调用: %s", name)
             else:
-                if tc["name"] in USER_INJECTED_TOOLS:
-                    tc["args"]["username"] = user_id
-                # 给 add_alarm 额外注入 session_id，让闹钟记住设置时的会话
-                if tc["name"] == "add_alarm":
-                    tc["args"]["session_id"] = state.get("session_id") or "default"
+                injector = TOOL_ARG_INJECTORS.get(name)
+                if injector is not None:
+                    tc = {**tc, "args": dict(tc["args"])}
+                    injector(tc["args"], state)
                 allowed_calls.append(tc)
-                print(f">>> [tools] ✅ 调用工具: {tc['name']}")
-
-        result_messages = []
+                logger.debug(">>> [tools] ✅ 调用工具: %s", name)
 
         # For blocked tools, return error ToolMessages directly
-        for tc in blocked_calls:
-            result_messages.append(
-                ToolMessage(
-                    content=f"❌ 工具 '{tc['name']}' 当前已被禁用。这通常是为了保护您的系统安全或优化当前会话资源。如果您确实需要此功能，请在管理面板中将其开启。同时，您可以告诉我您的最终目标，我会尝试用其他已启用的工具为您寻找替代方案。",
-                    tool_call_id=tc["id"],
-                )
-            )
+        result_messages = [
+            ToolMessage(content=_BLOCKED_TOOL_TEMPLATE.format(tc["name"]), tool_call_id=tc["id"])
+            for tc in blocked_calls
+        ]
 
         # For allowed tools, execute normally via ToolNode
+        # （ToolNode 异步路径内部已用 asyncio.gather 并发执行同一条消息里的多个 tool_calls，
+        #   结果按 tool_calls 顺序返回，这里无需再自行拆分调度）
         if allowed_calls:
-            modified_message.tool_calls = allowed_calls
-            modified_state = {**state, "messages": state["messages"][:-1] + [modified_message]}
+            modified_message = last_message.model_copy(update={"tool_calls": allowed_calls})
+            # ToolNode 只读取最后一条消息的 tool_calls，无需复制整段历史
+            modified_state = {**state, "messages": [modified_message]}
             tool_result = await self.tool_node.ainvoke(modified_state, config)
             result_messages.extend(tool_result.get("messages", []))
 
@@ -132,14 +294,32 @@ class MiniTimeAgent:
         self._mcp_client: Optional[MultiServerMCPClient] = None
         self._memory = None
         self._memory_ctx = None
+        self._base_llm: Optional[BaseChatModel] = None
+        self._base_llm_env_key: Optional[tuple] = None
 
         # Per-user state
+        # 每用户缓存的容量上限（LRU 淘汰），在构造时读取（此时 .env 已加载）
+        user_cache_maxsize = int(os.getenv("AGENT_USER_CACHE_MAXSIZE", "10000"))
+        # _active_tasks 仅保存运行中的任务（任务结束时自动移除）；
+        # _user_last_tool_state 按 LRU + TTL 淘汰，避免长期运行时随 user_id 无限增长
         self._active_tasks: dict[str, asyncio.Task] = {}
         self._task_lock = asyncio.Lock()
-        self._user_last_tool_state: dict[str, frozenset[str]] = {}
+        self._user_last_tool_state: TTLCache[str, frozenset[str]] = TTLCache(maxsize=user_cache_maxsize, ttl=86400)
+        self._llm_breaker = LLMCircuitBreaker(fail_max=5, reset_timeout=30.0)
+        # (model, enabled_tools, external_tools) -> (bound llm, external tool names)
+        self._bound_llm_cache: LRUCache[tuple, tuple] = LRUCache(maxsize=64)
+        # enabled tools frozenset -> (tool_status 通知文本, 是否有禁用工具)
+        self._tool_status_prompt_cache: LRUCache[frozenset, tuple] = LRUCache(maxsize=64)
+
+        # 用户画像 / 技能清单缓存：path -> (mtime, 格式化后的字符串)
+        self._profile_cache: LRUCache[str, tuple] = LRUCache(maxsize=user_cache_maxsize)
+        self._skills_cache: LRUCache[str, tuple] = LRUCache(maxsize=user_cache_maxsize)
 
         # 启动时一次性加载 prompt 模板
         self._prompts = self._load_prompts()
+        # 带占位符的模板预编译为渲染函数，每轮只做字符串拼接
+        self._render_system_trigger = compile_prompt_template(self._prompts["system_trigger"])
+        self._render_tool_status = compile_prompt_template(self._prompts["tool_status"])
 
     # ------------------------------------------------------------------
     # Prompt loader (启动时读取一次)
@@ -171,31 +351,60 @@ class MiniTimeAgent:
 
         return loaded
 
-    def _get_user_profile(self, user_id: str) -> str:
-        """从 data/user_files/{user_id}/user_profile.txt 读取用户画像。"""
+    @staticmethod
+    async def _mtime_cached(cache: LRUCache, path: str, build: Callable[[], str]) -> str:
+        """
+        以文件 mtime 为版本号缓存 build() 的结果：文件未变化时直接返回缓存，
+        变化（或新建/删除）时重新构建。文件不存在时 mtime 记为 None。
+        命中时只有一次 stat；未命中时文件读取放到线程池执行，不阻塞事件循环。
+        缓存本身只在事件循环线程内读写。
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        hit = cache.get(path)
+        if hit is not None and hit[0] == mtime:
+            return hit[1]
+        value = await asyncio.to_thread(build)
+        cache[path] = (mtime, value)
+        return value
+
+    async def _get_user_profile(self, user_id: str) -> str:
+        """从 data/user_files/{user_id}/user_profile.txt 读取用户画像（按 mtime 缓存）。"""
         user_files_dir = self._prompts.get("_user_files_dir", "")
         fpath = os.path.join(user_files_dir, user_id, "user_profile.txt")
+        return await self._mtime_cached(self._profile_cache, fpath, lambda: self._read_user_profile(fpath))
+
+    @staticmethod
+    def _read_user_profile(fpath: str) -> str:
         try:
             with open(fpath, "r", encoding="utf-8") as f:
                 return f.read().strip()
         except FileNotFoundError:
             return ""
 
-    def _get_user_skills(self, user_id: str) -> str:
+    async def _get_user_skills(self, user_id: str) -> str:
         """
         从 data/user_files/{user_id}/skills_manifest.json 读取用户的 skill list，
-        并返回格式化的 skill 信息字符串。
+        并返回格式化的 skill 信息字符串（按 manifest mtime 缓存格式化结果）。
         即使没有 skill，也会返回位置信息。
         """
         user_files_dir = self._prompts.get("_user_files_dir", "")
         manifest_path = os.path.join(user_files_dir, user_id, "skills_manifest.json")
         skills_dir = os.path.join(user_files_dir, user_id, "skills")
+        return await self._mtime_cached(
+            self._skills_cache, manifest_path,
+            lambda: self._format_user_skills(manifest_path, skills_dir),
+        )
 
+    @staticmethod
+    def _format_user_skills(manifest_path: str, skills_dir: str) -> str:
         skills_manifest = []
         try:
-            with open(manifest_path, "r", encoding="utf-8") as f:
-                skills_manifest = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+            with open(manifest_path, "rb") as f:
+                skills_manifest = orjson.loads(f.read())
+        except (FileNotFoundError, orjson.JSONDecodeError):
             pass
 
         # 格式化 skill 信息（即使为空也返回位置信息）
@@ -235,11 +444,7 @@ class MiniTimeAgent:
     # ------------------------------------------------------------------
     async def startup(self):
         """Initialize MCP client, load tools, build LangGraph workflow."""
-        # 1. Open checkpoint DB
-        self._memory_ctx = AsyncSqliteSaver.from_conn_string(self._db_path)
-        self._memory = await self._memory_ctx.__aenter__()
-
-        # 2. Start MCP servers
+        # 1. Configure MCP servers
         self._mcp_client = MultiServerMCPClient({
             "scheduler_service": {
                 "command": "python",
@@ -273,13 +478,30 @@ class MiniTimeAgent:
             },
         })
 
-        # 3. Fetch tool definitions (new API: no context manager needed)
-        self._mcp_tools = await self._mcp_client.get_tools()
+        # 2. Fetch tool definitions (new API: no context manager needed) while opening the
+        #    checkpoint DB — get_tools() launches all MCP servers concurrently, and the DB
+        #    open/PRAGMA setup is independent of it, so the two overlap
+        self._mcp_tools, _ = await asyncio.gather(
+            self._mcp_client.get_tools(),
+            self._open_checkpoint_db(),
+        )
+
+        # 3. Build the chat model once before the graph can run (reused across turns/users)
+        self._get_model()
 
         # 4. Build LangGraph workflow
         # 收集所有内部 MCP 工具名称，用于条件路由
         self._internal_tool_names = frozenset(t.name for t in self._mcp_tools)
 
+        # 工具集启动后不再变化：一次性生成排序后的工具名和固定的 system prompt 前缀，
+        # 保证每轮前缀逐字节一致（KV-Cache 友好），也省去每轮排序/拼接
+        self._all_tool_names = tuple(sorted(self._internal_tool_names))
+        self._base_prompt_prefix = (
+            self._prompts["base_system"] + "\n\n"
+            f"【默认可用工具列表】\n{', '.join(self._all_tool_names)}\n"
+            "以上工具默认全部启用。如果后续有工具状态变更，系统会另行通知。\n"
+        )
+
         workflow = StateGraph(AgentState)
         workflow.add_node("chatbot", self._call_model)
         workflow.add_node("tools", UserAwareToolNode(self._mcp_tools, lambda: self._mcp_tools))
@@ -290,8 +512,39 @@ class MiniTimeAgent:
         self._agent_app = workflow.compile(checkpointer=self._memory)
         print("--- Agent 服务已启动，外部定时/用户输入双兼容就绪 ---")
 
+    async def _open_checkpoint_db(self):
+        """Open the SQLite checkpoint DB and apply PRAGMA tuning."""
+        # （langgraph-checkpoint>=2.0 的默认 serde 以 msgpack 编码 checkpoint，无需自定义）
+        self._memory_ctx = AsyncSqliteSaver.from_conn_string(self._db_path)
+        self._memory = await self._memory_ctx.__aenter__()
+        await self._tune_checkpoint_db(self._memory.conn)
+
+    @staticmethod
+    async def _tune_checkpoint_db(conn):
+        """
+        调整 checkpoint DB 的 SQLite 参数：WAL + synchronous=NORMAL 让每次
+        checkpoint 写入不再触发完整 fsync，其余参数扩大页缓存/内存映射。
+        """
+        for pragma in (
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA temp_store=MEMORY",
+            "PRAGMA mmap_size=268435456",
+            "PRAGMA cache_size=-64000",
+        ):
+            await conn.execute(pragma)
+        await conn.commit()
+
+        async with conn.execute("PRAGMA journal_mode") as cursor:
+            row = await cursor.fetchone()
+        mode = row[0] if row else "unknown"
+        if mode != "wal":
+            print(f"[checkpoint] ⚠️ journal_mode={mode}，WAL 未生效")
+
     async def shutdown(self):
-        """Clean up MCP client and checkpoint DB."""
+        """Clean up MCP client, shared HTTP client and checkpoint DB."""
+        from llm_factory import aclose_shared_http_async_client
+        await aclose_shared_http_async_client()
         if self._memory_ctx:
             try:
                 await self._memory_ctx.__aexit__(None, None, None)
@@ -303,10 +556,77 @@ class MiniTimeAgent:
     # ------------------------------------------------------------------
     # 模型名 -> 厂商 映射已移至 src/llm_factory.py（全局共享）
 
-    @staticmethod
-    def _get_model() -> BaseChatModel:
-        from llm_factory import create_chat_model
-        return create_chat_model()
+    # 影响模型实例构造的环境变量；任一变化才重建客户端
+    _MODEL_ENV_KEYS = ("LLM_PROVIDER", "LLM_MODEL", "LLM_BASE_URL", "LLM_API_KEY")
+
+    def _get_model(self) -> BaseChatModel:
+        """返回缓存的 ChatModel，复用其底层 HTTP 连接池；仅在模型相关环境变量变化时重建。"""
+        env_key = tuple(os.getenv(k) for k in self._MODEL_ENV_KEYS)
+        if self._base_llm is None or env_key != self._base_llm_env_key:
+            from llm_factory import create_chat_model, get_shared_http_async_client
+            self._base_llm = create_chat_model(http_async_client=get_shared_http_async_client())
+            self._base_llm_env_key = env_key
+        return self._base_llm
+
+    def _get_bound_llm(self, enabled_names, external_tools_defs: list[dict]):
+        """
+        返回绑定了当前工具集的模型及外部工具名集合。
+        按 (enabled_tools, external_tools) 签名做 LRU 缓存，工具集不变时直接复用，
+        避免每轮重新过滤工具、转换外部工具定义并在 bind_tools 中重新序列化 schema。
+        """
+        base_model = self._get_model()
+        # 每个外部工具定义的规范化 JSON 串既作缓存 key，也是转换函数的 lru_cache 参数
+        ext_tool_keys = tuple(
+            json.dumps(t, sort_keys=True, ensure_ascii=False) for t in external_tools_defs
+        )
+        cache_key = (
+            id(base_model),
+            frozenset(enabled_names) if enabled_names is not None else None,
+            ext_tool_keys,
+        )
+        cached = self._bound_llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        all_tools = self._mcp_tools
+        if enabled_names is not None:
+            filtered_tools = [t for t in all_tools if t.name in cache_key[1]]
+        else:
+            filtered_tools = all_tools
+
+        # 将外部工具定义（OpenAI function format）转为 LangChain 可绑定的格式
+        bind_tools_list: list = list(filtered_tools)
+        external_tool_names: set[str] = set()
+        for normalized in map(_normalize_external_tool, ext_tool_keys):
+            if normalized is not None:
+                name, tool_def = normalized
+                external_tool_names.add(name)
+                bind_tools_list.append(tool_def)
+
+        llm = base_model.bind_tools(bind_tools_list) if bind_tools_list else base_model
+        result = (llm, frozenset(external_tool_names))
+        self._bound_llm_cache[cache_key] = result
+        return result
+
+    def _get_tool_status_prompt(self, current_enabled: frozenset[str]) -> tuple[str, bool]:
+        """
+        返回 (工具状态通知文本, 是否存在被禁用的工具)。
+        同一启用集合格式化结果完全相同，按 frozenset 做 LRU 缓存，省去每次排序拼接。
+        """
+        cached = self._tool_status_prompt_cache.get(current_enabled)
+        if cached is not None:
+            return cached
+
+        all_names_set = self._internal_tool_names
+        enabled_names_set = current_enabled & all_names_set
+        disabled_names_set = all_names_set - current_enabled
+        status_text = self._render_tool_status(
+            enabled_tools=', '.join(sorted(enabled_names_set)) if enabled_names_set else '无',
+            disabled_tools=', '.join(sorted(disabled_names_set)) if disabled_names_set else '无',
+        )
+        result = (status_text, bool(disabled_names_set))
+        self._tool_status_prompt_cache[current_enabled] = result
+        return result
 
     # ------------------------------------------------------------------
     # Conditional edge: route internal tools vs external tools vs end
@@ -325,7 +645,7 @@ class MiniTimeAgent:
         for tc in last_msg.tool_calls:
             if tc["name"] not in self._internal_tool_names:
                 # 发现外部工具调用，中断循环让调用方处理
-                print(f">>> [route] 🔀 外部工具调用检测: {tc['name']}，中断返回给调用方")
+                logger.debug(">>> [route] 🔀 外部工具调用检测: %s，中断返回给调用方", tc["name"])
                 return END
         return "tools"
 
@@ -336,126 +656,119 @@ class MiniTimeAgent:
         """LangGraph node: invoke LLM with dynamic tool binding & tool-state notification."""
 
         # Dynamic tool binding based on enabled_tools + external_tools
-        all_tools = self._mcp_tools
         enabled_names = state.get("enabled_tools")
-        if enabled_names is not None:
-            filtered_tools = [t for t in all_tools if t.name in enabled_names]
-        else:
-            filtered_tools = all_tools
-
-        # 将外部工具定义（OpenAI function format）转为 LangChain 可绑定的格式
         external_tools_defs = state.get("external_tools") or []
-        bind_tools_list: list = list(filtered_tools)
-        external_tool_names: set[str] = set()
-        for ext_tool in external_tools_defs:
-            # 支持 OpenAI 标准格式: {"type":"function","function":{...}} 或简化格式 {"name":...,"parameters":...}
-            if ext_tool.get("type") == "function":
-                func_def = ext_tool.get("function", {})
-            else:
-                func_def = ext_tool
-            if func_def.get("name"):
-                external_tool_names.add(func_def["name"])
-                # 以 OpenAI function 格式传入 bind_tools（LangChain 支持 dict 格式）
-                bind_tools_list.append({
-                    "type": "function",
-                    "function": {
-                        "name": func_def["name"],
-                        "description": func_def.get("description", ""),
-                        "parameters": func_def.get("parameters", {"type": "object", "properties": {}}),
-                    },
-                })
-
-        base_model = self._get_model()
-        llm = base_model.bind_tools(bind_tools_list) if bind_tools_list else base_model
+        llm, external_tool_names = self._get_bound_llm(enabled_names, external_tools_defs)
 
         # --- KV-Cache-friendly tool state management ---
-        all_names = sorted(t.name for t in all_tools)
-        all_tool_list_str = ", ".join(all_names)
-
-        base_prompt = (
-            self._prompts["base_system"] + "\n\n"
-            f"【默认可用工具列表】\n{all_tool_list_str}\n"
-            "以上工具默认全部启用。如果后续有工具状态变更，系统会另行通知。\n"
-        )
+        base_prompt = self._base_prompt_prefix
 
         # Detect tool state change
-        current_enabled = frozenset(enabled_names) if enabled_names is not None else frozenset(all_names)
+        current_enabled = frozenset(enabled_names) if enabled_names is not None else self._internal_tool_names
         user_id = state.get("user_id", "__global__")
 
+        # 用户画像与技能列表互不依赖，并发读取（缓存未命中时两次文件读取重叠进行）
+        user_profile, user_skills = await asyncio.gather(
+            self._get_user_profile(user_id),
+            self._get_user_skills(user_id),
+        )
+
         # 注入用户专属画像
-        user_profile = self._get_user_profile(user_id)
         if user_profile:
             base_prompt += f"\n{user_profile}\n"
 
         # 注入用户技能列表（总是显示位置信息）
-        base_prompt += self._get_user_skills(user_id) + "\n"
+        base_prompt += user_skills + "\n"
 
         last_state = self._user_last_tool_state.get(user_id)
 
+        # 先比较状态，只有需要通知时才计算差集并格式化（结果按启用集合缓存）
         tool_status_prompt = ""
-        if last_state is not None and current_enabled != last_state:
-            all_names_set = set(all_names)
-            enabled_set = set(current_enabled)
-            disabled_names_set = all_names_set - enabled_set
-            tool_status_prompt = self._prompts["tool_status"].format(
-                enabled_tools=', '.join(sorted(enabled_set & all_names_set)) if (enabled_set & all_names_set) else '无',
-                disabled_tools=', '.join(sorted(disabled_names_set)) if disabled_names_set else '无',
-            )
-        elif last_state is None and enabled_names is not None:
-            all_names_set = set(all_names)
-            enabled_set = set(current_enabled)
-            disabled_names_set = all_names_set - enabled_set
-            if disabled_names_set:
-                tool_status_prompt = self._prompts["tool_status"].format(
-                    enabled_tools=', '.join(sorted(enabled_set & all_names_set)) if (enabled_set & all_names_set) else '无',
-                    disabled_tools=', '.join(sorted(disabled_names_set)),
-                )
+        if last_state is not None:
+            if current_enabled != last_state:
+                tool_status_prompt, _ = self._get_tool_status_prompt(current_enabled)
+        elif enabled_names is not None:
+            status_text, has_disabled = self._get_tool_status_prompt(current_enabled)
+            if has_disabled:
+                tool_status_prompt = status_text
 
         # Update cache
         self._user_last_tool_state[user_id] = current_enabled
 
-        history_messages = list(state["messages"])
-
         # 每次进入前清理：移除末尾不完整的 tool_calls（有 AIMessage 带 tool_calls 但缺少 ToolMessage 回复）
         # 但保留外部工具的未回复 tool_calls（它们正等待调用方回传结果）
-        history_messages = self._sanitize_messages(history_messages, external_tool_names)
-
-        # 清理历史消息中的多模态内容（file/image/audio parts），只保留文本
-        # 避免旧的二进制附件在后续轮次反复发送给 LLM 导致上游 API 报错
-        # 注意：保留最后一条 HumanMessage 的多模态内容（当前轮用户输入）
-        if len(history_messages) > 1:
-            history_messages = self._strip_multimodal_parts(history_messages[:-1]) + [history_messages[-1]]
-
-        # 如果是系统触发，且最后一条不是 ToolMessage（非工具回调轮），给它加上系统触发说明
-        is_system = state.get("trigger_source") == "system"
-        if is_system and history_messages and isinstance(history_messages[-1], HumanMessage):
-            original_text = history_messages[-1].content
-            system_trigger_prompt = self._prompts["system_trigger"].format(
-                original_text=original_text
+        history_messages = self._sanitize_messages(state["messages"], external_tool_names)
+
+        # 一次性组装输入：历史部分清理多模态内容（file/image/audio parts），只保留文本，
+        # 避免旧的二进制附件在后续轮次反复发送给 LLM 导致上游 API 报错；
+        # 最后一条（当前轮输入）保留多模态内容，并在同一步完成系统触发改写和工具状态通知注入
+        # （history_messages 只在这里被复制一次，之后全部就地改写）
+        input_messages = [SystemMessage(content=base_prompt), *history_messages]
+        if history_messages:
+            self._strip_multimodal_parts(input_messages, 1, len(input_messages) - 1)
+            input_messages[-1] = self._prepare_current_message(
+                history_messages[-1],
+                is_system=state.get("trigger_source") == "system",
+                tool_status_prompt=tool_status_prompt,
             )
-            history_messages = history_messages[:-1] + [HumanMessage(content=system_trigger_prompt)]
 
-        # 正常对话流程（用户和系统触发共用）
-        if tool_status_prompt and len(history_messages) >= 1:
-            last_msg = history_messages[-1]
-            # 如果最后一条是多模态 content（list），将通知插入为第一个 text part
-            if isinstance(last_msg.content, list):
+        if not self._llm_breaker.allow_request():
+            logger.warning(">>> [llm] ⛔ 上游连续失败，熔断中，直接返回提示")
+            # 不写占位 AIMessage：它既不会产生 chat model 流事件，又会污染 checkpoint
+            raise LLMUnavailableError("LLM 服务暂时不可用，请稍后再试。")
+        try:
+            response = await self._invoke_with_retry(llm, input_messages)
+        except asyncio.CancelledError:
+            self._llm_breaker.release_probe()
+            raise
+        except Exception as e:
+            if is_llm_unavailable(e):
+                self._llm_breaker.record_failure()
+            else:
+                self._llm_breaker.release_probe()
+            raise
+        self._llm_breaker.record_success()
+        return {"messages": [response]}
+
+    @staticmethod
+    async def _invoke_with_retry(llm, input_messages: list):
+        """上游不可用类错误（见 is_llm_unavailable）按指数退避重试，重试用尽仍失败才抛给熔断器计数"""
+        for attempt in range(LLM_RETRY_ATTEMPTS + 1):
+            try:
+                # 不改用 astream：在 astream_events / stream_mode="messages" 下 LangChain 本就以流式执行
+                # ainvoke 并逐 token 推送；非流式路径（/ask、ainvoke）则保持一次性调用
+                return await llm.ainvoke(input_messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == LLM_RETRY_ATTEMPTS or not is_llm_unavailable(e):
+                    raise
+                delay = LLM_RETRY_BACKOFF * 2 ** attempt
+                logger.warning(">>> [llm] 上游不可用（%s），%.1f 秒后第 %d 次重试", e, delay, attempt + 1)
+                await asyncio.sleep(delay)
+
+    def _prepare_current_message(self, last_msg, *, is_system: bool, tool_status_prompt: str):
+        """
+        处理当前轮的最后一条消息：
+        - 系统触发且为 HumanMessage（非工具回调轮）时，套用系统触发说明模板
+        - 有工具状态变更时，把通知前置到消息内容（多模态 content 则插入为第一个 text part）
+        两者都不需要时原样返回，不新建消息。
+        """
+        content = last_msg.content
+        rewritten = False
+        if is_system and isinstance(last_msg, HumanMessage):
+            content = self._render_system_trigger(original_text=content)
+            rewritten = True
+
+        if tool_status_prompt:
+            if isinstance(content, list):
                 notification = {"type": "text", "text": f"[系统通知] {tool_status_prompt}\n\n---\n"}
-                augmented_content = [notification] + list(last_msg.content)
-                augmented_msg = HumanMessage(content=augmented_content)
+                content = [notification] + list(content)
             else:
-                augmented_content = f"[系统通知] {tool_status_prompt}\n\n---\n{last_msg.content}"
-                augmented_msg = HumanMessage(content=augmented_content)
-            input_messages = (
-                [SystemMessage(content=base_prompt)]
-                + history_messages[:-1]
-                + [augmented_msg]
-            )
-        else:
-            input_messages = [SystemMessage(content=base_prompt)] + history_messages
+                content = f"[系统通知] {tool_status_prompt}\n\n---\n{content}"
+            rewritten = True
 
-        response = await llm.ainvoke(input_messages)
-        return {"messages": [response]}
+        return HumanMessage(content=content) if rewritten else last_msg
 
     # ------------------------------------------------------------------
     # Public interface: tools info
@@ -468,51 +781,52 @@ class MiniTimeAgent:
 
         但如果 external_tool_names 非空，则保留末尾 AIMessage 中属于外部工具的
         未回复 tool_calls（它们正等待调用方回传结果）。
+
+        只检查尾部：末尾不是带 tool_calls 的 AI 消息（最常见情况）时不做任何扫描，
+        原样返回输入列表。
         """
         if not external_tool_names:
             external_tool_names = set()
 
-        # 收集所有已存在的 tool_call_id 回复
-        answered_ids = set()
-        for msg in messages:
-            if isinstance(msg, ToolMessage) and hasattr(msg, "tool_call_id"):
-                answered_ids.add(msg.tool_call_id)
-
         # 从后往前找到第一个"完整"的位置
-        clean = list(messages)
-        while clean:
-            last = clean[-1]
+        end = len(messages)
+        while end:
+            last = messages[end - 1]
             # 如果最后一条是带 tool_calls 的 AI 消息，检查是否全部有回复
-            if isinstance(last, AIMessage) and hasattr(last, "tool_calls") and last.tool_calls:
-                pending_ids = {tc["id"] for tc in last.tool_calls}
-                if not pending_ids.issubset(answered_ids):
-                    # 检查未回复的 tool_calls 是否全部属于外部工具
-                    unanswered_calls = [
-                        tc for tc in last.tool_calls if tc["id"] not in answered_ids
-                    ]
-                    all_external = all(
-                        tc["name"] in external_tool_names for tc in unanswered_calls
-                    )
-                    if all_external and external_tool_names:
-                        # 外部工具等待回传，保留此消息
-                        break
-                    # 内部工具未完成 → 截断
-                    clean.pop()
-                    continue
-            break
-        return clean
+            if not (isinstance(last, AIMessage) and getattr(last, "tool_calls", None)):
+                break
+            pending_ids = {tc["id"] for tc in last.tool_calls}
+            # 位于其后的只可能是已被截掉的 AI 消息，回复只会出现在前面
+            answered_ids = {
+                msg.tool_call_id for msg in messages[:end - 1]
+                if isinstance(msg, ToolMessage) and msg.tool_call_id in pending_ids
+            }
+            if pending_ids <= answered_ids:
+                break
+            # 检查未回复的 tool_calls 是否全部属于外部工具
+            all_external = all(
+                tc["name"] in external_tool_names
+                for tc in last.tool_calls if tc["id"] not in answered_ids
+            )
+            if all_external and external_tool_names:
+                # 外部工具等待回传，保留此消息
+                break
+            # 内部工具未完成 → 截断
+            end -= 1
+        return messages if end == len(messages) else messages[:end]
 
     @staticmethod
-    def _strip_multimodal_parts(messages: list) -> list:
+    def _strip_multimodal_parts(messages: list, start: int = 0, stop: int | None = None) -> None:
         """
-        将所有 HumanMessage 中的多模态 content（list 格式）转为纯文本。
+        就地将 messages[start:stop] 中 HumanMessage 的多模态 content（list 格式）转为纯文本。
         - type:"text" 的 part 保留文本
         - type:"file" 替换为 "[用户上传了文件: {filename}]"
         - type:"image_url" 替换为 "[用户上传了图片]"
         - 其他未知 type 丢弃
+        只替换需要改写的元素，不复制列表；纯文本会话仅做一遍类型检查。
         """
-        result = []
-        for msg in messages:
+        for i in range(start, len(messages) if stop is None else stop):
+            msg = messages[i]
             if isinstance(msg, HumanMessage) and isinstance(msg.content, list):
                 text_parts = []
                 for part in msg.content:
@@ -528,10 +842,7 @@ class MiniTimeAgent:
                     elif ptype == "image_url":
                         text_parts.append("[用户上传了图片]")
                 combined = "\n".join(t for t in text_parts if t)
-                result.append(HumanMessage(content=combined or "(空消息)"))
-            else:
-                result.append(msg)
-        return result
+                messages[i] = HumanMessage(content=combined or "(空消息)")
 
     def get_tools_info(self) -> list[dict]:
         """Return serializable tool metadata list."""
@@ -553,9 +864,16 @@ class MiniTimeAgent:
             self._active_tasks.pop(user_id, None)
 
     def register_task(self, user_id: str, task: asyncio.Task):
-        """Register an active streaming task for a user."""
+        """Register an active streaming task for a user (auto-removed when done)."""
         self._active_tasks[user_id] = task
 
+        def _on_done(t: asyncio.Task, user_id=user_id):
+            # 仅当登记的仍是该任务时才移除，避免误删同一 key 下新注册的任务
+            if self._active_tasks.get(user_id) is t:
+                del self._active_tasks[user_id]
+
+        task.add_done_callback(_on_done)
+
     def unregister_task(self, user_id: str):
         """Remove a finished task from the registry."""
         self._active_tasks.pop(user_id, None)
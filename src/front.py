@@ -1,6 +1,27 @@
-from flask import Flask, render_template_string, request, jsonify, session, Response
+# 直接运行时用 gevent 协程服务器：须在 requests/threading 导入前打补丁，
+# 上游阻塞 IO 才会让出，慢请求不再占死工作线程（未安装 gevent 时回退 Flask 内置服务器）
+if __name__ == "__main__":
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        monkey = None
+
+from flask import Flask, request, jsonify, session, Response, redirect, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 import requests
+import urllib3
 import os
+import gzip
+import hashlib
+import logging
+import re
+import socket
+import threading
+import time
+import unicodedata
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 # 加载 .env 配置
@@ -8,8 +29,21 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 root_dir = os.path.dirname(current_dir)
 load_dotenv(dotenv_path=os.path.join(root_dir, "config", ".env"))
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """用 orjson 替换 Flask 默认的 json 编解码（jsonify / request.get_json 都走这里）"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.json = OrjsonProvider(app)
+# 多进程部署（gunicorn 多 worker）需共用同一个 key，见 config/gunicorn.conf.py
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB for image uploads
 
 # --- 配置区 ---
@@ -18,6 +52,7 @@ LOCAL_AGENT_URL = f"http://127.0.0.1:{PORT_AGENT}/ask"
 LOCAL_AGENT_STREAM_URL = f"http://127.0.0.1:{PORT_AGENT}/ask_stream"
 LOCAL_AGENT_CANCEL_URL = f"http://127.0.0.1:{PORT_AGENT}/cancel"
 LOCAL_LOGIN_URL = f"http://127.0.0.1:{PORT_AGENT}/login"
+LOCAL_LOGOUT_URL = f"http://127.0.0.1:{PORT_AGENT}/logout"
 LOCAL_TOOLS_URL = f"http://127.0.0.1:{PORT_AGENT}/tools"
 LOCAL_SESSIONS_URL = f"http://127.0.0.1:{PORT_AGENT}/sessions"
 LOCAL_SESSION_HISTORY_URL = f"http://127.0.0.1:{PORT_AGENT}/session_history"
@@ -25,2529 +60,582 @@ LOCAL_DELETE_SESSION_URL = f"http://127.0.0.1:{PORT_AGENT}/delete_session"
 LOCAL_TTS_URL = f"http://127.0.0.1:{PORT_AGENT}/tts"
 # OpenAI 兼容端点
 LOCAL_OPENAI_COMPLETIONS_URL = f"http://127.0.0.1:{PORT_AGENT}/v1/chat/completions"
+LOCAL_OPENAI_COMPLETIONS_MSGPACK_URL = f"http://127.0.0.1:{PORT_AGENT}/v1/chat/completions/msgpack"
+LOCAL_OPENAI_MODELS_URL = f"http://127.0.0.1:{PORT_AGENT}/v1/models"
 INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN", "")
 
 # OASIS Forum proxy
 PORT_OASIS = int(os.getenv("PORT_OASIS", "51202"))
 OASIS_BASE_URL = f"http://127.0.0.1:{PORT_OASIS}"
+OASIS_TOPICS_URL = f"{OASIS_BASE_URL}/topics"
+OASIS_EXPERTS_URL = f"{OASIS_BASE_URL}/experts"
+
+
+class _RateLimitFilter(logging.Filter):
+    """同一条日志模板在 interval 秒内只放行一次：上游宕机时每次轮询都失败，避免刷屏"""
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._last: dict[tuple, float] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+        if now - self._last.get(key, -self.interval) < self.interval:
+            return False
+        self._last[key] = now
+        return True
+
+
+# OASIS 代理日志：%-格式惰性求值，级别未开启时不拼字符串、不写 stdout；
+# 默认只输出 WARNING 以上，排查时设 OASIS_PROXY_LOG_LEVEL=DEBUG
+oasis_log = logging.getLogger("oasis_proxy")
+oasis_log.setLevel(os.getenv("OASIS_PROXY_LOG_LEVEL", "WARNING").upper())
+oasis_log.addFilter(_RateLimitFilter(float(os.getenv("OASIS_PROXY_LOG_INTERVAL", "10"))))
+# 自带输出：root 上没有 handler 时 logging 只兜底打印 WARNING 以上，DEBUG 会被静默丢弃
+_oasis_log_handler = logging.StreamHandler()
+_oasis_log_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+oasis_log.addHandler(_oasis_log_handler)
+oasis_log.propagate = False
+
+# --- 上游 HTTP 连接池 ---
+# 模块级 Session：urllib3 连接池复用到本机 Agent / OASIS 的 keep-alive 连接，
+# 避免每次请求重新建立 TCP 连接
+class _LoopbackAdapter(requests.adapters.HTTPAdapter):
+    """在 urllib3 默认的 socket 选项（已含 TCP_NODELAY）之外加上 SO_KEEPALIVE：空闲连接由内核探活"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = urllib3.connection.HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+class _UnixHTTPConnection(urllib3.connection.HTTPConnection):
+    """URL 里的 host/port 只用于 Host 头，实际连接 Unix domain socket"""
+
+    uds_path = ""
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.uds_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+
+class _UnixHTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    ConnectionCls = _UnixHTTPConnection
+
+    def __init__(self, uds_path: str, **kwargs):
+        super().__init__("localhost", **kwargs)
+        self.uds_path = uds_path
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.uds_path = self.uds_path
+        return conn
+
+
+class _UnixAdapter(requests.adapters.HTTPAdapter):
+    """把挂载前缀下的所有请求转到同一个 UDS 连接池；max_retries 由 HTTPAdapter.send 传给该连接池"""
+
+    def __init__(self, uds_path: str, pool_maxsize: int, max_retries):
+        super().__init__(max_retries=max_retries)
+        self._uds_pool = _UnixHTTPConnectionPool(uds_path, maxsize=pool_maxsize)
+
+    def get_connection(self, url, proxies=None):
+        return self._uds_pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._uds_pool
+
+    def close(self):
+        self._uds_pool.close()
+        super().close()
+
+
+UPSTREAM = requests.Session()
+# 上游重启的瞬间（连接被拒 / 502-504）短暂重试：urllib3 只对幂等方法（GET 等）按状态码和读错误重试，
+# 聊天、登录等 POST 只在连接根本没建立时重试，不会重复执行
+_UPSTREAM_RETRY = urllib3.util.Retry(
+    total=2,
+    backoff_factor=0.1,
+    status_forcelist=(502, 503, 504),
+    raise_on_status=False,
+)
+# pool_maxsize 与 UPSTREAM_MAX_INFLIGHT 默认值一致，满并发的长连接流式请求也不会溢出连接池；
+# TCP 与 UDS 两个 adapter 共用同一连接数和重试策略
+_UPSTREAM_POOL_MAXSIZE = 64
+UPSTREAM.mount(
+    "http://",
+    _LoopbackAdapter(pool_connections=4, pool_maxsize=_UPSTREAM_POOL_MAXSIZE, max_retries=_UPSTREAM_RETRY),
+)
+UPSTREAM.headers["Connection"] = "keep-alive"
+# Agent 以 AGENT_UDS 启动时（见 mainagent.py），到 Agent 的请求改走 Unix domain socket，
+# 绕过本机 TCP/IP 栈且不占用临时端口；OASIS 等其他上游仍走 TCP
+AGENT_UDS = os.getenv("AGENT_UDS", "").strip()
+if AGENT_UDS:
+    UPSTREAM.mount(f"http://127.0.0.1:{PORT_AGENT}/", _UnixAdapter(AGENT_UDS, _UPSTREAM_POOL_MAXSIZE, _UPSTREAM_RETRY))
+# OASIS 长连接流（/stream、/events）用不重试的独立 Session：这两个 GET 的读超时长达数十秒，
+# 按 _UPSTREAM_RETRY 重试会让一个卡住的上游占住协程和连接约 3 倍超时时长；断开后由前端回退轮询
+UPSTREAM_STREAM = requests.Session()
+UPSTREAM_STREAM.mount(
+    "http://",
+    _LoopbackAdapter(pool_connections=4, pool_maxsize=_UPSTREAM_POOL_MAXSIZE, max_retries=0),
+)
+UPSTREAM_STREAM.headers["Connection"] = "keep-alive"
+# --- proxy_ask 精确匹配响应缓存（默认关闭）---
+# Agent 有会话记忆和工具副作用（闹钟、文件等），相同文本并不保证相同回复，
+# 因此仅在显式配置 PROXY_ASK_CACHE_TTL(秒) > 0 时启用；请求带 ?nocache=1 可绕过
+PROXY_ASK_CACHE_TTL = int(os.getenv("PROXY_ASK_CACHE_TTL", "0"))
+_ask_cache: TTLCache = TTLCache(maxsize=2048, ttl=max(PROXY_ASK_CACHE_TTL, 1))
+_ask_cache_lock = threading.Lock()
+
+
+_PROMPT_TRAILING_PUNCT = " \t\r\n.,!?~。，！？～…"
+
+
+def _normalize_prompt(text: str) -> str:
+    """
+    将表述上等价的提问归一化为同一 key：NFKC 全半角统一、大小写折叠、
+    空白折叠、去掉末尾标点（"你好！" / "你好" / " 你好 ? " 命中同一条缓存）。
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(text.split()).rstrip(_PROMPT_TRAILING_PUNCT)
+
+
+def _ask_cache_key(user_id: str, text: str) -> bytes:
+    key_text = _normalize_prompt(text)
+    return hashlib.blake2b(f"{user_id}\x00{key_text}".encode("utf-8"), digest_size=16).digest()
+
+
+# 同 key 的在途请求：key -> 完成事件。突发的重复请求（如连点发送）只打一次上游，
+# 其余请求等待首个请求写入缓存后直接取结果。
+# 合并依赖上面的响应缓存，只在 PROXY_ASK_CACHE_TTL > 0 时生效；默认部署中不合并，
+# 也不是跨用户的批量上游调用（Agent 没有批量接口）
+_ask_inflight: dict[bytes, threading.Event] = {}
+
+
+def _ask_cache_acquire(key: bytes) -> tuple[bytes | None, threading.Event | None]:
+    """
+    返回 (缓存 body, None)：命中缓存或等到了在途请求的结果；
+    返回 (None, event)：当前请求是该 key 的首个请求，需调用上游并在结束后 release；
+    返回 (None, None)：等待的请求失败，当前请求自行调用上游（不再合并）。
+    """
+    with _ask_cache_lock:
+        body = _ask_cache.get(key)
+        if body is not None:
+            return body, None
+        event = _ask_inflight.get(key)
+        if event is None:
+            event = _ask_inflight[key] = threading.Event()
+            return None, event
+    event.wait(timeout=UPSTREAM_CHAT_TIMEOUT[1])
+    with _ask_cache_lock:
+        return _ask_cache.get(key), None
+
+
+def _ask_cache_release(key: bytes, event: threading.Event):
+    with _ask_cache_lock:
+        _ask_inflight.pop(key, None)
+    event.set()
+
+
+# (连接超时, 读取超时)：本机 Agent 未启动时几秒内失败，不让工作线程白等满读取超时
+UPSTREAM_CHAT_TIMEOUT = (5, 120)
+
+# --- 服务端 Markdown 渲染（可选依赖 markdown-it-py + Pygments）---
+# proxy_ask 返回完整回复时顺带给出 response_html，客户端可直接 innerHTML，
+# 结果随响应一起进入 proxy_ask 缓存；未安装时不返回该字段
+try:
+    from markdown_it import MarkdownIt
+    from pygments import highlight as _pygments_highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+
+    _code_formatter = HtmlFormatter(nowrap=True, noclasses=True, style="github-dark")
+
+    def _highlight_code(code: str, lang: str, attrs) -> str:
+        try:
+            lexer = get_lexer_by_name(lang) if lang else None
+        except ClassNotFound:
+            lexer = None
+        if lexer is None:
+            return ""  # 空串 → markdown-it 按普通转义输出
+        return _pygments_highlight(code, lexer, _code_formatter)
+
+    # 与前端 marked 行为对齐：GFM 表格/删除线；不放行原始 HTML
+    _markdown = MarkdownIt("commonmark", {"html": False, "highlight": _highlight_code}).enable(["table", "strikethrough"])
+except ImportError:
+    _markdown = None
+
+
+def _render_markdown(text: str) -> str | None:
+    if _markdown is None or not text:
+        return None
+    return _markdown.render(text)
+
+
+# --- 上游对话并发上限 + 每用户限流 ---
+# 每个对话请求最长占用上游 120 秒：全局最多 UPSTREAM_MAX_INFLIGHT 个并发，
+# 排队超过 UPSTREAM_QUEUE_TIMEOUT 秒直接 429，避免突发流量把 Agent 和连接池拖垮；
+# 每用户令牌桶 PROXY_USER_RATE_PER_MIN 次/分钟：默认 0 = 关闭（与 PROXY_ASK_CACHE_TTL 一样需显式开启），
+# 避免给已有的 /v1/chat/completions API 调用方和批量任务悄悄加上限额
+UPSTREAM_MAX_INFLIGHT = int(os.getenv("UPSTREAM_MAX_INFLIGHT", "64"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "2"))
+PROXY_USER_RATE_PER_MIN = int(os.getenv("PROXY_USER_RATE_PER_MIN", "0"))
+_upstream_slots = threading.BoundedSemaphore(UPSTREAM_MAX_INFLIGHT)
+_user_buckets: TTLCache = TTLCache(maxsize=10000, ttl=600)  # user -> [剩余令牌, 上次补充时间]
+_user_buckets_lock = threading.Lock()
+
+
+def _user_rate_ok(user_key: str) -> bool:
+    if PROXY_USER_RATE_PER_MIN <= 0:
+        return True
+    now = time.monotonic()
+    with _user_buckets_lock:
+        bucket = _user_buckets.get(user_key)
+        if bucket is None:
+            bucket = [float(PROXY_USER_RATE_PER_MIN), now]
+        else:
+            refill = (now - bucket[1]) * PROXY_USER_RATE_PER_MIN / 60
+            bucket[0] = min(float(PROXY_USER_RATE_PER_MIN), bucket[0] + refill)
+            bucket[1] = now
+        _user_buckets[user_key] = bucket
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+
+def _refund_user_token(user_key: str) -> None:
+    """上游拒绝了凭证（401/403）时退回本次扣掉的令牌：未通过认证的请求不应消耗该用户的额度，
+    否则任何人都能冒用别人的用户名把对方限流"""
+    if PROXY_USER_RATE_PER_MIN <= 0:
+        return
+    with _user_buckets_lock:
+        bucket = _user_buckets.get(user_key)
+        if bucket is not None:
+            bucket[0] = min(float(PROXY_USER_RATE_PER_MIN), bucket[0] + 1)
+
+
+def _openai_rate_key(auth_header: str, body: bytes) -> str:
+    """
+    /v1/chat/completions 的限流键：Bearer <user>:<secret> 取 user；INTERNAL_TOKEN 开头的内部调用
+    取其后的 user；没有 Authorization 头时取请求体里的 user 字段；都没有则按客户端地址，
+    不让所有无头请求挤在同一个桶里
+    """
+    if auth_header.startswith("Bearer "):
+        parts = auth_header[7:].split(":")
+        if INTERNAL_TOKEN and parts[0] == INTERNAL_TOKEN:
+            return "user:" + (parts[1] if len(parts) > 1 else "system")
+        if parts[0]:
+            return "user:" + parts[0]
+    try:
+        user = orjson.loads(body).get("user")
+    except (orjson.JSONDecodeError, AttributeError):
+        user = None
+    if isinstance(user, str) and user:
+        return "user:" + user
+    return "addr:" + (request.remote_addr or "")
+
+
+def _acquire_chat_slot(user_key: str):
+    """
+    通过限流和并发检查时占用一个上游槽位并返回 None（调用方负责 _upstream_slots.release()）；
+    否则返回 429 响应。
+    """
+    if not _user_rate_ok(user_key):
+        return jsonify({"error": "请求过于频繁，请稍后再试"}), 429
+    if not _upstream_slots.acquire(timeout=UPSTREAM_QUEUE_TIMEOUT):
+        return jsonify({"error": "服务繁忙，请稍后再试"}), 429
+    return None
+
+
+def _hold_slot_until_closed(resp: Response, upstream: requests.Response) -> Response:
+    """
+    流式响应结束（含客户端断开）时才归还槽位并关闭上游连接。
+    挂在 call_on_close 上而不是生成器的 finally：客户端在第一块发出前就断开时，
+    生成器从未开始迭代，finally 不会执行，但 WSGI 服务器仍会调用 Response.close()。
+    """
+    resp.call_on_close(upstream.close)
+    resp.call_on_close(_upstream_slots.release)
+    return resp
+
+
+# 所有 SSE 响应共用的头：
+# - no-transform 禁止中间代理改写/压缩响应体（压缩器会攒满一个块才输出，造成推送卡顿）
+# - X-Accel-Buffering: no 让 nginx 对这个响应关闭缓冲
+# 本服务不做响应压缩；若前面有 nginx，对应 location 还应配置 proxy_buffering off; gzip off;
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache, no-transform",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+# 上游中途断流时追加的错误帧：客户端据此区分"正常结束"和"被截断"（OASIS 面板回退轮询）
+_SSE_ERROR_FRAME = b"event: error\ndata: [ERROR]\n\n"
+# OpenAI 兼容流用 JSON 错误对象：openai SDK 收到 event: error + {"error": ...} 会抛出 APIError
+_OPENAI_SSE_ERROR_FRAME = (
+    b"event: error\ndata: "
+    + orjson.dumps({"error": {"message": "upstream stream interrupted", "type": "upstream_error"}})
+    + b"\n\n"
+)
+
+
+def _relay_stream(r: requests.Response, error_frame: bytes = _SSE_ERROR_FRAME):
+    """
+    逐块转发上游流式响应体。
+    WSGI 服务器把上一块写进客户端 socket 后才会取下一块：客户端读得慢时这里自然阻塞，
+    上游读取随之暂停，由 TCP 把背压传回上游，进程内不会堆积数据。
+    客户端断开时服务器关闭生成器（GeneratorExit），finally 里把连接还给连接池；
+    上游中途断流或读超时不把异常抛给 WSGI 服务器，而是补发 error_frame 后结束本次响应。
+    """
+    try:
+        for chunk in r.iter_content(chunk_size=None):
+            if chunk:
+                yield chunk
+    except requests.RequestException as e:
+        app.logger.warning("上游流中断 %s: %s", r.url, e)
+        # 先补空行：断在半帧时把残帧结束掉，错误帧不会被拼进上一行
+        yield b"\n\n" + error_frame
+    finally:
+        r.close()
+
+
+def _simple_sse_frame(line: bytes) -> bytes:
+    """
+    把一行 OpenAI SSE 转成前端期望的简单 SSE 帧：只保留 delta.content，换行和反斜杠转义。
+    按字节处理（orjson 直接解析 bytes）；流式响应是 direct_passthrough，必须产出 bytes。
+    """
+    line = line.rstrip(b"\r")
+    if not line.startswith(b"data: "):
+        return b""
+    if line.startswith(b"data: [DONE]"):
+        return b"data: [DONE]\n\n"
+    try:
+        chunk = orjson.loads(line[6:])
+    except orjson.JSONDecodeError:
+        # 透传无法解析的行
+        return line + b"\n\n"
+    delta = chunk.get("choices", [{}])[0].get("delta", {})
+    content = delta.get("content", "")
+    if not content:
+        return b""
+    text = content.replace("\\", "\\\\").replace("\n", "\\n")
+    return b"data: " + text.encode("utf-8") + b"\n\n"
+
+
+# 发往 Agent 的 OpenAI 格式请求体：固定前缀预先编码好，每次只用 orjson 编码变化的部分
+_CHAT_PAYLOAD_HEAD = b'{"model":"mini-timebot","messages":[{"role":"user","content":'
+
+
+def _chat_payload(msg_content, **fields) -> bytes:
+    return _CHAT_PAYLOAD_HEAD + orjson.dumps(msg_content) + b"}]," + orjson.dumps(fields)[1:]
+
+
+# proxy_ask 到 Agent 的内部跳可选用 msgpack 编码（需两端都安装 msgpack，默认关闭）
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+PROXY_AGENT_MSGPACK = msgpack is not None and os.getenv("PROXY_AGENT_MSGPACK", "0") == "1"
+
+
+# 上游异常时的固定错误体：启动时编码好，失败路径不再拼接/序列化，
+# 也不把异常原文（内部地址、堆栈信息）回给浏览器，详情只写日志
+_ERR_MESSAGES = ("Agent 响应超时，请稍后重试", "Agent 服务不可用", "服务器内部错误")
+_ERR_BODIES = tuple(orjson.dumps({"error": m}) for m in _ERR_MESSAGES)
+_ERR_TOOLS_BODIES = tuple(orjson.dumps({"error": m, "tools": []}) for m in _ERR_MESSAGES)
+
+
+def _upstream_error(e: Exception, bodies: tuple = _ERR_BODIES) -> Response:
+    """bodies 依次对应 (超时, 连接失败, 其他异常)"""
+    if isinstance(e, requests.Timeout):
+        app.logger.warning("%s 上游超时: %s", request.path, e)
+        body, status = bodies[0], 504
+    elif isinstance(e, requests.ConnectionError):
+        app.logger.warning("%s 上游连接失败: %s", request.path, e)
+        body, status = bodies[1], 502
+    else:
+        app.logger.exception("%s 代理异常", request.path)
+        body, status = bodies[2], 500
+    return Response(body, status=status, mimetype="application/json")
+
+
+def _passthrough(r: requests.Response) -> Response:
+    """上游响应原样转发：直接回写 body 字节和 Content-Type，省去一次 JSON 解析 + 一次序列化"""
+    return Response(r.content, status=r.status_code, content_type=r.headers.get("content-type", "application/json"))
+
+
+STATIC_DIR = os.path.join(current_dir, "static")
+
+# 页面 HTML 单独存放在 static/index.html（不含 Jinja 变量），启动时读入一次
+with open(os.path.join(STATIC_DIR, "index.html"), encoding="utf-8") as f:
+    HTML_TEMPLATE = f.read()
+
+
+def _minify_index_html(html: str) -> str:
+    """
+    启动时压缩一次 HTML 与内联 CSS（优先用可选依赖 minify-html）。
+    内联 JS 大量使用模板字符串，保守起见不做 JS 压缩；任何异常都回退原文。
+    """
+    try:
+        import minify_html
+        return minify_html.minify(html, minify_css=True, minify_js=False, keep_comments=False)
+    except ImportError:
+        pass
+    except Exception as e:
+        print(f"[front] minify-html 失败，使用原始模板: {e}")
+        return html
+
+    # 无依赖回退：<script>/<pre>/<textarea> 原样保留；<style> 有 rcssmin 时压缩；
+    # 其余 HTML 去掉注释和行首缩进（换行保留，行内元素间的空白语义不变）
+    try:
+        import rcssmin
+    except ImportError:
+        rcssmin = None
+    parts = re.split(r"(<script\b.*?</script>|<style\b.*?</style>|<pre\b.*?</pre>|<textarea\b.*?</textarea>)", html, flags=re.S | re.I)
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            part = re.sub(r"<!--.*?-->", "", part, flags=re.S)
+            parts[i] = re.sub(r"\n[ \t]+", "\n", part)
+        elif rcssmin is not None and part[:6].lower() == "<style":
+            head, _, rest = part.partition(">")
+            css, _, tail = rest.rpartition("</")
+            parts[i] = f"{head}>{rcssmin.cssmin(css)}</{tail}"
+    return "".join(parts)
+
+
+# 模板不含任何 Jinja 变量：启动时一次性压缩、编码为 bytes 并计算 ETag，
+# 每次请求直接返回静态 body，省去模板解析/渲染
+INDEX_HTML_BYTES = _minify_index_html(HTML_TEMPLATE).encode("utf-8")
+INDEX_ETAG = hashlib.sha256(INDEX_HTML_BYTES).hexdigest()[:32]
+
+# 同时预压缩 gzip / brotli 版本（brotli 为可选依赖），按 Accept-Encoding 选择，
+# 请求时不再消耗 CPU 压缩；每种编码使用独立 ETag
+INDEX_ENCODED_BODIES: list[tuple[str, bytes]] = []
+try:
+    import brotli
+    INDEX_ENCODED_BODIES.append(("br", brotli.compress(INDEX_HTML_BYTES, quality=11)))
+except ImportError:
+    pass
+INDEX_ENCODED_BODIES.append(("gzip", gzip.compress(INDEX_HTML_BYTES, 9)))
+
+
+# --- 第三方前端库本地化 ---
+# 首次请求时从 CDN 下载一次落盘，之后由本站同源返回并长期缓存，
+# 冷启动省去 3 个外部域名的 DNS + TLS 握手；下载失败时 302 回 CDN，页面照常可用。
+# 文件名带版本号，升级时改名即可让浏览器缓存失效
+VENDOR_ASSETS = {
+    # Tailwind Play CDN 也固定到具体版本，否则不能按 immutable 长期缓存
+    "tailwindcss-play-3.4.1.js": "https://cdn.tailwindcss.com/3.4.1",
+    "marked-9.1.2.min.js": "https://cdnjs.cloudflare.com/ajax/libs/marked/9.1.2/marked.min.js",
+    "highlight-11.8.0-github-dark.min.css": "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.8.0/styles/github-dark.min.css",
+    "highlight-11.8.0.min.js": "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.8.0/highlight.min.js",
+}
+VENDOR_DIR = os.path.join(root_dir, "data", "vendor")
+VENDOR_MAX_AGE = 31536000
+# 下载失败后这段时间内直接 302 到 CDN，不再重试（离线 / 内网环境不会每次加载页面都卡在下载上）
+VENDOR_RETRY_COOLDOWN = 300
+VENDOR_DOWNLOAD_TIMEOUT = 5
+_vendor_locks = {name: threading.Lock() for name in VENDOR_ASSETS}
+_vendor_failed_at: dict[str, float] = {}
+
+
+def _ensure_vendor_asset(name: str) -> bool:
+    """
+    确保资源已缓存到 VENDOR_DIR，返回是否可从本地提供。
+    每个资源单独加锁且不排队：已有请求在下载时其余请求直接回退 CDN，不会串行等待。
+    """
+    path = os.path.join(VENDOR_DIR, name)
+    if os.path.isfile(path):
+        return True
+    failed_at = _vendor_failed_at.get(name)
+    if failed_at is not None and time.monotonic() - failed_at < VENDOR_RETRY_COOLDOWN:
+        return False
+    lock = _vendor_locks[name]
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        if os.path.isfile(path):
+            return True
+        try:
+            r = requests.get(VENDOR_ASSETS[name], timeout=VENDOR_DOWNLOAD_TIMEOUT)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            _vendor_failed_at[name] = time.monotonic()
+            print(f"[vendor] 下载 {name} 失败（{VENDOR_RETRY_COOLDOWN} 秒内改用 CDN）: {e}")
+            return False
+        os.makedirs(VENDOR_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(r.content)
+        os.replace(tmp_path, path)
+        _vendor_failed_at.pop(name, None)
+    finally:
+        lock.release()
+    return True
+
+
+@app.route("/vendor/<name>")
+def vendor_asset(name):
+    if name not in VENDOR_ASSETS:
+        return jsonify({"error": "not found"}), 404
+    if not _ensure_vendor_asset(name):
+        return redirect(VENDOR_ASSETS[name])
+    resp = send_from_directory(VENDOR_DIR, name, max_age=VENDOR_MAX_AGE)
+    resp.headers["Cache-Control"] = f"public, max-age={VENDOR_MAX_AGE}, immutable"
+    return resp
 
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <title>Xavier AnyControl | AI Agent</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no, viewport-fit=cover">
-
-    <!-- PWA / iOS Full-screen support -->
-    <meta name="apple-mobile-web-app-capable" content="yes">
-    <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">
-    <meta name="apple-mobile-web-app-title" content="AnyControl">
-    <meta name="mobile-web-app-capable" content="yes">
-    <meta name="theme-color" content="#111827">
-    <meta name="format-detection" content="telephone=no">
-    <meta name="msapplication-tap-highlight" content="no">
-    <meta name="msapplication-TileColor" content="#111827">
-    <link rel="apple-touch-icon" href="https://img.icons8.com/fluency/180/robot-2.png">
-    <link rel="apple-touch-icon" sizes="152x152" href="https://img.icons8.com/fluency/152/robot-2.png">
-    <link rel="apple-touch-icon" sizes="180x180" href="https://img.icons8.com/fluency/180/robot-2.png">
-    <link rel="apple-touch-icon" sizes="167x167" href="https://img.icons8.com/fluency/167/robot-2.png">
-    <!-- iOS splash screens -->
-    <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">
-    <link rel="manifest" href="/manifest.json">
-    
-    <script src="https://cdn.tailwindcss.com"></script>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/marked/9.1.2/marked.min.js"></script>
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.8.0/styles/github-dark.min.css">
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.8.0/highlight.min.js"></script>
-
-    <style>
-        /* === PWA Standalone Mode Fix === */
-        :root {
-            --app-height: 100vh;
-            --header-height: 60px;
-            --input-height: 70px;
-            --safe-top: env(safe-area-inset-top, 0px);
-            --safe-bottom: env(safe-area-inset-bottom, 0px);
-        }
-        
-        /* PWA standalone mode: use dynamic viewport height */
-        @supports (height: 100dvh) {
-            :root { --app-height: 100dvh; }
-        }
-        
-        /* === Native App Behavior (mobile only) === */
-        html, body {
-            overscroll-behavior: none;
-        }
-        @media (hover: none) and (pointer: coarse) {
-            /* Mobile / touch devices only */
-            html, body {
-                -webkit-overflow-scrolling: touch;
-                -webkit-user-select: none;
-                user-select: none;
-                -webkit-touch-callout: none;
-                -webkit-tap-highlight-color: transparent;
-                touch-action: manipulation;
-                position: fixed;
-                width: 100%;
-                height: 100%;
-                overflow: hidden;
-            }
-            /* Allow text selection only inside chat messages on mobile */
-            .message-agent, .message-user, .markdown-body {
-                -webkit-user-select: text;
-                user-select: text;
-            }
-        }
-        /* Safe area classes removed — no special notch/curved-screen handling */
-        /* Splash screen */
-        #app-splash {
-            position: fixed; top: 0; left: 0; width: 100%; height: 100%;
-            background: linear-gradient(135deg, #111827 0%, #1e3a5f 100%);
-            display: flex; flex-direction: column; align-items: center; justify-content: center;
-            z-index: 99999; transition: opacity 0.5s ease;
-        }
-        #app-splash.fade-out { opacity: 0; pointer-events: none; }
-        #app-splash .splash-icon { width: 80px; height: 80px; border-radius: 20px; margin-bottom: 16px; animation: splash-bounce 1s ease infinite; }
-        #app-splash .splash-title { color: white; font-size: 22px; font-weight: 700; letter-spacing: 1px; }
-        #app-splash .splash-sub { color: rgba(255,255,255,0.5); font-size: 12px; margin-top: 8px; }
-        @keyframes splash-bounce { 0%,100% { transform: scale(1); } 50% { transform: scale(1.08); } }
-        /* Offline banner */
-        #offline-banner {
-            display: none; position: fixed; top: 0; left: 0; right: 0;
-            background: #ef4444; color: white; text-align: center;
-            padding: 6px 0; font-size: 13px; font-weight: 600; z-index: 99998;
-            padding-top: 6px;
-        }
-        #offline-banner.show { display: block; animation: slideDown 0.3s ease; }
-        @keyframes slideDown { from { transform: translateY(-100%); } to { transform: translateY(0); } }
-
-        /* Fixed header height - input area auto-sizes */
-        header { 
-            flex-shrink: 0; 
-            height: auto; 
-            min-height: calc(var(--header-height, 60px) + var(--safe-top)); 
-            padding-top: var(--safe-top);
-            z-index: 50;
-        }
-        .p-2.sm\:p-4.border-t { 
-            flex-shrink: 0; 
-            min-height: calc(60px + var(--safe-bottom));
-            padding-bottom: var(--safe-bottom);
-        }
-
-        .chat-container { flex: 1; min-height: 0; overflow-y: auto; }
-        .markdown-body pre { background: #1e1e1e; padding: 1rem; border-radius: 0.5rem; margin: 0.5rem 0; overflow-x: auto; }
-        .markdown-body code { font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, monospace; font-size: 0.9em; }
-        .message-user { border-radius: 1.25rem 1.25rem 0.2rem 1.25rem; }
-        .message-agent { border-radius: 1.25rem 1.25rem 1.25rem 0.2rem; }
-        /* TTS 朗读按钮 */
-        .tts-btn {
-            display: inline-flex; align-items: center; gap: 4px;
-            padding: 3px 10px; margin-top: 8px;
-            background: #f3f4f6; border: 1px solid #e5e7eb; border-radius: 9999px;
-            font-size: 12px; color: #6b7280; cursor: pointer; user-select: none;
-            transition: all 0.2s ease;
-        }
-        .tts-btn:hover { background: #e5e7eb; color: #374151; }
-        .tts-btn.playing { background: #dbeafe; color: #2563eb; border-color: #93c5fd; }
-        .tts-btn.loading { opacity: 0.6; pointer-events: none; }
-        .tts-btn svg { width: 14px; height: 14px; }
-        .tts-btn .tts-spinner {
-            width: 14px; height: 14px; border: 2px solid #93c5fd;
-            border-top-color: transparent; border-radius: 50%;
-            animation: tts-spin 0.8s linear infinite; display: none;
-        }
-        .tts-btn.loading .tts-spinner { display: inline-block; }
-        .tts-btn.loading .tts-icon { display: none; }
-        @keyframes tts-spin { to { transform: rotate(360deg); } }
-        .dot { width: 6px; height: 6px; background: #3b82f6; border-radius: 50%; animation: pulse 1.5s infinite; }
-        @keyframes pulse { 0%, 100% { opacity: 0.3; transform: scale(0.8); } 50% { opacity: 1; transform: scale(1.2); } }
-        /* Tool panel styles */
-        .tool-panel { transition: max-height 0.3s ease, opacity 0.3s ease; overflow: hidden; }
-        .tool-panel.collapsed { max-height: 0; opacity: 0; }
-        .tool-panel.expanded { max-height: 300px; opacity: 1; overflow-y: auto; }
-        .tool-tag { display: inline-flex; align-items: center; padding: 4px 10px; border-radius: 9999px; font-size: 12px; cursor: pointer; user-select: none; transition: all 0.25s ease; }
-        .tool-tag.enabled { background: #eff6ff; color: #2563eb; border: 1px solid #bfdbfe; }
-        .tool-tag.enabled:hover { background: #dbeafe; }
-        .tool-tag.disabled { background: #f3f4f6; color: #9ca3af; border: 1px solid #e5e7eb; opacity: 0.65; }
-        .tool-tag.disabled:hover { background: #e5e7eb; opacity: 0.8; }
-        .tool-toggle-btn { cursor: pointer; user-select: none; transition: color 0.2s; }
-        .tool-toggle-btn:hover { color: #2563eb; }
-        .tool-toggle-icon { display: inline-block; transition: transform 0.3s ease; }
-        .tool-toggle-icon.open { transform: rotate(180deg); }
-
-        /* OASIS Panel Styles */
-        .oasis-panel { width: 380px; min-width: 320px; transition: width 0.3s ease; }
-        .oasis-panel.collapsed-panel { width: 48px; min-width: 48px; }
-        .oasis-panel.collapsed-panel .oasis-content { display: none; }
-        .oasis-panel.collapsed-panel .oasis-expand-btn { display: flex; }
-        .oasis-expand-btn { display: none; writing-mode: vertical-lr; text-orientation: mixed; }
-        .oasis-topic-item { transition: all 0.2s ease; cursor: pointer; }
-        .oasis-topic-item:hover { background: #eff6ff; }
-        .oasis-topic-item.active { background: #dbeafe; border-left: 3px solid #2563eb; }
-        .oasis-post { animation: slideIn 0.3s ease; }
-        @keyframes slideIn { from { opacity: 0; transform: translateY(8px); } to { opacity: 1; transform: translateY(0); } }
-        .oasis-vote-bar { height: 6px; border-radius: 3px; overflow: hidden; }
-        .oasis-vote-up { background: #22c55e; }
-        .oasis-vote-down { background: #ef4444; }
-        .oasis-status-badge { font-size: 10px; padding: 2px 8px; border-radius: 9999px; font-weight: 600; }
-        .oasis-status-pending { background: #fef3c7; color: #92400e; }
-        .oasis-status-discussing { background: #dbeafe; color: #1e40af; animation: pulse-bg 2s infinite; }
-        .oasis-status-concluded { background: #d1fae5; color: #065f46; }
-        .oasis-status-error { background: #fee2e2; color: #991b1b; }
-        @keyframes pulse-bg { 0%, 100% { opacity: 1; } 50% { opacity: 0.7; } }
-        .oasis-expert-avatar { width: 28px; height: 28px; border-radius: 50%; display: inline-flex; align-items: center; justify-content: center; font-size: 12px; font-weight: bold; color: white; flex-shrink: 0; }
-        .expert-creative { background: linear-gradient(135deg, #f59e0b, #f97316); }
-        .expert-critical { background: linear-gradient(135deg, #ef4444, #dc2626); }
-        .expert-data { background: linear-gradient(135deg, #3b82f6, #2563eb); }
-        .expert-synthesis { background: linear-gradient(135deg, #8b5cf6, #7c3aed); }
-        .expert-default { background: linear-gradient(135deg, #6b7280, #4b5563); }
-        .oasis-discussion-box { height: calc(100vh - 340px); overflow-y: auto; }
-        .oasis-conclusion-box { background: linear-gradient(135deg, #f0fdf4, #ecfdf5); border: 1px solid #86efac; border-radius: 12px; padding: 12px; }
-        .main-layout { display: flex; height: var(--app-height, 100vh); max-width: 100%; overflow: hidden; }
-        .chat-main { flex: 1; min-width: 0; max-width: 900px; display: flex; flex-direction: column; height: var(--app-height, 100vh); overflow: hidden; }
-
-        /* === Session sidebar === */
-        .session-sidebar {
-            width: 260px; flex-shrink: 0; display: flex; flex-direction: column;
-            height: var(--app-height, 100vh); background: white; border-right: 1px solid #e5e7eb;
-            overflow: hidden;
-        }
-        .session-item {
-            padding: 8px 10px; border-radius: 8px; cursor: pointer; transition: background 0.15s;
-            border: 1px solid transparent;
-        }
-        .session-item:hover { background: #f3f4f6; }
-        .session-item.active { background: #eff6ff; border-color: #bfdbfe; }
-        .session-item .session-title { font-size: 13px; font-weight: 500; color: #374151; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
-        .session-item .session-meta { font-size: 11px; color: #9ca3af; margin-top: 2px; }
-        .session-item .session-delete {
-            display: none; position: absolute; right: 6px; top: 50%; transform: translateY(-50%);
-            background: #fee2e2; color: #dc2626; border: none; border-radius: 4px;
-            font-size: 11px; padding: 2px 6px; cursor: pointer; line-height: 1.2;
-        }
-        .session-item { position: relative; }
-        .session-item:hover .session-delete { display: block; }
-        .session-item .session-delete:hover { background: #fca5a5; }
-
-        /* === Mobile responsive === */
-        @media (max-width: 768px) {
-            .session-sidebar {
-                position: fixed; left: 0; top: 0; z-index: 200; width: 75vw; max-width: 300px;
-                box-shadow: 4px 0 20px rgba(0,0,0,0.15);
-            }
-            .session-overlay {
-                position: fixed; inset: 0; background: rgba(0,0,0,0.3); z-index: 199;
-            }
-            .main-layout { flex-direction: column; height: var(--app-height, 100vh); overflow: hidden; }
-            .chat-main { max-width: 100%; width: 100%; height: var(--app-height, 100vh); }
-            /* Header: fixed at top - auto height for safe area */
-            header { 
-                flex-shrink: 0; 
-                height: auto; 
-                min-height: calc(var(--header-height, 60px) + var(--safe-top));
-                padding-top: var(--safe-top);
-                overflow: visible;
-            }
-            /* Chat container: scrollable middle area */
-            .chat-container { flex: 1; min-height: 0; overflow-y: auto; -webkit-overflow-scrolling: touch; }
-            /* Input area: fixed at bottom - auto height */
-            .p-2.sm\:p-4.border-t { 
-                flex-shrink: 0; 
-                min-height: calc(60px + var(--safe-bottom));
-                padding-bottom: var(--safe-bottom);
-            }
-            /* OASIS: overlay mode on mobile */
-            .oasis-divider { display: none !important; }
-            .oasis-panel {
-                position: fixed !important; top: 0; left: 0; right: 0; bottom: 0;
-                width: 100% !important; min-width: 100% !important;
-                z-index: 50; display: none;
-            }
-            .oasis-panel.mobile-open { display: flex !important; }
-            .oasis-panel.collapsed-panel { display: none !important; }
-            .oasis-panel .oasis-expand-btn { display: none !important; }
-            /* Mobile: hide UID & session, hide desktop buttons, show hamburger */
-            #uid-display, #session-display { display: none !important; }
-            .desktop-only-btn { display: none !important; }
-            .mobile-menu-btn { display: inline-flex !important; }
-            /* Header: stack items on narrow screens */
-            .mobile-header-top { flex-wrap: wrap; gap: 6px; }
-            .mobile-header-actions { flex-wrap: wrap; gap: 4px; justify-content: flex-end; }
-            /* Reduce padding on mobile */
-            #chat-box { padding: 12px !important; }
-            .message-agent, .message-user { max-width: 92% !important; }
-            /* Increase font size on mobile */
-            .message-content, .message-agent, .message-user { font-size: 16px !important; }
-            .message-content p, .message-content li { font-size: 16px !important; }
-            #message-input, #message-input::placeholder { font-size: 16px !important; }
-            .tool-tag { font-size: 14px !important; padding: 6px 12px !important; }
-        }
-        /* Hide mobile-only elements on desktop */
-        @media (min-width: 769px) {
-            .mobile-menu-wrapper { display: none !important; }
-        }
-        /* Mobile menu dropdown styles */
-        .mobile-menu-btn { display: none; }
-        .mobile-menu-dropdown {
-            position: absolute; right: 0; top: 100%; margin-top: 6px;
-            background: white; border: 1px solid #e5e7eb; border-radius: 10px;
-            box-shadow: 0 8px 24px rgba(0,0,0,0.12); z-index: 100;
-            min-width: 140px; overflow: hidden;
-        }
-        .mobile-menu-item {
-            display: block; width: 100%; text-align: left;
-            padding: 10px 14px; font-size: 13px; color: #374151;
-            border: none; background: none; cursor: pointer;
-            transition: background 0.15s;
-        }
-        .mobile-menu-item:hover, .mobile-menu-item:active { background: #f3f4f6; }
-        .mobile-menu-item + .mobile-menu-item { border-top: 1px solid #f3f4f6; }
-        .oasis-divider { width: 1px; background: #e5e7eb; cursor: col-resize; flex-shrink: 0; }
-        .oasis-divider:hover { background: #3b82f6; width: 3px; }
-
-        /* Image upload styles */
-        .image-preview-area { display: flex; flex-wrap: wrap; gap: 6px; margin-bottom: 6px; }
-        .image-preview-item { position: relative; width: 60px; height: 60px; border-radius: 8px; overflow: hidden; border: 1px solid #e5e7eb; }
-        .image-preview-item img { width: 100%; height: 100%; object-fit: cover; }
-        .image-preview-item .remove-btn { position: absolute; top: -2px; right: -2px; width: 18px; height: 18px; background: #ef4444; color: white; border: none; border-radius: 50%; font-size: 10px; cursor: pointer; display: flex; align-items: center; justify-content: center; line-height: 1; }
-        .image-upload-btn { cursor: pointer; color: #6b7280; transition: color 0.2s; flex-shrink: 0; display: flex; align-items: center; justify-content: center; width: 42px; height: 42px; border-radius: 10px; border: 1px solid #e5e7eb; background: #f9fafb; }
-        .image-upload-btn:hover { color: #2563eb; border-color: #bfdbfe; background: #eff6ff; }
-        @media (max-width: 768px) { .image-upload-btn { width: 36px; height: 36px; } }
-        /* File preview (text files) */
-        .file-preview-item { position: relative; display: flex; align-items: center; gap: 4px; padding: 4px 8px; border-radius: 8px; border: 1px solid #e5e7eb; background: #f9fafb; font-size: 12px; color: #374151; max-width: 180px; }
-        .file-preview-item .file-icon { font-size: 16px; flex-shrink: 0; }
-        .file-preview-item .file-name { overflow: hidden; text-overflow: ellipsis; white-space: nowrap; }
-        .file-preview-item .remove-btn { width: 16px; height: 16px; background: #ef4444; color: white; border: none; border-radius: 50%; font-size: 9px; cursor: pointer; display: flex; align-items: center; justify-content: center; line-height: 1; flex-shrink: 0; }
-        .chat-file-tag { display: inline-flex; align-items: center; gap: 4px; padding: 2px 8px; border-radius: 6px; background: rgba(255,255,255,0.15); font-size: 12px; margin-bottom: 4px; }
-        /* Audio recording button */
-        .audio-record-btn { cursor: pointer; color: #6b7280; transition: all 0.2s; flex-shrink: 0; display: flex; align-items: center; justify-content: center; width: 42px; height: 42px; border-radius: 10px; border: 1px solid #e5e7eb; background: #f9fafb; font-size: 18px; }
-        .audio-record-btn:hover { color: #dc2626; border-color: #fecaca; background: #fef2f2; }
-        .audio-record-btn.recording { color: #fff; background: #dc2626; border-color: #dc2626; animation: pulse-red 1.2s infinite; }
-        @keyframes pulse-red { 0%,100% { box-shadow: 0 0 0 0 rgba(220,38,38,0.4); } 50% { box-shadow: 0 0 0 8px rgba(220,38,38,0); } }
-        @media (max-width: 768px) { .audio-record-btn { width: 36px; height: 36px; font-size: 16px; } }
-        /* Audio preview */
-        .audio-preview-item { position: relative; display: flex; align-items: center; gap: 4px; padding: 4px 8px; border-radius: 8px; border: 1px solid #e5e7eb; background: #fef2f2; font-size: 12px; color: #374151; max-width: 200px; }
-        .audio-preview-item .file-icon { font-size: 16px; flex-shrink: 0; }
-        .audio-preview-item .file-name { overflow: hidden; text-overflow: ellipsis; white-space: nowrap; }
-        .audio-preview-item .remove-btn { width: 16px; height: 16px; background: #ef4444; color: white; border: none; border-radius: 50%; font-size: 9px; cursor: pointer; display: flex; align-items: center; justify-content: center; line-height: 1; flex-shrink: 0; }
-        .chat-audio-tag { display: inline-flex; align-items: center; gap: 4px; padding: 2px 8px; border-radius: 6px; background: rgba(255,255,255,0.15); font-size: 12px; margin-bottom: 4px; }
-        /* Inline image in chat messages */
-        .chat-inline-image { max-width: 240px; max-height: 180px; border-radius: 8px; margin: 4px 0; cursor: pointer; }
-        .chat-inline-image:hover { opacity: 0.9; }
-    </style>
-</head>
-<body class="bg-gray-100 font-sans leading-normal tracking-normal">
-
-    <!-- Splash Screen -->
-    <div id="app-splash">
-        <img class="splash-icon" src="https://img.icons8.com/fluency/180/robot-2.png" alt="">
-        <div class="splash-title">AnyControl</div>
-        <div class="splash-sub">Xavier AI Agent</div>
-    </div>
-
-    <!-- Offline Banner -->
-    <div id="offline-banner" data-i18n="offline_banner">⚠️ 网络已断开，请检查连接</div>
-
-    <!-- ========== 登录页 ========== -->
-    <div id="login-screen" class="min-h-screen flex items-center justify-center safe-top safe-bottom px-4" style="width:100%;height:100%;overflow:auto;">
-        <div class="bg-white rounded-2xl shadow-2xl p-6 sm:p-8 w-full max-w-md border">
-            <div class="flex items-center justify-center space-x-3 mb-6">
-                <div class="bg-blue-600 p-3 rounded-xl text-white font-bold text-2xl">X</div>
-                <h1 class="text-2xl font-bold text-gray-800" data-i18n="login_title">Xavier AnyControl</h1>
-            </div>
-            <p class="text-center text-gray-500 text-sm mb-8" data-i18n="login_subtitle">请登录以开始对话</p>
-            <div class="space-y-4">
-                <input id="username-input" type="text" maxlength="32"
-                    class="w-full p-3 border border-gray-300 rounded-xl focus:outline-none focus:ring-2 focus:ring-blue-500 text-center text-lg"
-                    data-i18n-placeholder="username" placeholder="用户名" autofocus>
-                <input id="password-input" type="password" maxlength="64"
-                    class="w-full p-3 border border-gray-300 rounded-xl focus:outline-none focus:ring-2 focus:ring-blue-500 text-center text-lg"
-                    data-i18n-placeholder="password" placeholder="密码">
-                <div id="login-error" class="text-red-500 text-sm text-center hidden"></div>
-                <button onclick="handleLogin()" id="login-btn"
-                    class="w-full bg-blue-600 hover:bg-blue-700 text-white py-3 rounded-xl font-bold text-lg transition-all shadow-lg"
-                    data-i18n="login_btn">登录</button>
-            </div>
-            <p class="text-xs text-gray-400 text-center mt-6" data-i18n="login_footer">身份验证后方可使用，对话和文件按用户隔离</p>
-        </div>
-    </div>
-
-    <!-- ========== 主布局（聊天 + OASIS）（初始隐藏） ========== -->
-    <div id="chat-screen" class="main-layout safe-top safe-bottom safe-left safe-right" style="display:none;">
-
-        <!-- ===== 历史会话侧边栏 ===== -->
-        <div id="session-sidebar" class="session-sidebar" style="display:none;">
-            <div class="p-3 border-b bg-gray-50 flex justify-between items-center flex-shrink-0">
-                <span class="text-sm font-bold text-gray-700" data-i18n="history_title">💬 历史对话</span>
-                <div class="flex items-center gap-2">
-                    <button onclick="deleteAllSessions()" class="text-xs text-red-400 hover:text-red-600" data-i18n="delete_all">🗑️ 清空全部</button>
-                    <button onclick="closeSessionSidebar()" class="text-gray-400 hover:text-gray-600 text-lg leading-none">&times;</button>
-                </div>
-            </div>
-            <div id="session-list" class="flex-1 overflow-y-auto p-2 space-y-1">
-                <div class="text-xs text-gray-400 text-center py-4" data-i18n="loading">加载中...</div>
-            </div>
-        </div>
-
-        <!-- ===== 左侧：聊天区 ===== -->
-        <div class="chat-main h-screen flex flex-col bg-white border-x border-gray-200 shadow-2xl">
-            <header class="p-3 sm:p-4 border-b bg-white flex justify-between items-start sm:items-center gap-2 flex-shrink-0">
-                <div class="flex items-center space-x-2 sm:space-x-3 mobile-header-top flex-shrink-0">
-                    <div class="bg-blue-600 p-1.5 sm:p-2 rounded-lg text-white font-bold text-lg sm:text-xl">X</div>
-                    <div>
-                        <h1 class="text-sm sm:text-lg font-bold text-gray-800 leading-tight">AnyControl</h1>
-                        <p class="text-[10px] sm:text-xs text-green-500 flex items-center" data-i18n="encrypted">● 已加密</p>
-                    </div>
-                </div>
-                <div class="flex items-center space-x-1 sm:space-x-2 mobile-header-actions flex-shrink-0">
-                    <div id="uid-display" class="text-xs sm:text-sm font-mono bg-gray-100 px-2 sm:px-3 py-1 rounded border truncate max-w-[80px] sm:max-w-none"></div>
-                    <div id="session-display" class="text-[10px] sm:text-xs font-mono bg-blue-50 text-blue-600 px-1.5 sm:px-2 py-1 rounded border border-blue-200 cursor-default" data-i18n-title="current_session" title="当前对话号"></div>
-                    <!-- History Button -->
-                    <button onclick="toggleSessionSidebar()" class="desktop-only-btn text-[10px] sm:text-xs bg-gray-50 text-gray-600 hover:bg-gray-100 px-2 py-1 rounded border border-gray-200 transition-colors flex items-center justify-center" data-i18n-title="history_title" title="历史对话">
-                        <span class="hidden sm:inline" data-i18n="history">📋历史</span>
-                        <span class="sm:hidden text-base leading-none">📋</span>
-                    </button>
-                    <!-- New Session Button: Visible on all devices -->
-                    <button onclick="handleNewSession()" class="text-[10px] sm:text-xs bg-green-50 text-green-600 hover:bg-green-100 px-2 py-1 rounded border border-green-200 transition-colors mr-1 flex items-center justify-center" data-i18n-title="new_session_confirm" title="开启新对话">
-                        <span class="sm:hidden text-base font-bold leading-none">+</span>
-                        <span class="hidden sm:inline" data-i18n="new_chat">+新</span>
-                    </button>
-                    <button onclick="toggleLanguage()" id="lang-toggle-btn" class="text-[10px] sm:text-xs bg-purple-50 text-purple-600 hover:bg-purple-100 px-2 py-1 rounded border border-purple-200 transition-colors" title="Switch Language">EN</button>
-                    <button onclick="handleLogout()" class="desktop-only-btn text-[10px] sm:text-xs text-gray-400 hover:text-red-500 px-1.5 sm:px-2 py-1 rounded transition-colors" data-i18n="logout" data-i18n-title="logout" title="切换用户">退出</button>
-                    <!-- Mobile: hamburger menu -->
-                    <div class="mobile-menu-wrapper" style="position:relative;">
-                        <button onclick="toggleMobileMenu()" class="mobile-menu-btn text-[10px] bg-gray-100 hover:bg-gray-200 px-2 py-1 rounded border border-gray-300 transition-colors" data-i18n-title="more_actions" title="更多操作">⋮</button>
-                        <div id="mobile-menu-dropdown" class="mobile-menu-dropdown" style="display:none;">
-                            <button onclick="toggleSessionSidebar(); closeMobileMenu();" class="mobile-menu-item" data-i18n="menu_history">📋 历史对话</button>
-                            <button onclick="handleNewSession(); closeMobileMenu();" class="mobile-menu-item" data-i18n="menu_new">➕ 新对话</button>
-                            <button onclick="toggleOasisMobile(); closeMobileMenu();" class="mobile-menu-item" data-i18n="menu_oasis">🏛️ OASIS</button>
-                            <button onclick="handleLogout(); closeMobileMenu();" class="mobile-menu-item text-red-500" data-i18n="menu_logout">🚪 退出</button>
-                        </div>
-                    </div>
-                </div>
-            </header>
-
-            <div id="chat-box" class="chat-container overflow-y-auto p-4 sm:p-6 space-y-4 sm:space-y-6 flex-grow bg-gray-50">
-                <div class="flex justify-start">
-                    <div class="message-agent bg-white border p-4 max-w-[85%] shadow-sm text-gray-700" data-i18n="welcome_message">
-                        你好！我是 Xavier 智能助手。我已经准备好为你服务，请输入你的指令。
-                    </div>
-                </div>
-            </div>
-
-            <div class="p-2 sm:p-4 border-t bg-white flex-shrink-0">
-                <!-- Tool List Panel -->
-                <div id="tool-panel-wrapper" class="mb-2" style="display:none;">
-                    <div class="flex items-center justify-between mb-1">
-                        <div class="tool-toggle-btn flex items-center space-x-1 text-sm text-gray-500 font-medium" onclick="toggleToolPanel()">
-                            <span data-i18n="available_tools">🧰 可用工具</span>
-                            <span id="tool-count" class="text-xs text-gray-400"></span>
-                            <span id="tool-toggle-icon" class="tool-toggle-icon text-xs">▼</span>
-                        </div>
-                    </div>
-                    <div id="tool-panel" class="tool-panel collapsed">
-                        <div id="tool-list" class="flex flex-wrap gap-2 p-2 bg-gray-50 rounded-xl border border-gray-200">
-                            <!-- tools will be injected here -->
-                        </div>
-                    </div>
-                </div>
-                <div id="image-preview-area" class="image-preview-area" style="display:none;"></div>
-                <div id="file-preview-area" class="image-preview-area" style="display:none;"></div>
-                <div id="audio-preview-area" class="image-preview-area" style="display:none;"></div>
-                <div class="flex items-end space-x-2 sm:space-x-3">
-                    <label class="image-upload-btn" title="上传图片/文件/音频">
-                        📎
-                        <input type="file" id="image-input" accept="image/*,.pdf,.txt,.md,.csv,.json,.xml,.yaml,.yml,.log,.py,.js,.ts,.html,.css,.java,.c,.cpp,.h,.go,.rs,.sh,.bat,.ini,.toml,.cfg,.conf,.sql,.r,.rb,.mp3,.wav,.ogg,.m4a,.webm,.flac,.aac" multiple style="display:none;" onchange="handleFileSelect(event)">
-                    </label>
-                    <button id="record-btn" class="audio-record-btn" data-i18n-title="recording_title" title="录音" onclick="toggleRecording()">🎤</button>
-                    <div class="flex-grow">
-                        <textarea id="user-input" rows="1" 
-                            class="w-full p-2 sm:p-3 border border-gray-300 rounded-xl focus:outline-none focus:ring-2 focus:ring-blue-500 resize-none transition-all text-sm sm:text-base"
-                            data-i18n-placeholder="input_placeholder" placeholder="输入指令...（可粘贴图片/上传文件/录音）"></textarea>
-                    </div>
-                    <button onclick="handleSend()" id="send-btn"
-                        class="bg-blue-600 hover:bg-blue-700 text-white px-4 sm:px-6 py-2 sm:py-3 rounded-xl transition-all font-bold shadow-lg h-[42px] sm:h-[50px] text-sm sm:text-base flex-shrink-0"
-                        data-i18n="send_btn">发送
-                    </button>
-                    <button onclick="handleCancel()" id="cancel-btn"
-                        class="bg-red-500 hover:bg-red-600 text-white px-4 sm:px-6 py-2 sm:py-3 rounded-xl transition-all font-bold shadow-lg h-[42px] sm:h-[50px] text-sm sm:text-base flex-shrink-0"
-                        style="display:none;" data-i18n="cancel_btn">终止
-                    </button>
-                </div>
-                <p class="text-[10px] text-center text-gray-400 mt-2 sm:mt-3 font-mono hidden sm:block" data-i18n="secure_footer">Secured by Nginx Reverse Proxy & SSH Tunnel</p>
-            </div>
-        </div>
-
-        <!-- ===== 分割线 ===== -->
-        <div class="oasis-divider" id="oasis-divider"></div>
-
-        <!-- ===== 右侧：OASIS 讨论面板 ===== -->
-        <div class="oasis-panel collapsed-panel bg-white border-l border-gray-200 flex flex-col h-screen" id="oasis-panel">
-            <!-- Collapsed state expand button -->
-            <div class="oasis-expand-btn items-center justify-center h-full text-gray-400 hover:text-blue-600 cursor-pointer text-sm font-bold" onclick="toggleOasisPanel()">
-                🏛️ O A S I S
-            </div>
-
-            <!-- Panel content -->
-            <div class="oasis-content flex flex-col h-full">
-                <!-- Header -->
-                <div class="p-3 border-b bg-gradient-to-r from-purple-50 to-blue-50 flex items-center justify-between flex-shrink-0">
-                    <div class="flex items-center space-x-2">
-                        <span class="text-lg">🏛️</span>
-                        <div>
-                            <h2 class="text-sm font-bold text-gray-800" data-i18n="oasis_title">OASIS 讨论论坛</h2>
-                            <p class="text-[10px] text-gray-500" data-i18n="oasis_subtitle">多专家并行讨论系统</p>
-                        </div>
-                    </div>
-                    <div class="flex items-center space-x-1">
-                        <button onclick="refreshOasisTopics()" class="text-gray-400 hover:text-blue-600 p-1 rounded transition-colors" data-i18n-title="refresh" title="刷新">🔄</button>
-                        <button onclick="toggleOasisPanel()" class="text-gray-400 hover:text-red-500 p-1 rounded transition-colors" data-i18n-title="collapse" title="收起">✕</button>
-                    </div>
-                </div>
-
-                <!-- Topic list view -->
-                <div id="oasis-topic-list-view" class="flex flex-col flex-1 overflow-hidden">
-                    <div class="p-3 border-b flex-shrink-0">
-                        <div class="flex items-center justify-between">
-                            <span class="text-xs font-semibold text-gray-600" data-i18n="oasis_topics">📋 讨论话题</span>
-                            <span id="oasis-topic-count" class="text-[10px] text-gray-400"></span>
-                        </div>
-                    </div>
-                    <div id="oasis-topic-list" class="flex-1 overflow-y-auto">
-                        <div class="p-6 text-center text-gray-400 text-sm">
-                            <div class="text-3xl mb-2">🏛️</div>
-                            <p data-i18n="oasis_no_topics">暂无讨论话题</p>
-                            <p class="text-xs mt-1" data-i18n="oasis_start_hint">在聊天中让 Agent 发起 OASIS 讨论</p>
-                        </div>
-                    </div>
-                </div>
-
-                <!-- Topic detail view (hidden by default) -->
-                <div id="oasis-detail-view" class="flex flex-col flex-1 overflow-hidden" style="display:none;">
-                    <!-- Detail header -->
-                    <div class="p-3 border-b flex-shrink-0">
-                        <div class="flex items-center space-x-2">
-                            <button onclick="showOasisTopicList()" class="text-gray-400 hover:text-blue-600 text-sm" data-i18n="oasis_back">← 返回</button>
-                            <span id="oasis-detail-status" class="oasis-status-badge"></span>
-                            <span id="oasis-detail-round" class="text-[10px] text-gray-400"></span>
-                        </div>
-                        <p id="oasis-detail-question" class="text-sm font-semibold text-gray-800 mt-1 line-clamp-2"></p>
-                    </div>
-
-                    <!-- Posts stream -->
-                    <div id="oasis-posts-box" class="oasis-discussion-box flex-1 p-3 space-y-3 bg-gray-50">
-                        <!-- Posts will be injected here -->
-                    </div>
-
-                    <!-- Conclusion area -->
-                    <div id="oasis-conclusion-area" class="p-3 border-t flex-shrink-0" style="display:none;">
-                        <div class="oasis-conclusion-box">
-                            <div class="flex items-center space-x-1 mb-2">
-                                <span class="text-sm">🏆</span>
-                                <span class="text-xs font-bold text-green-800" data-i18n="oasis_conclusion">讨论结论</span>
-                            </div>
-                            <p id="oasis-conclusion-text" class="text-xs text-gray-700 leading-relaxed"></p>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        // ===== i18n 国际化配置 =====
-        const i18n = {
-            'zh-CN': {
-                // 通用
-                loading: '加载中...',
-                error: '错误',
-                success: '成功',
-                cancel: '取消',
-                confirm: '确认',
-                close: '关闭',
-                
-                // 登录页
-                login_title: 'Xavier AnyControl',
-                login_subtitle: '请登录以开始对话',
-                username: '用户名',
-                password: '密码',
-                login_btn: '登录',
-                login_verifying: '验证中...',
-                login_error_invalid: '用户名只能包含字母、数字、下划线、短横线或中文',
-                login_error_failed: '登录失败',
-                login_error_network: '网络错误',
-                login_footer: '身份验证后方可使用，对话和文件按用户隔离',
-                
-                // 头部
-                encrypted: '● 已加密',
-                history: '📋历史',
-                new_chat: '+新',
-                new_chat_mobile: '+',
-                logout: '退出',
-                current_session: '当前对话号',
-                more_actions: '更多操作',
-                
-                // 移动端菜单
-                menu_history: '📋 历史对话',
-                menu_new: '➕ 新对话',
-                menu_oasis: '🏛️ OASIS',
-                menu_logout: '🚪 退出',
-                
-                // 聊天区域
-                welcome_message: '你好！我是 Xavier 智能助手。我已经准备好为你服务，请输入你的指令。',
-                new_session_message: '🆕 已开启新对话。我是 Xavier 智能助手，请输入你的指令。',
-                input_placeholder: '输入指令...（可粘贴图片/上传文件/录音）',
-                send_btn: '发送',
-                cancel_btn: '终止',
-                no_response: '（无响应）',
-                thinking_stopped: '⚠️ 已终止思考',
-                login_expired: '⚠️ 登录已过期，请重新登录',
-                agent_error: '❌ 错误',
-                
-                // 工具面板
-                available_tools: '🧰 可用工具',
-                tool_calling: '（调用工具中...）',
-                tool_return: '🔧 工具返回',
-                
-                // 文件上传
-                max_images: '最多上传5张图片',
-                max_files: '最多上传3个文件',
-                max_audios: '最多上传2个音频',
-                audio_too_large: '音频过大，上限 25MB',
-                pdf_too_large: 'PDF过大，上限 10MB',
-                file_too_large: '文件过大，上限 512KB',
-                unsupported_type: '不支持的文件类型',
-                supported_types: '支持: txt, md, csv, json, py, js, pdf, mp3, wav 等',
-                
-                // 录音
-                recording_title: '录音',
-                recording_stop: '点击停止录音',
-                mic_permission_denied: '无法访问麦克风，请检查浏览器权限设置。',
-                recording_too_long: '录音过长，上限 25MB',
-                
-                // 历史会话
-                history_title: '💬 历史对话',
-                history_loading: '加载中...',
-                history_empty: '暂无历史对话',
-                history_error: '加载失败',
-                history_loading_msg: '加载历史消息...',
-                history_no_msg: '（此对话暂无消息记录）',
-                new_session_confirm: '开启新对话？当前对话的历史记录将保留，可通过切回对话号恢复。',
-                messages_count: '条消息',
-                session_id: '对话号',
-                delete_session: '删除',
-                delete_session_confirm: '确定删除此对话？删除后不可恢复。',
-                delete_all_confirm: '确定删除所有对话记录？此操作不可恢复！',
-                delete_success: '删除成功',
-                delete_fail: '删除失败',
-                delete_all: '🗑️ 清空全部',
-                
-                // TTS
-                tts_read: '朗读',
-                tts_stop: '停止',
-                tts_loading: '加载中...',
-                tts_request_failed: 'TTS 请求失败',
-                code_omitted: '（代码省略）',
-                image_placeholder: '(图片)',
-                audio_placeholder: '(语音)',
-                file_placeholder: '(文件)',
-                
-                // OASIS
-                oasis_title: 'OASIS 讨论论坛',
-                oasis_subtitle: '多专家并行讨论系统',
-                oasis_topics: '📋 讨论话题',
-                oasis_topics_count: '个话题',
-                oasis_no_topics: '暂无讨论话题',
-                oasis_start_hint: '在聊天中让 Agent 发起 OASIS 讨论',
-                oasis_back: '← 返回',
-                oasis_conclusion: '讨论结论',
-                oasis_waiting: '等待专家发言...',
-                oasis_status_pending: '等待中',
-                oasis_status_discussing: '讨论中',
-                oasis_status_concluded: '已完成',
-                oasis_status_error: '出错',
-                oasis_round: '轮',
-                oasis_posts: '帖',
-                oasis_expert_creative: '创意专家',
-                oasis_expert_critical: '批判专家',
-                oasis_expert_data: '数据分析师',
-                oasis_expert_synthesis: '综合顾问',
-                
-                // 离线提示
-                offline_banner: '⚠️ 网络已断开，请检查连接',
-                
-                // 其他
-                splash_subtitle: 'Xavier AI Agent',
-                secure_footer: 'Secured by Nginx Reverse Proxy & SSH Tunnel',
-                refresh: '刷新',
-                collapse: '收起',
-            },
-            'en': {
-                // General
-                loading: 'Loading...',
-                error: 'Error',
-                success: 'Success',
-                cancel: 'Cancel',
-                confirm: 'Confirm',
-                close: 'Close',
-                
-                // Login
-                login_title: 'Xavier AnyControl',
-                login_subtitle: 'Please login to start',
-                username: 'Username',
-                password: 'Password',
-                login_btn: 'Login',
-                login_verifying: 'Verifying...',
-                login_error_invalid: 'Username can only contain letters, numbers, underscore, hyphen or Chinese',
-                login_error_failed: 'Login failed',
-                login_error_network: 'Network error',
-                login_footer: 'Authentication required. Conversations and files are isolated by user',
-                
-                // Header
-                encrypted: '● Encrypted',
-                history: '📋 History',
-                new_chat: '+New',
-                new_chat_mobile: '+',
-                logout: 'Logout',
-                current_session: 'Current session',
-                more_actions: 'More actions',
-                
-                // Mobile menu
-                menu_history: '📋 History',
-                menu_new: '➕ New Chat',
-                menu_oasis: '🏛️ OASIS',
-                menu_logout: '🚪 Logout',
-                
-                // Chat area
-                welcome_message: 'Hello! I am Xavier AI Assistant. Ready to serve you. Please enter your instructions.',
-                new_session_message: '🆕 New conversation started. I am Xavier AI Assistant. Please enter your instructions.',
-                input_placeholder: 'Enter command... (paste images/upload files/record audio)',
-                send_btn: 'Send',
-                cancel_btn: 'Stop',
-                no_response: '(No response)',
-                thinking_stopped: '⚠️ Thinking stopped',
-                login_expired: '⚠️ Session expired, please login again',
-                agent_error: '❌ Error',
-                
-                // Tool panel
-                available_tools: '🧰 Available Tools',
-                tool_calling: '(Calling tool...)',
-                tool_return: '🔧 Tool Return',
-                
-                // File upload
-                max_images: 'Maximum 5 images',
-                max_files: 'Maximum 3 files',
-                max_audios: 'Maximum 2 audio files',
-                audio_too_large: 'Audio too large, limit 25MB',
-                pdf_too_large: 'PDF too large, limit 10MB',
-                file_too_large: 'File too large, limit 512KB',
-                unsupported_type: 'Unsupported file type',
-                supported_types: 'Supported: txt, md, csv, json, py, js, pdf, mp3, wav, etc.',
-                
-                // Recording
-                recording_title: 'Record',
-                recording_stop: 'Click to stop recording',
-                mic_permission_denied: 'Cannot access microphone. Please check browser permissions.',
-                recording_too_long: 'Recording too long, limit 25MB',
-                
-                // History sessions
-                history_title: '💬 History',
-                history_loading: 'Loading...',
-                history_empty: 'No history',
-                history_error: 'Failed to load',
-                history_loading_msg: 'Loading messages...',
-                history_no_msg: '(No messages in this conversation)',
-                new_session_confirm: 'Start new conversation? Current history will be preserved.',
-                messages_count: 'messages',
-                session_id: 'Session',
-                delete_session: 'Delete',
-                delete_session_confirm: 'Delete this conversation? This cannot be undone.',
-                delete_all_confirm: 'Delete ALL conversations? This cannot be undone!',
-                delete_success: 'Deleted',
-                delete_fail: 'Delete failed',
-                delete_all: '🗑️ Clear All',
-                
-                // TTS
-                tts_read: 'Read',
-                tts_stop: 'Stop',
-                tts_loading: 'Loading...',
-                tts_request_failed: 'TTS request failed',
-                code_omitted: '(code omitted)',
-                image_placeholder: '(image)',
-                audio_placeholder: '(audio)',
-                file_placeholder: '(file)',
-                
-                // OASIS
-                oasis_title: 'OASIS Discussion Forum',
-                oasis_subtitle: 'Multi-Expert Parallel Discussion System',
-                oasis_topics: '📋 Discussion Topics',
-                oasis_topics_count: 'topics',
-                oasis_no_topics: 'No discussion topics',
-                oasis_start_hint: 'Ask Agent to start an OASIS discussion in chat',
-                oasis_back: '← Back',
-                oasis_conclusion: 'Conclusion',
-                oasis_waiting: 'Waiting for experts...',
-                oasis_status_pending: 'Pending',
-                oasis_status_discussing: 'Discussing',
-                oasis_status_concluded: 'Completed',
-                oasis_status_error: 'Error',
-                oasis_round: 'rounds',
-                oasis_posts: 'posts',
-                oasis_expert_creative: 'Creative Expert',
-                oasis_expert_critical: 'Critical Expert',
-                oasis_expert_data: 'Data Analyst',
-                oasis_expert_synthesis: 'Synthesis Advisor',
-                
-                // Offline
-                offline_banner: '⚠️ Network disconnected, please check connection',
-                
-                // Others
-                splash_subtitle: 'Xavier AI Agent',
-                secure_footer: 'Secured by Nginx Reverse Proxy & SSH Tunnel',
-                refresh: 'Refresh',
-                collapse: 'Collapse',
-            }
-        };
-        
-        // 当前语言
-        let currentLang = localStorage.getItem('lang') || 'zh-CN';
-        // 确保语言值有效
-        if (!i18n[currentLang]) { currentLang = 'zh-CN'; localStorage.setItem('lang', 'zh-CN'); }
-        
-        // 获取翻译文本
-        function t(key) {
-            return (i18n[currentLang] && i18n[currentLang][key]) || i18n['zh-CN'][key] || key;
-        }
-        
-        // 切换语言
-        function toggleLanguage() {
-            currentLang = currentLang === 'zh-CN' ? 'en' : 'zh-CN';
-            localStorage.setItem('lang', currentLang);
-            document.documentElement.lang = currentLang;
-            applyTranslations();
-        }
-        
-        // 应用翻译到页面
-        function applyTranslations() {
-            // 更新语言按钮显示
-            const langBtn = document.getElementById('lang-toggle-btn');
-            if (langBtn) {
-                langBtn.textContent = currentLang === 'zh-CN' ? 'EN' : '中文';
-            }
-            
-            // 更新 data-i18n 属性的元素
-            document.querySelectorAll('[data-i18n]').forEach(el => {
-                const key = el.getAttribute('data-i18n');
-                if (el.tagName === 'INPUT' && el.hasAttribute('placeholder')) {
-                    el.placeholder = t(key);
-                } else if (el.tagName === 'TEXTAREA' && el.hasAttribute('placeholder')) {
-                    el.placeholder = t(key);
-                } else {
-                    el.textContent = t(key);
-                }
-            });
-            
-            // 更新 data-i18n-placeholder 属性
-            document.querySelectorAll('[data-i18n-placeholder]').forEach(el => {
-                el.placeholder = t(el.getAttribute('data-i18n-placeholder'));
-            });
-            
-            // 更新 title
-            document.title = 'Xavier AnyControl | AI Agent';
-        }
-        
-        marked.setOptions({
-            highlight: function(code, lang) {
-                const language = hljs.getLanguage(lang) ? lang : 'plaintext';
-                return hljs.highlight(code, { language }).value;
-            },
-            langPrefix: 'hljs language-'
-        });
-
-        let currentUserId = null;
-        let currentSessionId = null;
-        let currentAbortController = null;
-        let pendingImages = []; // [{base64: "data:image/...", name: "file.jpg"}, ...]
-        let pendingFiles = [];  // [{name: "data.csv", content: "...(text content)"}, ...]
-        let pendingAudios = []; // [{base64: "data:audio/...", name: "recording.wav", format: "wav"}, ...]
-        let isRecording = false;
-
-        // OpenAI API 配置
-        function getAuthToken() { return sessionStorage.getItem('authToken') || ''; }
-        const TEXT_EXTENSIONS = new Set(['.txt','.md','.csv','.json','.xml','.yaml','.yml','.log','.py','.js','.ts','.html','.css','.java','.c','.cpp','.h','.go','.rs','.sh','.bat','.ini','.toml','.cfg','.conf','.sql','.r','.rb']);
-        const AUDIO_EXTENSIONS = new Set(['.mp3','.wav','.ogg','.m4a','.webm','.flac','.aac']);
-        const MAX_FILE_SIZE = 512 * 1024; // 512KB per text file
-        const MAX_PDF_SIZE = 10 * 1024 * 1024; // 10MB per PDF
-        const MAX_AUDIO_SIZE = 25 * 1024 * 1024; // 25MB per audio
-        const MAX_IMAGE_SIZE = 10 * 1024 * 1024; // 压缩目标：10MB
-        const MAX_IMAGE_DIMENSION = 2048; // 最大边长
-
-        function compressImage(file) {
-            return new Promise((resolve) => {
-                const img = new Image();
-                img.onload = () => {
-                    let { width, height } = img;
-                    if (width > MAX_IMAGE_DIMENSION || height > MAX_IMAGE_DIMENSION) {
-                        const scale = MAX_IMAGE_DIMENSION / Math.max(width, height);
-                        width = Math.round(width * scale);
-                        height = Math.round(height * scale);
-                    }
-                    const canvas = document.createElement('canvas');
-                    canvas.width = width;
-                    canvas.height = height;
-                    const ctx = canvas.getContext('2d');
-                    ctx.drawImage(img, 0, 0, width, height);
-                    let quality = 0.85;
-                    let result = canvas.toDataURL('image/jpeg', quality);
-                    while (result.length > MAX_IMAGE_SIZE * 1.37 && quality > 0.3) {
-                        quality -= 0.1;
-                        result = canvas.toDataURL('image/jpeg', quality);
-                    }
-                    resolve(result);
-                };
-                img.src = URL.createObjectURL(file);
-            });
-        }
-
-        // ===== File Upload Logic (images + text files + PDF + audio) =====
-        function handleFileSelect(event) {
-            const files = event.target.files;
-            if (!files.length) return;
-            for (const file of files) {
-                if (file.type.startsWith('image/')) {
-                    if (pendingImages.length >= 5) { alert(t('max_images')); break; }
-                    if (file.size <= MAX_IMAGE_SIZE) {
-                        const reader = new FileReader();
-                        reader.onload = (e) => {
-                            pendingImages.push({ base64: e.target.result, name: file.name });
-                            renderImagePreviews();
-                        };
-                        reader.readAsDataURL(file);
-                    } else {
-                        compressImage(file).then((compressed) => {
-                            pendingImages.push({ base64: compressed, name: file.name });
-                            renderImagePreviews();
-                        });
-                    }
-                } else if (file.type.startsWith('audio/') || AUDIO_EXTENSIONS.has('.' + file.name.split('.').pop().toLowerCase())) {
-                    if (file.size > MAX_AUDIO_SIZE) { alert(`${file.name}: ${t('audio_too_large')} (${(file.size/1024/1024).toFixed(1)}MB)`); continue; }
-                    if (pendingAudios.length >= 2) { alert(t('max_audios')); break; }
-                    const ext = file.name.split('.').pop().toLowerCase();
-                    const fmt = ({'mp3':'mp3','wav':'wav','ogg':'ogg','m4a':'m4a','webm':'webm','flac':'flac','aac':'aac'})[ext] || 'mp3';
-                    const reader = new FileReader();
-                    reader.onload = (e) => {
-                        pendingAudios.push({ base64: e.target.result, name: file.name, format: fmt });
-                        renderAudioPreviews();
-                    };
-                    reader.readAsDataURL(file);
-                } else if (file.name.toLowerCase().endsWith('.pdf') || file.type === 'application/pdf') {
-                    if (file.size > MAX_PDF_SIZE) { alert(`${file.name}: ${t('pdf_too_large')} (${(file.size/1024/1024).toFixed(1)}MB)`); continue; }
-                    if (pendingFiles.length >= 3) { alert(t('max_files')); break; }
-                    const reader = new FileReader();
-                    reader.onload = (e) => {
-                        pendingFiles.push({ name: file.name, content: e.target.result, type: 'pdf' });
-                        renderFilePreviews();
-                    };
-                    reader.readAsDataURL(file);
-                } else {
-                    const ext = '.' + file.name.split('.').pop().toLowerCase();
-                    if (!TEXT_EXTENSIONS.has(ext)) { alert(`${t('unsupported_type')}: ${ext}\\n${t('supported_types')}`); continue; }
-                    if (file.size > MAX_FILE_SIZE) { alert(`${file.name}: ${t('file_too_large')} (${(file.size/1024).toFixed(0)}KB)`); continue; }
-                    if (pendingFiles.length >= 3) { alert(t('max_files')); break; }
-                    const reader = new FileReader();
-                    reader.onload = (e) => {
-                        pendingFiles.push({ name: file.name, content: e.target.result, type: 'text' });
-                        renderFilePreviews();
-                    };
-                    reader.readAsText(file);
-                }
-            }
-            event.target.value = '';
-        }
-
-        // ===== Audio Recording =====
-        async function toggleRecording() {
-            if (isRecording) {
-                stopRecording();
-            } else {
-                await startRecording();
-            }
-        }
-
-        // --- WAV 编码辅助函数 ---
-        function encodeWAV(samples, sampleRate) {
-            const buffer = new ArrayBuffer(44 + samples.length * 2);
-            const view = new DataView(buffer);
-            function writeString(offset, string) {
-                for (let i = 0; i < string.length; i++) view.setUint8(offset + i, string.charCodeAt(i));
-            }
-            writeString(0, 'RIFF');
-            view.setUint32(4, 36 + samples.length * 2, true);
-            writeString(8, 'WAVE');
-            writeString(12, 'fmt ');
-            view.setUint32(16, 16, true);
-            view.setUint16(20, 1, true); // PCM
-            view.setUint16(22, 1, true); // mono
-            view.setUint32(24, sampleRate, true);
-            view.setUint32(28, sampleRate * 2, true);
-            view.setUint16(32, 2, true);
-            view.setUint16(34, 16, true);
-            writeString(36, 'data');
-            view.setUint32(40, samples.length * 2, true);
-            for (let i = 0; i < samples.length; i++) {
-                const s = Math.max(-1, Math.min(1, samples[i]));
-                view.setInt16(44 + i * 2, s < 0 ? s * 0x8000 : s * 0x7FFF, true);
-            }
-            return new Blob([buffer], { type: 'audio/wav' });
-        }
-
-        let audioContext = null;
-        let audioSourceNode = null;
-        let audioProcessorNode = null;
-        let recordedSamples = [];
-
-        async function startRecording() {
-            try {
-                const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-                audioContext = new (window.AudioContext || window.webkitAudioContext)({ sampleRate: 16000 });
-                audioSourceNode = audioContext.createMediaStreamSource(stream);
-                audioProcessorNode = audioContext.createScriptProcessor(4096, 1, 1);
-                recordedSamples = [];
-                audioProcessorNode.onaudioprocess = (e) => {
-                    const data = e.inputBuffer.getChannelData(0);
-                    recordedSamples.push(new Float32Array(data));
-                };
-                audioSourceNode.connect(audioProcessorNode);
-                audioProcessorNode.connect(audioContext.destination);
-                isRecording = true;
-                document.getElementById('record-btn').classList.add('recording');
-                document.getElementById('record-btn').title = t('recording_stop');
-            } catch (err) {
-                alert(t('mic_permission_denied') + '\\n' + err.message);
-            }
-        }
-
-        function stopRecording() {
-            if (!audioContext) return;
-            const stream = audioSourceNode.mediaStream;
-            audioProcessorNode.disconnect();
-            audioSourceNode.disconnect();
-            stream.getTracks().forEach(t => t.stop());
-            // 合并所有采样
-            let totalLen = 0;
-            for (const chunk of recordedSamples) totalLen += chunk.length;
-            const merged = new Float32Array(totalLen);
-            let offset = 0;
-            for (const chunk of recordedSamples) { merged.set(chunk, offset); offset += chunk.length; }
-            const sampleRate = audioContext.sampleRate;
-            audioContext.close();
-            audioContext = null;
-            audioSourceNode = null;
-            audioProcessorNode = null;
-            recordedSamples = [];
-            isRecording = false;
-            document.getElementById('record-btn').classList.remove('recording');
-            document.getElementById('record-btn').title = t('recording_title');
-            const blob = encodeWAV(merged, sampleRate);
-            if (blob.size > MAX_AUDIO_SIZE) { alert(t('recording_too_long')); return; }
-            if (pendingAudios.length >= 2) { alert(t('max_audios')); return; }
-            const reader = new FileReader();
-            reader.onload = (e) => {
-                const ts = new Date().toLocaleTimeString(currentLang === 'zh-CN' ? 'zh-CN' : 'en-US', {hour:'2-digit',minute:'2-digit',second:'2-digit'});
-                const recName = currentLang === 'zh-CN' ? `录音_${ts}.wav` : `recording_${ts}.wav`;
-                pendingAudios.push({ base64: e.target.result, name: recName, format: 'wav' });
-                renderAudioPreviews();
-            };
-            reader.readAsDataURL(blob);
-        }
-
-        function removeAudio(index) {
-            pendingAudios.splice(index, 1);
-            renderAudioPreviews();
-        }
-
-        function renderAudioPreviews() {
-            const area = document.getElementById('audio-preview-area');
-            if (pendingAudios.length === 0) {
-                area.style.display = 'none';
-                area.innerHTML = '';
-                return;
-            }
-            area.style.display = 'flex';
-            area.innerHTML = pendingAudios.map((a, i) => `
-                <div class="audio-preview-item">
-                    <span class="file-icon">🎤</span>
-                    <span class="file-name" title="${escapeHtml(a.name)}">${escapeHtml(a.name)}</span>
-                    <button class="remove-btn" onclick="removeAudio(${i})">&times;</button>
-                </div>
-            `).join('');
-        }
-
-        function handlePasteImage(event) {
-            const items = event.clipboardData?.items;
-            if (!items) return;
-            for (const item of items) {
-                if (!item.type.startsWith('image/')) continue;
-                event.preventDefault();
-                if (pendingImages.length >= 5) { alert(t('max_images')); break; }
-                const file = item.getAsFile();
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    pendingImages.push({ base64: e.target.result, name: 'pasted_image.png' });
-                    renderImagePreviews();
-                };
-                reader.readAsDataURL(file);
-            }
-        }
-
-        function removeImage(index) {
-            pendingImages.splice(index, 1);
-            renderImagePreviews();
-        }
-
-        function removeFile(index) {
-            pendingFiles.splice(index, 1);
-            renderFilePreviews();
-        }
-
-        function renderImagePreviews() {
-            const area = document.getElementById('image-preview-area');
-            if (pendingImages.length === 0) {
-                area.style.display = 'none';
-                area.innerHTML = '';
-                return;
-            }
-            area.style.display = 'flex';
-            area.innerHTML = pendingImages.map((img, i) => `
-                <div class="image-preview-item">
-                    <img src="${img.base64}" alt="${img.name}">
-                    <button class="remove-btn" onclick="removeImage(${i})">&times;</button>
-                </div>
-            `).join('');
-        }
-
-        function renderFilePreviews() {
-            const area = document.getElementById('file-preview-area');
-            if (pendingFiles.length === 0) {
-                area.style.display = 'none';
-                area.innerHTML = '';
-                return;
-            }
-            area.style.display = 'flex';
-            area.innerHTML = pendingFiles.map((f, i) => `
-                <div class="file-preview-item">
-                    <span class="file-icon">📄</span>
-                    <span class="file-name" title="${escapeHtml(f.name)}">${escapeHtml(f.name)}</span>
-                    <button class="remove-btn" onclick="removeFile(${i})">&times;</button>
-                </div>
-            `).join('');
-        }
-
-        // ===== Session (conversation) ID management =====
-        function generateSessionId() {
-            return Date.now().toString(36) + Math.random().toString(36).substr(2, 4);
-        }
-
-        function initSession() {
-            let saved = sessionStorage.getItem('sessionId');
-            if (!saved) {
-                saved = generateSessionId();
-                sessionStorage.setItem('sessionId', saved);
-            }
-            currentSessionId = saved;
-            updateSessionDisplay();
-        }
-
-        function updateSessionDisplay() {
-            const el = document.getElementById('session-display');
-            if (el && currentSessionId) {
-                el.textContent = '#' + currentSessionId.slice(-6);
-                el.title = t('session_id') + ': ' + currentSessionId;
-            }
-        }
-
-        function handleNewSession() {
-            if (!confirm(t('new_session_confirm'))) return;
-            currentSessionId = generateSessionId();
-            sessionStorage.setItem('sessionId', currentSessionId);
-            updateSessionDisplay();
-            // Clear chat box for new conversation
-            const chatBox = document.getElementById('chat-box');
-            chatBox.innerHTML = `
-                <div class="flex justify-start">
-                    <div class="message-agent bg-white border p-4 max-w-[85%] shadow-sm text-gray-700">
-                        ${t('new_session_message')}
-                    </div>
-                </div>`;
-        }
-
-        // ===== 历史会话侧边栏 =====
-        let sessionSidebarOpen = false;
-
-        function toggleSessionSidebar() {
-            if (sessionSidebarOpen) { closeSessionSidebar(); } else { openSessionSidebar(); }
-        }
-
-        async function openSessionSidebar() {
-            const sidebar = document.getElementById('session-sidebar');
-            sidebar.style.display = 'flex';
-            sessionSidebarOpen = true;
-            // 移动端加遮罩
-            if (window.innerWidth <= 768) {
-                let overlay = document.getElementById('session-overlay');
-                if (!overlay) {
-                    overlay = document.createElement('div');
-                    overlay.id = 'session-overlay';
-                    overlay.className = 'session-overlay';
-                    overlay.onclick = closeSessionSidebar;
-                    sidebar.parentElement.appendChild(overlay);
-                }
-                overlay.style.display = 'block';
-            }
-            await loadSessionList();
-        }
-
-        function closeSessionSidebar() {
-            document.getElementById('session-sidebar').style.display = 'none';
-            const overlay = document.getElementById('session-overlay');
-            if (overlay) overlay.style.display = 'none';
-            sessionSidebarOpen = false;
-        }
-
-        async function loadSessionList() {
-            const listEl = document.getElementById('session-list');
-            listEl.innerHTML = `<div class="text-xs text-gray-400 text-center py-4">${t('loading')}</div>`;
-            try {
-                const resp = await fetch('/proxy_sessions');
-                const data = await resp.json();
-                if (!data.sessions || data.sessions.length === 0) {
-                    listEl.innerHTML = `<div class="text-xs text-gray-400 text-center py-4">${t('history_empty')}</div>`;
-                    return;
-                }
-                listEl.innerHTML = '';
-                // 按 session_id 倒序（新的在前）
-                data.sessions.sort((a, b) => b.session_id.localeCompare(a.session_id));
-                for (const s of data.sessions) {
-                    const isActive = s.session_id === currentSessionId;
-                    const div = document.createElement('div');
-                    div.className = 'session-item' + (isActive ? ' active' : '');
-                    div.innerHTML = `
-                        <div class="session-title">${escapeHtml(s.title)}</div>
-                        <div class="session-meta">#${s.session_id.slice(-6)} · ${s.message_count}${t('messages_count')}</div>
-                        <button class="session-delete" onclick="event.stopPropagation(); deleteSession('${s.session_id}')">${t('delete_session')}</button>
-                    `;
-                    div.onclick = () => switchToSession(s.session_id);
-                    listEl.appendChild(div);
-                }
-            } catch (e) {
-                listEl.innerHTML = `<div class="text-xs text-red-400 text-center py-4">${t('history_error')}</div>`;
-            }
-        }
-
-        async function deleteSession(sessionId) {
-            if (!confirm(t('delete_session_confirm'))) return;
-            try {
-                const resp = await fetch('/proxy_delete_session', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({ session_id: sessionId })
-                });
-                const data = await resp.json();
-                if (resp.ok && data.status === 'success') {
-                    // 如果删除的是当前会话，自动开一个新的
-                    if (sessionId === currentSessionId) {
-                        currentSessionId = generateSessionId();
-                        sessionStorage.setItem('sessionId', currentSessionId);
-                        updateSessionDisplay();
-                        document.getElementById('chat-box').innerHTML = `
-                            <div class="flex justify-start">
-                                <div class="message-agent bg-white border p-4 max-w-[85%] shadow-sm text-gray-700">
-                                    ${t('new_session_message')}
-                                </div>
-                            </div>`;
-                    }
-                    await loadSessionList();
-                } else {
-                    alert(t('delete_fail') + ': ' + (data.detail || data.error || ''));
-                }
-            } catch (e) {
-                alert(t('delete_fail') + ': ' + e.message);
-            }
-        }
-
-        async function deleteAllSessions() {
-            if (!confirm(t('delete_all_confirm'))) return;
-            try {
-                const resp = await fetch('/proxy_delete_session', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({ session_id: '' })
-                });
-                const data = await resp.json();
-                if (resp.ok && data.status === 'success') {
-                    currentSessionId = generateSessionId();
-                    sessionStorage.setItem('sessionId', currentSessionId);
-                    updateSessionDisplay();
-                    document.getElementById('chat-box').innerHTML = `
-                        <div class="flex justify-start">
-                            <div class="message-agent bg-white border p-4 max-w-[85%] shadow-sm text-gray-700">
-                                ${t('new_session_message')}
-                            </div>
-                        </div>`;
-                    await loadSessionList();
-                } else {
-                    alert(t('delete_fail') + ': ' + (data.detail || data.error || ''));
-                }
-            } catch (e) {
-                alert(t('delete_fail') + ': ' + e.message);
-            }
-        }
-
-        async function switchToSession(sessionId) {
-            if (sessionId === currentSessionId) { closeSessionSidebar(); return; }
-            currentSessionId = sessionId;
-            sessionStorage.setItem('sessionId', sessionId);
-            updateSessionDisplay();
-            closeSessionSidebar();
-
-            // 加载该会话的历史消息
-            const chatBox = document.getElementById('chat-box');
-            chatBox.innerHTML = `<div class="text-xs text-gray-400 text-center py-4">${t('history_loading_msg')}</div>`;
-
-            try {
-                const resp = await fetch('/proxy_session_history', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({ session_id: sessionId })
-                });
-                const data = await resp.json();
-                chatBox.innerHTML = '';
-
-                if (!data.messages || data.messages.length === 0) {
-                    chatBox.innerHTML = `
-                        <div class="flex justify-start">
-                            <div class="message-agent bg-white border p-4 max-w-[85%] shadow-sm text-gray-700">
-                                ${t('history_no_msg')}
-                            </div>
-                        </div>`;
-                    return;
-                }
-
-                for (const msg of data.messages) {
-                    if (msg.role === 'user') {
-                        // 支持多模态历史消息（content 可能是 string 或 array）
-                        let textContent = '';
-                        let imagesHtml = '';
-                        if (typeof msg.content === 'string') {
-                            textContent = msg.content;
-                        } else if (Array.isArray(msg.content)) {
-                            for (const part of msg.content) {
-                                if (part.type === 'text') textContent = part.text || '';
-                                else if (part.type === 'image_url') {
-                                    imagesHtml += `<img src="${part.image_url.url}" class="chat-inline-image">`;
-                                }
-                            }
-                        }
-                        chatBox.innerHTML += `
-                            <div class="flex justify-end">
-                                <div class="message-user bg-blue-600 text-white p-4 max-w-[85%] shadow-sm">
-                                    ${imagesHtml}${imagesHtml ? '<div style="margin-top:6px">' : ''}${escapeHtml(textContent || '('+t('image_placeholder')+')')}${imagesHtml ? '</div>' : ''}
-                                </div>
-                            </div>`;
-                    } else if (msg.role === 'tool') {
-                        chatBox.innerHTML += `
-                            <div class="flex justify-start">
-                                <div class="bg-gray-100 border border-dashed border-gray-300 p-3 max-w-[85%] shadow-sm text-xs text-gray-500 rounded-lg">
-                                    <div class="font-semibold text-gray-600 mb-1">🔧 ${t('tool_return')}: ${escapeHtml(msg.tool_name || '')}</div>
-                                    <pre class="whitespace-pre-wrap break-words">${escapeHtml(msg.content.length > 500 ? msg.content.slice(0, 500) + '...' : msg.content)}</pre>
-                                </div>
-                            </div>`;
-                    } else {
-                        let toolCallsHtml = '';
-                        if (msg.tool_calls && msg.tool_calls.length > 0) {
-                            const callsList = msg.tool_calls.map(tc =>
-                                `<span class="inline-block bg-blue-100 text-blue-700 text-xs px-2 py-0.5 rounded mr-1 mb-1">🔧 ${escapeHtml(tc.name)}</span>`
-                            ).join('');
-                            toolCallsHtml = `<div class="mb-2">${callsList}</div>`;
-                        }
-                        chatBox.innerHTML += `
-                            <div class="flex justify-start">
-                                <div class="message-agent bg-white border p-4 max-w-[85%] shadow-sm text-gray-700 markdown-body" data-tts-ready="1">
-                                    ${toolCallsHtml}${msg.content ? marked.parse(msg.content) : '<span class="text-gray-400 text-xs">('+t('tool_calling')+')</span>'}
-                                </div>
-                            </div>`;
-                    }
-                }
-                // 为历史 AI 消息添加朗读按钮
-                chatBox.querySelectorAll('[data-tts-ready="1"]').forEach(div => {
-                    div.removeAttribute('data-tts-ready');
-                    const ttsBtn = createTtsButton(() => div.innerText || div.textContent || '');
-                    div.appendChild(ttsBtn);
-                });
-                // 高亮代码块
-                chatBox.querySelectorAll('pre code').forEach((block) => hljs.highlightElement(block));
-                chatBox.scrollTop = chatBox.scrollHeight;
-            } catch (e) {
-                chatBox.innerHTML = `
-                    <div class="text-xs text-red-400 text-center py-4">${t('history_error')}: ${e.message}</div>`;
-            }
-        }
-
-        // ===== 登录逻辑 =====
-        async function handleLogin() {
-            const nameInput = document.getElementById('username-input');
-            const pwInput = document.getElementById('password-input');
-            const errorDiv = document.getElementById('login-error');
-            const loginBtn = document.getElementById('login-btn');
-            const name = nameInput.value.trim();
-            const password = pwInput.value;
-
-            errorDiv.classList.add('hidden');
-
-            if (!name) { nameInput.focus(); return; }
-            if (!password) { pwInput.focus(); return; }
-
-            if (!/^[a-zA-Z0-9_\\-\\u4e00-\\u9fa5]+$/.test(name)) {
-                errorDiv.textContent = t('login_error_invalid');
-                errorDiv.classList.remove('hidden');
-                return;
-            }
-
-            loginBtn.disabled = true;
-            loginBtn.textContent = t('login_verifying');
-
-            try {
-                const resp = await fetch("/proxy_login", {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ user_id: name, password: password })
-                });
-                const data = await resp.json();
-                if (!resp.ok) {
-                    errorDiv.textContent = data.detail || data.error || t('login_error_failed');
-                    errorDiv.classList.remove('hidden');
-                    return;
-                }
-
-                currentUserId = name;
-                sessionStorage.setItem('userId', name);
-                // 存储 OpenAI 格式的 Bearer token: user_id:password
-                const authToken = name + ':' + password;
-                sessionStorage.setItem('authToken', authToken);
-                initSession();
-
-                document.getElementById('uid-display').textContent = 'UID: ' + name;
-                document.getElementById('login-screen').style.display = 'none';
-                document.getElementById('chat-screen').style.display = 'flex';
-                document.getElementById('user-input').focus();
-                loadTools();
-                refreshOasisTopics(); // Load OASIS topics after login
-            } catch (e) {
-                errorDiv.textContent = t('login_error_network') + ': ' + e.message;
-                errorDiv.classList.remove('hidden');
-            } finally {
-                loginBtn.disabled = false;
-                loginBtn.textContent = t('login_btn');
-            }
-        }
-
-        function handleLogout() {
-            currentUserId = null;
-            currentSessionId = null;
-            sessionStorage.removeItem('userId');
-            sessionStorage.removeItem('authToken');
-            sessionStorage.removeItem('sessionId');
-            fetch("/proxy_logout", { method: 'POST' });
-            document.getElementById('chat-screen').style.display = 'none';
-            document.getElementById('login-screen').style.display = 'flex';
-            document.getElementById('username-input').value = '';
-            document.getElementById('password-input').value = '';
-            document.getElementById('login-error').classList.add('hidden');
-            document.getElementById('username-input').focus();
-            const chatBox = document.getElementById('chat-box');
-            chatBox.innerHTML = `
-                <div class="flex justify-start">
-                    <div class="message-agent bg-white border p-4 max-w-[85%] shadow-sm text-gray-700">
-                        ${t('welcome_message')}
-                    </div>
-                </div>`;
-            // Stop OASIS polling
-            stopOasisPolling();
-        }
-
-        // ===== Tool Panel 逻辑 =====
-        let toolPanelOpen = false;
-        let allTools = [];
-        let enabledToolSet = new Set();
-
-        function toggleToolPanel() {
-            const panel = document.getElementById('tool-panel');
-            const icon = document.getElementById('tool-toggle-icon');
-            toolPanelOpen = !toolPanelOpen;
-            if (toolPanelOpen) {
-                panel.classList.remove('collapsed');
-                panel.classList.add('expanded');
-                icon.classList.add('open');
-            } else {
-                panel.classList.remove('expanded');
-                panel.classList.add('collapsed');
-                icon.classList.remove('open');
-            }
-        }
-
-        function updateToolCount() {
-            const toolCount = document.getElementById('tool-count');
-            toolCount.textContent = '(' + enabledToolSet.size + '/' + allTools.length + ')';
-        }
-
-        function toggleTool(name, tagEl) {
-            if (enabledToolSet.has(name)) {
-                enabledToolSet.delete(name);
-                tagEl.classList.remove('enabled');
-                tagEl.classList.add('disabled');
-            } else {
-                enabledToolSet.add(name);
-                tagEl.classList.remove('disabled');
-                tagEl.classList.add('enabled');
-            }
-            updateToolCount();
-        }
-
-        function getEnabledTools() {
-            if (enabledToolSet.size === allTools.length) return null;
-            return Array.from(enabledToolSet);
-        }
-
-        async function loadTools() {
-            try {
-                const resp = await fetch('/proxy_tools');
-                if (!resp.ok) return;
-                const data = await resp.json();
-                const tools = data.tools || [];
-                const toolList = document.getElementById('tool-list');
-                const wrapper = document.getElementById('tool-panel-wrapper');
-
-                if (tools.length === 0) {
-                    wrapper.style.display = 'none';
-                    return;
-                }
-
-                allTools = tools;
-                enabledToolSet = new Set(tools.map(t => t.name));
-                toolList.innerHTML = '';
-                tools.forEach(t => {
-                    const tag = document.createElement('span');
-                    tag.className = 'tool-tag enabled';
-                    tag.title = t.description || '';
-                    tag.textContent = t.name;
-                    tag.onclick = () => toggleTool(t.name, tag);
-                    toolList.appendChild(tag);
-                });
-                updateToolCount();
-                wrapper.style.display = 'block';
-            } catch (e) {
-                console.warn('Failed to load tools:', e);
-            }
-        }
-
-        // Session check
-        (function checkSession() {
-            // 初始化语言
-            document.documentElement.lang = currentLang;
-            applyTranslations();
-            
-            const saved = sessionStorage.getItem('userId');
-            if (saved) {
-                currentUserId = saved;
-                initSession();
-                document.getElementById('uid-display').textContent = 'UID: ' + saved;
-                document.getElementById('login-screen').style.display = 'none';
-                document.getElementById('chat-screen').style.display = 'flex';
-                loadTools();
-                refreshOasisTopics();
-            }
-        })();
-
-        // Login input handlers
-        document.getElementById('username-input').addEventListener('keydown', (e) => {
-            if (e.key === 'Enter') { e.preventDefault(); document.getElementById('password-input').focus(); }
-        });
-        document.getElementById('password-input').addEventListener('keydown', (e) => {
-            if (e.key === 'Enter') { e.preventDefault(); handleLogin(); }
-        });
-
-        // ===== 聊天逻辑 =====
-        const chatBox = document.getElementById('chat-box');
-        const inputField = document.getElementById('user-input');
-        const sendBtn = document.getElementById('send-btn');
-        const cancelBtn = document.getElementById('cancel-btn');
-
-        function setStreamingUI(streaming) {
-            if (streaming) {
-                sendBtn.style.display = 'none';
-                cancelBtn.style.display = 'inline-block';
-                inputField.disabled = true;
-            } else {
-                sendBtn.style.display = 'inline-block';
-                cancelBtn.style.display = 'none';
-                sendBtn.disabled = false;
-                inputField.disabled = false;
-            }
-        }
-
-        async function handleCancel() {
-            if (currentAbortController) {
-                currentAbortController.abort();
-                currentAbortController = null;
-            }
-            try {
-                await fetch("/proxy_cancel", {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({ session_id: currentSessionId })
-                });
-            } catch(e) { /* ignore */ }
-        }
-
-        // ===== TTS 朗读功能 =====
-        let currentTtsAudio = null;
-        let currentTtsBtn = null;
-
-        function stripMarkdownForTTS(md) {
-            // 移除代码块（含内容）
-            let text = md.replace(/```[\\s\\S]*?```/g, '('+t('code_omitted')+')');
-            // 移除行内代码
-            text = text.replace(/`[^`]+`/g, '');
-            // 移除图片
-            text = text.replace(/!\\[.*?\\]\\(.*?\\)/g, '');
-            // 移除链接，保留文字
-            text = text.replace(/\\[([^\\]]+)\\]\\(.*?\\)/g, '$1');
-            // 移除标题标记
-            text = text.replace(/^#{1,6}\\s+/gm, '');
-            // 移除粗体/斜体标记
-            text = text.replace(/\\*{1,3}([^*]+)\\*{1,3}/g, '$1');
-            // 移除工具调用提示行
-            text = text.replace(/.*🔧.*调用工具.*\\n?/g, '');
-            text = text.replace(/.*✅.*工具执行完成.*\\n?/g, '');
-            // 清理多余空行
-            text = text.replace(/\\n{3,}/g, '\\n\\n').trim();
-            return text;
-        }
-
-        function stopTtsPlayback() {
-            if (currentTtsAudio) {
-                currentTtsAudio.pause();
-                currentTtsAudio.src = '';
-                currentTtsAudio = null;
-            }
-            if (currentTtsBtn) {
-                currentTtsBtn.classList.remove('playing', 'loading');
-                currentTtsBtn.querySelector('.tts-label').textContent = t('tts_read');
-                currentTtsBtn = null;
-            }
-        }
-
-        async function handleTTS(btn, text) {
-            // 如果点击的是正在播放的按钮，则停止
-            if (btn === currentTtsBtn && currentTtsAudio) {
-                stopTtsPlayback();
-                return;
-            }
-            // 停止上一个播放
-            stopTtsPlayback();
-
-            const cleanText = stripMarkdownForTTS(text);
-            if (!cleanText) return;
-
-            currentTtsBtn = btn;
-            btn.classList.add('loading');
-            btn.querySelector('.tts-label').textContent = t('tts_loading');
-
-            try {
-                const resp = await fetch('/proxy_tts', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ text: cleanText })
-                });
-                if (!resp.ok) throw new Error(t('tts_request_failed'));
-
-                const blob = await resp.blob();
-                const url = URL.createObjectURL(blob);
-                const audio = new Audio(url);
-                currentTtsAudio = audio;
-
-                btn.classList.remove('loading');
-                btn.classList.add('playing');
-                btn.querySelector('.tts-label').textContent = t('tts_stop');
-
-                audio.onended = () => {
-                    URL.revokeObjectURL(url);
-                    stopTtsPlayback();
-                };
-                audio.onerror = () => {
-                    URL.revokeObjectURL(url);
-                    stopTtsPlayback();
-                };
-                audio.play();
-            } catch (e) {
-                console.error('TTS error:', e);
-                stopTtsPlayback();
-            }
-        }
-
-        function createTtsButton(textRef) {
-            const btn = document.createElement('div');
-            btn.className = 'tts-btn';
-            btn.innerHTML = `
-                <span class="tts-spinner"></span>
-                <svg class="tts-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
-                    <polygon points="11 5 6 9 2 9 2 15 6 15 11 19 11 5"></polygon>
-                    <path d="M15.54 8.46a5 5 0 0 1 0 7.07"></path>
-                    <path d="M19.07 4.93a10 10 0 0 1 0 14.14"></path>
-                </svg>
-                <span class="tts-label">${t('tts_read')}</span>`;
-            btn.onclick = () => handleTTS(btn, textRef());
-            return btn;
-        }
-
-        function appendMessage(content, isUser = false, images = [], fileNames = [], audioNames = []) {
-            const wrapper = document.createElement('div');
-            wrapper.className = `flex ${isUser ? 'justify-end' : 'justify-start'} animate-in fade-in duration-300`;
-            const div = document.createElement('div');
-            div.className = `p-4 max-w-[85%] shadow-sm ${isUser ? 'bg-blue-600 text-white message-user' : 'bg-white border text-gray-800 message-agent'}`;
-            if (isUser) {
-                let extraHtml = '';
-                if (images && images.length > 0) {
-                    extraHtml += images.map(src => `<img src="${src}" class="chat-inline-image">`).join('');
-                }
-                if (fileNames && fileNames.length > 0) {
-                    extraHtml += fileNames.map(n => `<div class="chat-file-tag">📄 ${escapeHtml(n)}</div>`).join('');
-                }
-                if (audioNames && audioNames.length > 0) {
-                    extraHtml += audioNames.map(n => `<div class="chat-audio-tag">🎤 ${escapeHtml(n)}</div>`).join('');
-                }
-                if (extraHtml) {
-                    div.innerHTML = extraHtml + '<div style="margin-top:6px">' + escapeHtml(content) + '</div>';
-                } else {
-                    div.innerText = content;
-                }
-            } else {
-                div.className += " markdown-body";
-                div.innerHTML = marked.parse(content);
-                div.querySelectorAll('pre code').forEach((block) => hljs.highlightElement(block));
-                // AI 消息添加朗读按钮（content 非空时）
-                if (content) {
-                    const ttsBtn = createTtsButton(() => div.innerText || div.textContent || '');
-                    div.appendChild(ttsBtn);
-                }
-            }
-            wrapper.appendChild(div);
-            chatBox.appendChild(wrapper);
-            chatBox.scrollTop = chatBox.scrollHeight;
-            return div;
-        }
-
-        function showTyping() {
-            const wrapper = document.createElement('div');
-            wrapper.id = 'typing-indicator';
-            wrapper.className = 'flex justify-start';
-            wrapper.innerHTML = `
-                <div class="message-agent bg-white border p-4 flex space-x-2 items-center shadow-sm">
-                    <div class="dot"></div><div class="dot"></div><div class="dot"></div>
-                </div>`;
-            chatBox.appendChild(wrapper);
-            chatBox.scrollTop = chatBox.scrollHeight;
-        }
-
-        async function handleSend() {
-            const text = inputField.value.trim();
-            if (!text && pendingImages.length === 0 && pendingFiles.length === 0 && pendingAudios.length === 0) return;
-            if (sendBtn.disabled) return;
-
-            // Stop recording if active
-            if (isRecording) stopRecording();
-
-            // Capture images, files, audios before clearing
-            const imagesToSend = pendingImages.map(img => img.base64);
-            const imagePreviewSrcs = [...imagesToSend];
-            const filesToSend = pendingFiles.map(f => ({ name: f.name, content: f.content, type: f.type }));
-            const fileNames = pendingFiles.map(f => f.name);
-            const audiosToSend = pendingAudios.map(a => ({ base64: a.base64, name: a.name, format: a.format }));
-            const audioNames = pendingAudios.map(a => a.name);
-
-            const label = text || (imagePreviewSrcs.length ? '('+t('image_placeholder')+')' : audioNames.length ? '('+t('audio_placeholder')+')' : '('+t('file_placeholder')+')');
-            appendMessage(label, true, imagePreviewSrcs, fileNames, audioNames);
-            inputField.value = '';
-            inputField.style.height = 'auto';
-            pendingImages = [];
-            pendingFiles = [];
-            pendingAudios = [];
-            renderImagePreviews();
-            renderFilePreviews();
-            renderAudioPreviews();
-            sendBtn.disabled = true;
-            showTyping();
-
-            currentAbortController = new AbortController();
-            setStreamingUI(true);
-
-            let agentDiv = null;
-            let fullText = '';
-
-            try {
-                // --- 构造 OpenAI 格式的 content parts ---
-                const contentParts = [];
-                if (text) {
-                    contentParts.push({ type: 'text', text: text });
-                }
-                // 图片 → image_url
-                for (const img of imagesToSend) {
-                    contentParts.push({ type: 'image_url', image_url: { url: img } });
-                }
-                // 音频 → input_audio
-                for (const audio of audiosToSend) {
-                    contentParts.push({
-                        type: 'input_audio',
-                        input_audio: { data: audio.base64, format: audio.format || 'webm' }
-                    });
-                }
-                // 文件 → file
-                for (const f of filesToSend) {
-                    const fileData = f.content.startsWith('data:') ? f.content : 'data:application/octet-stream;base64,' + f.content;
-                    contentParts.push({
-                        type: 'file',
-                        file: { filename: f.name, file_data: fileData }
-                    });
-                }
-
-                // 如果只有纯文本，content 用字符串；否则用 parts 数组
-                let msgContent;
-                if (contentParts.length === 1 && contentParts[0].type === 'text') {
-                    msgContent = contentParts[0].text;
-                } else if (contentParts.length > 0) {
-                    msgContent = contentParts;
-                } else {
-                    msgContent = '(空消息)';
-                }
-
-                // --- 构造 OpenAI /v1/chat/completions 请求 ---
-                const openaiPayload = {
-                    model: 'mini-timebot',
-                    messages: [{ role: 'user', content: msgContent }],
-                    stream: true,
-                    session_id: currentSessionId,
-                    enabled_tools: getEnabledTools(),
-                };
-
-                const response = await fetch("/v1/chat/completions", {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'Authorization': 'Bearer ' + getAuthToken()
-                    },
-                    body: JSON.stringify(openaiPayload),
-                    signal: currentAbortController.signal
-                });
-
-                const typingIndicator = document.getElementById('typing-indicator');
-                if (typingIndicator) typingIndicator.remove();
-
-                if (response.status === 401) {
-                    appendMessage(t('login_expired'), false);
-                    handleLogout();
-                    return;
-                }
-                if (!response.ok) throw new Error("Agent error");
-
-                agentDiv = appendMessage('', false);
-
-                // --- 解析 OpenAI SSE 流式响应 ---
-                const reader = response.body.getReader();
-                const decoder = new TextDecoder();
-                let buffer = '';
-
-                while (true) {
-                    const { done, value } = await reader.read();
-                    if (done) break;
-
-                    buffer += decoder.decode(value, { stream: true });
-                    const lines = buffer.split('\\n');
-                    buffer = lines.pop();
-
-                    for (const line of lines) {
-                        if (!line.startsWith('data: ')) continue;
-                        const data = line.slice(6).trim();
-                        if (data === '[DONE]') continue;
-
-                        try {
-                            const chunk = JSON.parse(data);
-                            const delta = chunk.choices && chunk.choices[0] && chunk.choices[0].delta;
-                            if (delta && delta.content) {
-                                fullText += delta.content;
-                                agentDiv.innerHTML = marked.parse(fullText);
-                                agentDiv.querySelectorAll('pre code').forEach((block) => {
-                                    if (!block.dataset.highlighted) {
-                                        hljs.highlightElement(block);
-                                        block.dataset.highlighted = 'true';
-                                    }
-                                });
-                                chatBox.scrollTop = chatBox.scrollHeight;
-                            }
-                        } catch(e) {
-                            // 跳过无法解析的 chunk
-                        }
-                    }
-                }
-
-                if (fullText) {
-                    agentDiv.innerHTML = marked.parse(fullText);
-                    agentDiv.querySelectorAll('pre code').forEach((block) => hljs.highlightElement(block));
-                    // 流式结束后添加朗读按钮
-                    const ttsBtn = createTtsButton(() => agentDiv.innerText || agentDiv.textContent || '');
-                    agentDiv.appendChild(ttsBtn);
-                    chatBox.scrollTop = chatBox.scrollHeight;
-                }
-
-                if (!fullText) {
-                    agentDiv.innerHTML = `<span class="text-gray-400">${t('no_response')}</span>`;
-                }
-
-                // After agent response, refresh OASIS topics (in case a new discussion was started)
-                setTimeout(() => refreshOasisTopics(), 1000);
-
-            } catch (error) {
-                const typingIndicator = document.getElementById('typing-indicator');
-                if (typingIndicator) typingIndicator.remove();
-                if (error.name === 'AbortError') {
-                    if (agentDiv) {
-                        fullText += '\\n\\n' + t('thinking_stopped');
-                        agentDiv.innerHTML = marked.parse(fullText);
-                    } else {
-                        appendMessage(t('thinking_stopped'), false);
-                    }
-                } else {
-                    appendMessage(t('agent_error') + ': ' + error.message, false);
-                }
-            } finally {
-                currentAbortController = null;
-                setStreamingUI(false);
-            }
-        }
-
-        inputField.addEventListener('input', function() {
-            this.style.height = 'auto';
-            this.style.height = (this.scrollHeight) + 'px';
-        });
-        inputField.addEventListener('keydown', (e) => {
-            if (e.key === 'Enter' && !e.shiftKey) { e.preventDefault(); handleSend(); }
-        });
-        inputField.addEventListener('paste', handlePasteImage);
-
-        // ================================================================
-        // ===== OASIS 讨论面板逻辑 =====
-        // ================================================================
-
-        let oasisPanelOpen = false;
-        let oasisCurrentTopicId = null;
-        let oasisPollingTimer = null;
-        let oasisStreamReader = null;
-
-        // Expert avatar mapping
-        const expertAvatars = {
-            [t('oasis_expert_creative')]: { cls: 'expert-creative', icon: '💡' },
-            [t('oasis_expert_critical')]: { cls: 'expert-critical', icon: '🔍' },
-            [t('oasis_expert_data')]: { cls: 'expert-data', icon: '📊' },
-            [t('oasis_expert_synthesis')]: { cls: 'expert-synthesis', icon: '🎯' },
-        };
-
-        function getExpertAvatar(name) {
-            return expertAvatars[name] || { cls: 'expert-default', icon: '🤖' };
-        }
-
-        function getStatusBadge(status) {
-            const map = {
-                'pending': { cls: 'oasis-status-pending', text: t('oasis_status_pending') },
-                'discussing': { cls: 'oasis-status-discussing', text: t('oasis_status_discussing') },
-                'concluded': { cls: 'oasis-status-concluded', text: t('oasis_status_concluded') },
-                'error': { cls: 'oasis-status-error', text: t('oasis_status_error') },
-            };
-            return map[status] || { cls: 'oasis-status-pending', text: status };
-        }
-
-        function formatTime(ts) {
-            const d = new Date(ts * 1000);
-            return d.toLocaleTimeString(currentLang === 'zh-CN' ? 'zh-CN' : 'en-US', { hour: '2-digit', minute: '2-digit' });
-        }
-
-        function toggleOasisPanel() {
-            const panel = document.getElementById('oasis-panel');
-            oasisPanelOpen = !oasisPanelOpen;
-            if (oasisPanelOpen) {
-                panel.classList.remove('collapsed-panel');
-                panel.classList.remove('mobile-open');
-                refreshOasisTopics();
-            } else {
-                panel.classList.add('collapsed-panel');
-                panel.classList.remove('mobile-open');
-                stopOasisPolling();
-            }
-        }
-
-        function toggleOasisMobile() {
-            const panel = document.getElementById('oasis-panel');
-            if (panel.classList.contains('mobile-open')) {
-                panel.classList.remove('mobile-open');
-                stopOasisPolling();
-            } else {
-                panel.classList.remove('collapsed-panel');
-                panel.classList.add('mobile-open');
-                refreshOasisTopics();
-            }
-        }
-
-        function toggleMobileMenu() {
-            const dd = document.getElementById('mobile-menu-dropdown');
-            if (dd.style.display === 'none') {
-                dd.style.display = 'block';
-                // close when tapping outside
-                setTimeout(() => document.addEventListener('click', closeMobileMenuOutside, { once: true }), 0);
-            } else {
-                dd.style.display = 'none';
-            }
-        }
-        function closeMobileMenu() {
-            document.getElementById('mobile-menu-dropdown').style.display = 'none';
-        }
-        function closeMobileMenuOutside(e) {
-            const wrapper = document.querySelector('.mobile-menu-wrapper');
-            if (!wrapper.contains(e.target)) closeMobileMenu();
-        }
-
-        function stopOasisPolling() {
-            if (oasisPollingTimer) {
-                clearInterval(oasisPollingTimer);
-                oasisPollingTimer = null;
-            }
-            if (oasisStreamReader) {
-                oasisStreamReader.cancel();
-                oasisStreamReader = null;
-            }
-        }
-
-        async function refreshOasisTopics() {
-            try {
-                const resp = await fetch('/proxy_oasis/topics');
-                console.log('[OASIS] Topics response status:', resp.status);
-                if (!resp.ok) {
-                    console.error('[OASIS] Failed to fetch topics:', resp.status);
-                    return;
-                }
-                const topics = await resp.json();
-                console.log('[OASIS] Topics data:', topics);
-                renderTopicList(topics);
-            } catch (e) {
-                console.error('[OASIS] Failed to load topics:', e);
-            }
-        }
-
-        function renderTopicList(topics) {
-            const container = document.getElementById('oasis-topic-list');
-            const countEl = document.getElementById('oasis-topic-count');
-            countEl.textContent = topics.length + ' ' + t('oasis_topics_count');
-
-            if (topics.length === 0) {
-                container.innerHTML = `
-                    <div class="p-6 text-center text-gray-400 text-sm">
-                        <div class="text-3xl mb-2">🏛️</div>
-                        <p>${t('oasis_no_topics')}</p>
-                        <p class="text-xs mt-1">${t('oasis_start_hint')}</p>
-                    </div>`;
-                return;
-            }
-
-            // Sort: discussing first, then by created_at desc
-            topics.sort((a, b) => {
-                if (a.status === 'discussing' && b.status !== 'discussing') return -1;
-                if (b.status === 'discussing' && a.status !== 'discussing') return 1;
-                return (b.created_at || 0) - (a.created_at || 0);
-            });
-
-            container.innerHTML = topics.map(topic => {
-                const badge = getStatusBadge(topic.status);
-                const isActive = topic.topic_id === oasisCurrentTopicId;
-                return `
-                    <div class="oasis-topic-item p-3 border-b ${isActive ? 'active' : ''}" onclick="openOasisTopic('${topic.topic_id}')">
-                        <div class="flex items-center justify-between mb-1">
-                            <span class="oasis-status-badge ${badge.cls}">${badge.text}</span>
-                            <span class="text-[10px] text-gray-400">${topic.created_at ? formatTime(topic.created_at) : ''}</span>
-                        </div>
-                        <p class="text-sm text-gray-800 font-medium line-clamp-2">${escapeHtml(topic.question)}</p>
-                        <div class="flex items-center space-x-3 mt-1 text-[10px] text-gray-400">
-                            <span>💬 ${topic.post_count || 0} ${t('oasis_posts')}</span>
-                            <span>🔄 ${topic.current_round}/${topic.max_rounds} ${t('oasis_round')}</span>
-                        </div>
-                    </div>`;
-            }).join('');
-        }
-
-        function escapeHtml(text) {
-            const div = document.createElement('div');
-            div.textContent = text;
-            return div.innerHTML;
-        }
-
-        async function openOasisTopic(topicId) {
-            oasisCurrentTopicId = topicId;
-            stopOasisPolling();
-
-            // Switch to detail view
-            document.getElementById('oasis-topic-list-view').style.display = 'none';
-            document.getElementById('oasis-detail-view').style.display = 'flex';
-
-            // Load topic detail
-            await loadTopicDetail(topicId);
-        }
-
-        function showOasisTopicList() {
-            stopOasisPolling();
-            oasisCurrentTopicId = null;
-            document.getElementById('oasis-detail-view').style.display = 'none';
-            document.getElementById('oasis-topic-list-view').style.display = 'flex';
-            refreshOasisTopics();
-        }
-
-        async function loadTopicDetail(topicId) {
-            try {
-                const resp = await fetch(`/proxy_oasis/topics/${topicId}`);
-                console.log('[OASIS] Detail response status:', resp.status);
-                if (!resp.ok) {
-                    console.error('[OASIS] Failed to fetch detail:', resp.status);
-                    return;
-                }
-                const detail = await resp.json();
-                console.log('[OASIS] Detail data:', detail);
-                console.log('[OASIS] Posts count:', (detail.posts || []).length);
-                renderTopicDetail(detail);
-
-                // If still discussing, start polling for updates
-                if (detail.status === 'discussing' || detail.status === 'pending') {
-                    startDetailPolling(topicId);
-                }
-            } catch (e) {
-                console.warn('Failed to load topic detail:', e);
-            }
-        }
-
-        function renderTopicDetail(detail) {
-            const badge = getStatusBadge(detail.status);
-            document.getElementById('oasis-detail-status').className = 'oasis-status-badge ' + badge.cls;
-            document.getElementById('oasis-detail-status').textContent = badge.text;
-            const roundText = currentLang === 'zh-CN' ? `第 ${detail.current_round}/${detail.max_rounds} ${t('oasis_round')}` : `Round ${detail.current_round}/${detail.max_rounds}`;
-            document.getElementById('oasis-detail-round').textContent = roundText;
-            document.getElementById('oasis-detail-question').textContent = detail.question;
-
-            renderPosts(detail.posts || []);
-
-            // Show/hide conclusion
-            const conclusionArea = document.getElementById('oasis-conclusion-area');
-            if (detail.conclusion && detail.status === 'concluded') {
-                document.getElementById('oasis-conclusion-text').textContent = detail.conclusion;
-                conclusionArea.style.display = 'block';
-            } else {
-                conclusionArea.style.display = 'none';
-            }
-        }
-
-        function renderPosts(posts) {
-            const box = document.getElementById('oasis-posts-box');
-
-            if (posts.length === 0) {
-                box.innerHTML = `
-                    <div class="text-center text-gray-400 text-sm py-8">
-                        <div class="text-2xl mb-2">💭</div>
-                        <p>${t('oasis_waiting')}</p>
-                    </div>`;
-                return;
-            }
-
-            box.innerHTML = posts.map(p => {
-                const avatar = getExpertAvatar(p.author);
-                const isReply = p.reply_to !== null && p.reply_to !== undefined;
-                const totalVotes = p.upvotes + p.downvotes;
-                const upPct = totalVotes > 0 ? (p.upvotes / totalVotes * 100) : 50;
-
-                return `
-                    <div class="oasis-post bg-white rounded-xl p-3 border shadow-sm ${isReply ? 'ml-4 border-l-2 border-l-blue-300' : ''}">
-                        <div class="flex items-start space-x-2">
-                            <div class="oasis-expert-avatar ${avatar.cls}" title="${escapeHtml(p.author)}">${avatar.icon}</div>
-                            <div class="flex-1 min-w-0">
-                                <div class="flex items-center justify-between">
-                                    <span class="text-xs font-semibold text-gray-700">${escapeHtml(p.author)}</span>
-                                    <div class="flex items-center space-x-2 text-[10px] text-gray-400">
-                                        ${isReply ? '<span>↩️ #' + p.reply_to + '</span>' : ''}
-                                        <span>#${p.id}</span>
-                                    </div>
-                                </div>
-                                <p class="text-xs text-gray-600 mt-1 leading-relaxed">${escapeHtml(p.content)}</p>
-                                <div class="flex items-center space-x-3 mt-2">
-                                    <div class="flex items-center space-x-1">
-                                        <span class="text-[10px]">👍 ${p.upvotes}</span>
-                                        <span class="text-[10px]">👎 ${p.downvotes}</span>
-                                    </div>
-                                    ${totalVotes > 0 ? `
-                                        <div class="flex-1 oasis-vote-bar flex">
-                                            <div class="oasis-vote-up" style="width: ${upPct}%"></div>
-                                            <div class="oasis-vote-down" style="width: ${100 - upPct}%"></div>
-                                        </div>` : ''}
-                                </div>
-                            </div>
-                        </div>
-                    </div>`;
-            }).join('');
-
-            // Auto-scroll to bottom
-            box.scrollTop = box.scrollHeight;
-        }
-
-        function startDetailPolling(topicId) {
-            stopOasisPolling();
-            let lastPostCount = 0;
-            let errorCount = 0;
-            oasisPollingTimer = setInterval(async () => {
-                if (oasisCurrentTopicId !== topicId) {
-                    stopOasisPolling();
-                    return;
-                }
-                try {
-                    const resp = await fetch(`/proxy_oasis/topics/${topicId}`);
-                    if (!resp.ok) {
-                        errorCount++;
-                        console.warn(`OASIS polling error: HTTP ${resp.status}`);
-                        if (errorCount >= 5) {
-                            console.error('OASIS polling failed 5 times, stopping');
-                            stopOasisPolling();
-                        }
-                        return;
-                    }
-                    errorCount = 0;
-                    const detail = await resp.json();
-                    
-                    // Only re-render if posts changed
-                    const currentPostCount = (detail.posts || []).length;
-                    if (currentPostCount !== lastPostCount || detail.status !== 'discussing') {
-                        renderTopicDetail(detail);
-                        lastPostCount = currentPostCount;
-                    }
-
-                    // Stop polling when discussion ends
-                    if (detail.status === 'concluded' || detail.status === 'error') {
-                        stopOasisPolling();
-                        refreshOasisTopics();
-                    }
-                } catch (e) {
-                    errorCount++;
-                    console.warn('OASIS polling error:', e);
-                }
-            }, 1500); // Poll every 1.5 seconds for faster updates
-        }
-
-        // Auto-refresh topic list periodically when panel is open
-        setInterval(() => {
-            if (oasisPanelOpen && !oasisCurrentTopicId && currentUserId) {
-                refreshOasisTopics();
-            }
-        }, 10000); // Every 10 seconds
-    </script>
-
-    <script>
-    // === Native App Enhancements ===
-
-    // 1. Splash screen dismiss
-    window.addEventListener('load', () => {
-        setTimeout(() => {
-            const splash = document.getElementById('app-splash');
-            if (splash) {
-                splash.classList.add('fade-out');
-                setTimeout(() => splash.remove(), 600);
-            }
-        }, 800);
-    });
-
-    // 2. Prevent pull-to-refresh and overscroll bounce
-    document.addEventListener('touchmove', function(e) {
-        // Allow scrolling inside scrollable containers
-        let el = e.target;
-        while (el && el !== document.body) {
-            const style = window.getComputedStyle(el);
-            if ((style.overflowY === 'auto' || style.overflowY === 'scroll') && el.scrollHeight > el.clientHeight) {
-                return; // Allow scroll inside this element
-            }
-            el = el.parentElement;
-        }
-        e.preventDefault();
-    }, { passive: false });
-
-    // 3. Prevent double-tap zoom
-    let lastTouchEnd = 0;
-    document.addEventListener('touchend', function(e) {
-        const now = Date.now();
-        if (now - lastTouchEnd <= 300) {
-            e.preventDefault();
-        }
-        lastTouchEnd = now;
-    }, false);
-
-    // 4. Prevent pinch zoom
-    document.addEventListener('gesturestart', function(e) {
-        e.preventDefault();
-    });
-    document.addEventListener('gesturechange', function(e) {
-        e.preventDefault();
-    });
-
-    // 5. Prevent context menu on long press - mobile only (except in chat messages)
-    const isTouchDevice = ('ontouchstart' in window) || (navigator.maxTouchPoints > 0);
-    if (isTouchDevice) {
-        document.addEventListener('contextmenu', function(e) {
-            const allowed = e.target.closest('.message-agent, .message-user, .markdown-body, textarea, input');
-            if (!allowed) {
-                e.preventDefault();
-            }
-        });
-    }
-
-    // 6. Online/Offline detection
-    function updateOnlineStatus() {
-        const banner = document.getElementById('offline-banner');
-        if (navigator.onLine) {
-            banner.classList.remove('show');
-        } else {
-            banner.classList.add('show');
-        }
-    }
-    window.addEventListener('online', updateOnlineStatus);
-    window.addEventListener('offline', updateOnlineStatus);
-
-    // 7. Register Service Worker for PWA caching
-    if ('serviceWorker' in navigator) {
-        navigator.serviceWorker.register('/sw.js').catch(() => {});
-    }
-
-    // 8. iOS standalone: handle navigation to stay in-app
-    if (window.navigator.standalone) {
-        document.addEventListener('click', function(e) {
-            const a = e.target.closest('a');
-            if (a && a.href && !a.target && a.hostname === location.hostname) {
-                e.preventDefault();
-                location.href = a.href;
-            }
-        });
-    }
-
-    // 9. Keyboard handling for mobile/PWA - comprehensive solution
-    if (isTouchDevice && window.visualViewport) {
-        const chatMain = document.querySelector('.chat-main');
-        const chatContainer = document.querySelector('.chat-container');
-        const header = document.querySelector('header');
-        const inputArea = document.querySelector('.border-t.p-2');
-        
-        // PWA Standalone mode detection
-        const isPWA = window.matchMedia('(display-mode: standalone)').matches || 
-                      window.navigator.standalone === true;
-        
-        let lastHeight = window.visualViewport.height;
-        
-        function handleViewportChange() {
-            const vh = window.visualViewport.height;
-            const windowHeight = window.innerHeight;
-            const keyboardHeight = windowHeight - vh;
-            
-            // Detect if keyboard is open (more than 100px difference)
-            const keyboardOpen = keyboardHeight > 100;
-            
-            if (isPWA || keyboardOpen) {
-                // PWA mode or keyboard open: adjust heights
-                const availableHeight = vh;
-                
-                // Update CSS variable for app height
-                document.documentElement.style.setProperty('--app-height', availableHeight + 'px');
-                
-                // Chat main takes full available height
-                if (chatMain) {
-                    chatMain.style.height = availableHeight + 'px';
-                    chatMain.style.maxHeight = availableHeight + 'px';
-                }
-                
-                // Ensure flex behavior
-                if (header) header.style.flexShrink = '0';
-                if (inputArea) inputArea.style.flexShrink = '0';
-                
-                // Chat container gets remaining space via flex
-                if (chatContainer) {
-                    chatContainer.style.flex = '1';
-                    chatContainer.style.minHeight = '0';
-                }
-            } else {
-                // Normal mode: reset to CSS defaults
-                document.documentElement.style.removeProperty('--app-height');
-                
-                if (chatMain) {
-                    chatMain.style.height = '';
-                    chatMain.style.maxHeight = '';
-                }
-                
-                if (header) header.style.flexShrink = '';
-                if (inputArea) inputArea.style.flexShrink = '';
-                
-                if (chatContainer) {
-                    chatContainer.style.flex = '';
-                    chatContainer.style.minHeight = '';
-                }
-            }
-            
-            lastHeight = vh;
-        }
-        
-        // Debounced resize handler
-        let resizeTimeout;
-        function debouncedHandleViewportChange() {
-            clearTimeout(resizeTimeout);
-            resizeTimeout = setTimeout(handleViewportChange, 50);
-        }
-        
-        // Initial call
-        handleViewportChange();
-        
-        // Listen for viewport changes
-        window.visualViewport.addEventListener('resize', debouncedHandleViewportChange);
-        window.visualViewport.addEventListener('scroll', handleViewportChange);
-        
-        // Also listen for window resize (orientation change)
-        window.addEventListener('resize', debouncedHandleViewportChange);
-        window.addEventListener('orientationchange', () => {
-            setTimeout(handleViewportChange, 100);
-        });
-    }
-    
-    // Input focus: scroll into view on mobile
-    const inputEl = document.getElementById('user-input');
-    if (inputEl && isTouchDevice) {
-        inputEl.addEventListener('focus', () => {
-            setTimeout(() => {
-                // Scroll input into view
-                inputEl.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
-                // Also trigger viewport check
-                if (window.visualViewport) {
-                    window.dispatchEvent(new Event('resize'));
-                }
-            }, 100);
-        });
-        
-        // On blur: reset after keyboard closes
-        inputEl.addEventListener('blur', () => {
-            setTimeout(() => {
-                if (window.visualViewport) {
-                    window.dispatchEvent(new Event('resize'));
-                }
-            }, 200);
-        });
-    }
-    </script>
-</body>
-</html>
-"""
 
 @app.route("/")
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    body, encoding = INDEX_HTML_BYTES, None
+    for enc, compressed in INDEX_ENCODED_BODIES:
+        if request.accept_encodings[enc]:
+            body, encoding = compressed, enc
+            break
+
+    resp = Response(body, mimetype="text/html")
+    resp.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+        resp.set_etag(f"{INDEX_ETAG}-{encoding}")
+    else:
+        resp.set_etag(INDEX_ETAG)
+    # 每次都用 ETag 向服务端确认：内容未变返回 304（无 body），更新部署后立即生效
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+@app.route("/md-worker.js")
+def md_worker():
+    """Markdown 渲染 Worker（见 static/md-worker.js），1 天缓存"""
+    return send_from_directory(STATIC_DIR, "md-worker.js", mimetype="application/javascript", max_age=86400)
+
 
 @app.route("/manifest.json")
 def manifest():
     """Serve PWA manifest for iOS/Android Add-to-Home-Screen support."""
-    manifest_data = {
-        "name": "Xavier AnyControl",
-        "short_name": "AnyControl",
-        "description": "Xavier AI Agent - Intelligent Control Assistant",
-        "start_url": "/",
-        "scope": "/",
-        "display": "standalone",
-        "orientation": "portrait",
-        "background_color": "#111827",
-        "theme_color": "#111827",
-        "lang": "zh-CN",
-        "categories": ["productivity", "utilities"],
-        "icons": [
-            {
-                "src": "https://img.icons8.com/fluency/192/robot-2.png",
-                "sizes": "192x192",
-                "type": "image/png",
-                "purpose": "any maskable"
-            },
-            {
-                "src": "https://img.icons8.com/fluency/512/robot-2.png",
-                "sizes": "512x512",
-                "type": "image/png",
-                "purpose": "any maskable"
-            }
-        ]
-    }
-    return app.response_class(
-        response=__import__("json").dumps(manifest_data),
-        mimetype="application/manifest+json"
-    )
+    # 静态文件 + 1 天缓存；send_from_directory 自带 ETag / Last-Modified 条件请求
+    return send_from_directory(STATIC_DIR, "manifest.json", mimetype="application/manifest+json", max_age=86400)
 
 
 @app.route("/sw.js")
 def service_worker():
     """Serve Service Worker for PWA offline support and caching."""
-    sw_code = """
-// Xavier AnyControl Service Worker
-const CACHE_NAME = 'anycontrol-v1';
-const PRECACHE_URLS = ['/'];
-
-self.addEventListener('install', event => {
-    self.skipWaiting();
-    event.waitUntil(
-        caches.open(CACHE_NAME).then(cache => cache.addAll(PRECACHE_URLS))
-    );
-});
-
-self.addEventListener('activate', event => {
-    event.waitUntil(
-        caches.keys().then(keys =>
-            Promise.all(keys.filter(k => k !== CACHE_NAME).map(k => caches.delete(k)))
-        ).then(() => self.clients.claim())
-    );
-});
-
-self.addEventListener('fetch', event => {
-    // Network-first strategy for API calls, cache-first for static assets
-    if (event.request.url.includes('/proxy_') || event.request.url.includes('/ask') || event.request.url.includes('/v1/')) {
-        event.respondWith(
-            fetch(event.request).catch(() => caches.match(event.request))
-        );
-    } else {
-        event.respondWith(
-            caches.match(event.request).then(cached => {
-                const fetched = fetch(event.request).then(response => {
-                    const clone = response.clone();
-                    caches.open(CACHE_NAME).then(cache => cache.put(event.request, clone));
-                    return response;
-                }).catch(() => cached);
-                return cached || fetched;
-            })
-        );
-    }
-});
-"""
-    return app.response_class(
-        response=sw_code,
-        mimetype="application/javascript",
-        headers={"Service-Worker-Allowed": "/"}
-    )
+    # 静态文件 + ETag：浏览器检查 SW 更新时未改动只回 304；max_age=0 保证每次都会重新验证
+    resp = send_from_directory(STATIC_DIR, "sw.js", mimetype="application/javascript", max_age=0)
+    resp.headers["Service-Worker-Allowed"] = "/"
+    return resp
 
 
 @app.route("/v1/chat/completions", methods=["POST", "OPTIONS"])
@@ -2563,50 +651,57 @@ def proxy_openai_completions():
 
     # 直接透传请求体和 Authorization header 到后端
     auth_header = request.headers.get("Authorization", "")
+    body = request.get_data(cache=False)  # 请求体原样转发，不解析再编码
+    # 按用户限流；凭证被上游拒绝时退回令牌（见 _refund_user_token）
+    rate_key = _openai_rate_key(auth_header, body)
+    rejected = _acquire_chat_slot(rate_key)
+    if rejected is not None:
+        return rejected
+    handed_off = False
     try:
-        r = requests.post(
+        r = UPSTREAM.post(
             LOCAL_OPENAI_COMPLETIONS_URL,
-            json=request.get_json(silent=True),
+            data=body,
             headers={
                 "Authorization": auth_header,
                 "Content-Type": "application/json",
             },
             stream=True,
-            timeout=120,
+            timeout=UPSTREAM_CHAT_TIMEOUT,
         )
         if r.status_code != 200:
+            if r.status_code in (401, 403):
+                _refund_user_token(rate_key)
             return Response(r.content, status=r.status_code, content_type=r.headers.get("content-type", "application/json"))
 
         # 判断是否是流式响应
         content_type = r.headers.get("content-type", "")
         if "text/event-stream" in content_type:
-            def generate():
-                for chunk in r.iter_content(chunk_size=None):
-                    if chunk:
-                        yield chunk
-            return Response(
-                generate(),
+            handed_off = True
+            # direct_passthrough：Werkzeug 不再包装/探测生成器，收到的块原样写出
+            return _hold_slot_until_closed(Response(
+                _relay_stream(r, _OPENAI_SSE_ERROR_FRAME),
                 mimetype="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no",
-                },
-            )
+                direct_passthrough=True,
+                headers=_SSE_HEADERS,
+            ), r)
         else:
             return Response(r.content, status=r.status_code, content_type=content_type)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
+    finally:
+        if not handed_off:
+            _upstream_slots.release()
 
 
 @app.route("/v1/models", methods=["GET"])
 def proxy_openai_models():
     """透传 /v1/models"""
     try:
-        r = requests.get(f"http://127.0.0.1:{PORT_AGENT}/v1/models", timeout=10)
+        r = UPSTREAM.get(LOCAL_OPENAI_MODELS_URL, timeout=10)
         return Response(r.content, status=r.status_code, content_type=r.headers.get("content-type", "application/json"))
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 
 @app.route("/proxy_login", methods=["POST"])
@@ -2616,27 +711,35 @@ def proxy_login():
     password = request.json.get("password", "")
 
     try:
-        r = requests.post(LOCAL_LOGIN_URL, json={"user_id": user_id, "password": password}, timeout=10)
+        r = UPSTREAM.post(LOCAL_LOGIN_URL, json={"user_id": user_id, "password": password}, timeout=10)
         if r.status_code == 200:
-            # 登录成功，在 Flask session 中记录
+            # 登录成功：Flask session 只记录 Agent 签发的令牌，不保存明文密码
+            # （session cookie 只签名不加密，浏览器端可以读到内容）
+            session.clear()
             session["user_id"] = user_id
-            session["password"] = password  # 需要传给后端每次验证
-            return jsonify(r.json())
-        else:
-            return jsonify(r.json()), r.status_code
+            session["token"] = orjson.loads(r.content).get("token", "")
+        return _passthrough(r)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 @app.route("/proxy_ask", methods=["POST"])
 def proxy_ask():
-    """[已弃用] 非流式代理，请改用 /v1/chat/completions (stream=false)"""
+    """[已弃用] 非流式代理，请改用 /v1/chat/completions (stream=false)
+
+    客户端声明接受 text/event-stream（或请求体 stream=true）时直接走流式代理，
+    边生成边转发，不再等完整回复缓冲成 JSON。
+    """
     user_id = session.get("user_id")
-    password = session.get("password")
-    if not user_id or not password:
+    token = session.get("token")
+    if not user_id or not token:
         return jsonify({"error": "未登录"}), 401
 
-    user_content = request.json.get("content")
-    images = request.json.get("images")
+    data = request.get_json(silent=True) or {}
+    if request.accept_mimetypes.best == "text/event-stream" or data.get("stream"):
+        return proxy_ask_stream()
+
+    user_content = data.get("content")
+    images = data.get("images")
 
     # 构造 content parts
     content_parts = []
@@ -2653,43 +756,81 @@ def proxy_ask():
     else:
         msg_content = "(空消息)"
 
-    openai_payload = {
-        "model": "mini-timebot",
-        "messages": [{"role": "user", "content": msg_content}],
-        "stream": False,
-        "user": user_id,
-        "password": password,
-    }
+    # 仅纯文本请求参与缓存（带图片的请求不缓存）
+    cache_key = None
+    leader_event = None
+    if PROXY_ASK_CACHE_TTL > 0 and isinstance(msg_content, str) and request.args.get("nocache") != "1":
+        cache_key = _ask_cache_key(user_id, msg_content)
+        cached_body, leader_event = _ask_cache_acquire(cache_key)
+        if cached_body is not None:
+            return Response(cached_body, mimetype="application/json")
+
+    rejected = _acquire_chat_slot("user:" + user_id)
+    if rejected is not None:
+        if leader_event is not None:
+            _ask_cache_release(cache_key, leader_event)
+        return rejected
+
+    if PROXY_AGENT_MSGPACK:
+        url, content_type = LOCAL_OPENAI_COMPLETIONS_MSGPACK_URL, "application/msgpack"
+        openai_payload = msgpack.packb({
+            "model": "mini-timebot",
+            "messages": [{"role": "user", "content": msg_content}],
+            "stream": False,
+            "user": user_id,
+            "password": token,
+        })
+    else:
+        url, content_type = LOCAL_OPENAI_COMPLETIONS_URL, "application/json"
+        openai_payload = _chat_payload(msg_content, stream=False, user=user_id, password=token)
 
     try:
-        r = requests.post(
-            LOCAL_OPENAI_COMPLETIONS_URL,
-            json=openai_payload,
-            headers={"Authorization": f"Bearer {user_id}:{password}"},
-            timeout=120,
+        r = UPSTREAM.post(
+            url,
+            data=openai_payload,
+            headers={"Authorization": f"Bearer {user_id}:{token}", "Content-Type": content_type},
+            timeout=UPSTREAM_CHAT_TIMEOUT,
         )
         if r.status_code == 401:
+            _refund_user_token("user:" + user_id)
             session.clear()
-            return jsonify(r.json()), 401
-        resp = r.json()
+            return _passthrough(r)
+        if r.status_code != 200:
+            return _passthrough(r)
+        if r.headers.get("content-type", "").startswith("application/msgpack"):
+            resp = msgpack.unpackb(r.content, raw=False)
+        else:
+            resp = orjson.loads(r.content)
         # 从 OpenAI 格式提取 content 转为原格式
         content = resp.get("choices", [{}])[0].get("message", {}).get("content", "")
-        return jsonify({"status": "success", "response": content})
+        result = {"status": "success", "response": content}
+        response_html = _render_markdown(content)
+        if response_html is not None:
+            result["response_html"] = response_html
+        body = orjson.dumps(result)
+        if cache_key is not None and r.status_code == 200:
+            with _ask_cache_lock:
+                _ask_cache[cache_key] = body
+        return Response(body, mimetype="application/json")
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
+    finally:
+        _upstream_slots.release()
+        if leader_event is not None:
+            _ask_cache_release(cache_key, leader_event)
 
 @app.route("/proxy_ask_stream", methods=["POST"])
 def proxy_ask_stream():
     """[已弃用] 流式代理，请改用 /v1/chat/completions (stream=true)"""
     user_id = session.get("user_id")
-    password = session.get("password")
-    if not user_id or not password:
+    token = session.get("token")
+    if not user_id or not token:
         return jsonify({"error": "未登录"}), 401
 
     data = request.get_json(silent=True)
     if data is None:
         content_len = request.content_length or 0
-        print(f"[proxy_ask_stream] ⚠️ JSON 解析失败, content_length={content_len}, content_type={request.content_type}")
+        app.logger.warning("proxy_ask_stream JSON 解析失败, content_length=%s, content_type=%s", content_len, request.content_type)
         return jsonify({"error": f"请求体解析失败 (大小: {content_len/1024/1024:.1f}MB)"}), 400
 
     user_content = data.get("content")
@@ -2698,7 +839,10 @@ def proxy_ask_stream():
     images = data.get("images")  # None or list of base64 strings
     files = data.get("files")    # None or list of {name, content}
     audios = data.get("audios")  # None or list of {base64, name, format}
-    print(f"[proxy_ask_stream] 收到请求: text={bool(user_content)}, images={len(images) if images else 0}, files={len(files) if files else 0}, audios={len(audios) if audios else 0}")
+    app.logger.debug(
+        "proxy_ask_stream: text=%s, images=%d, files=%d, audios=%d",
+        bool(user_content), len(images or ()), len(files or ()), len(audios or ()),
+    )
 
     # 构造 OpenAI 格式的 messages content parts
     content_parts = []
@@ -2742,84 +886,92 @@ def proxy_ask_stream():
         msg_content = "(空消息)"
 
     # 构造 OpenAI 格式请求
-    openai_payload = {
-        "model": "mini-timebot",
-        "messages": [{"role": "user", "content": msg_content}],
-        "stream": True,
-        "user": user_id,
-        "password": password,
-        "session_id": session_id,
-        "enabled_tools": enabled_tools,
-    }
+    openai_payload = _chat_payload(
+        msg_content,
+        stream=True,
+        user=user_id,
+        password=token,
+        session_id=session_id,
+        enabled_tools=enabled_tools,
+    )
 
+    rejected = _acquire_chat_slot("user:" + user_id)
+    if rejected is not None:
+        return rejected
+    handed_off = False
     try:
-        r = requests.post(
+        r = UPSTREAM.post(
             LOCAL_OPENAI_COMPLETIONS_URL,
-            json=openai_payload,
-            headers={"Authorization": f"Bearer {user_id}:{password}"},
+            data=openai_payload,
+            headers={"Authorization": f"Bearer {user_id}:{token}", "Content-Type": "application/json"},
             stream=True,
-            timeout=120,
+            timeout=UPSTREAM_CHAT_TIMEOUT,
         )
-        if r.status_code == 401:
-            session.clear()
-            return jsonify({"error": "认证失败"}), 401
         if r.status_code != 200:
+            r.close()
+            if r.status_code == 401:
+                _refund_user_token("user:" + user_id)
+                session.clear()
+                return jsonify({"error": "认证失败"}), 401
             return jsonify({"error": f"Agent 返回 {r.status_code}"}), r.status_code
 
         def generate():
             """将 OpenAI SSE 格式转为前端期望的简单 SSE 格式"""
-            import json as _json
-            for line in r.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                if line.startswith("data: [DONE]"):
-                    yield "data: [DONE]\n\n"
-                    continue
-                if line.startswith("data: "):
-                    try:
-                        chunk = _json.loads(line[6:])
-                        delta = chunk.get("choices", [{}])[0].get("delta", {})
-                        content = delta.get("content", "")
-                        if content:
-                            # 转换为前端期望的简单 SSE 格式
-                            text = content.replace("\\", "\\\\").replace("\n", "\\n")
-                            yield f"data: {text}\n\n"
-                    except _json.JSONDecodeError:
-                        # 透传无法解析的行
-                        yield line + "\n\n"
-
-        return Response(
+            pending = b""
+            try:
+                # chunk_size=None：socket 上到多少处理多少；同一次读取里的多个 token 帧
+                # 合并成一次 yield（一次 send），不额外等待，也就不增加首字延迟
+                for raw in r.iter_content(chunk_size=None):
+                    if not raw:
+                        continue
+                    lines = (pending + raw).split(b"\n")
+                    pending = lines.pop()
+                    out = b"".join(_simple_sse_frame(line) for line in lines)
+                    if out:
+                        yield out
+                if pending:
+                    out = _simple_sse_frame(pending)
+                    if out:
+                        yield out
+            except requests.RequestException as e:
+                app.logger.warning("上游流中断 %s: %s", r.url, e)
+                yield _SSE_ERROR_FRAME
+            finally:
+                r.close()
+
+        handed_off = True
+        return _hold_slot_until_closed(Response(
             generate(),
             mimetype="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            },
-        )
+            direct_passthrough=True,
+            headers=_SSE_HEADERS,
+        ), r)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
+    finally:
+        if not handed_off:
+            _upstream_slots.release()
 
 @app.route("/proxy_cancel", methods=["POST"])
 def proxy_cancel():
     """代理取消请求到后端 Agent"""
     user_id = session.get("user_id")
-    password = session.get("password")
-    if not user_id or not password:
+    token = session.get("token")
+    if not user_id or not token:
         return jsonify({"error": "未登录"}), 401
     session_id = request.json.get("session_id", "default") if request.is_json else "default"
     try:
-        r = requests.post(LOCAL_AGENT_CANCEL_URL, json={"user_id": user_id, "password": password, "session_id": session_id}, timeout=5)
-        return jsonify(r.json())
+        r = UPSTREAM.post(LOCAL_AGENT_CANCEL_URL, json={"user_id": user_id, "password": token, "session_id": session_id}, timeout=5)
+        return _passthrough(r)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 @app.route("/proxy_tts", methods=["POST"])
 def proxy_tts():
     """代理 TTS 请求到后端 Agent，返回 mp3 音频流"""
     user_id = session.get("user_id")
-    password = session.get("password")
-    if not user_id or not password:
+    token = session.get("token")
+    if not user_id or not token:
         return jsonify({"error": "未登录"}), 401
 
     text = request.json.get("text", "")
@@ -2828,10 +980,10 @@ def proxy_tts():
         return jsonify({"error": "文本不能为空"}), 400
 
     try:
-        payload = {"user_id": user_id, "password": password, "text": text}
+        payload = {"user_id": user_id, "password": token, "text": text}
         if voice:
             payload["voice"] = voice
-        r = requests.post(LOCAL_TTS_URL, json=payload, timeout=60)
+        r = UPSTREAM.post(LOCAL_TTS_URL, json=payload, timeout=60)
         if r.status_code != 200:
             return jsonify({"error": f"TTS 服务错误: {r.status_code}"}), r.status_code
 
@@ -2841,20 +993,42 @@ def proxy_tts():
             headers={"Content-Disposition": "inline; filename=tts_output.mp3"},
         )
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
+
+# 工具列表由 Agent 启动时加载的 MCP 工具决定、与用户无关：短 TTL 缓存，
+# 每次登录/刷新页面不必都打到 Agent
+_tools_cache: TTLCache = TTLCache(maxsize=1, ttl=int(os.getenv("PROXY_TOOLS_CACHE_TTL", "30")))
+_tools_cache_lock = threading.Lock()
+
 
 @app.route("/proxy_tools")
 def proxy_tools():
     """代理获取工具列表请求到后端 Agent"""
+    with _tools_cache_lock:
+        cached = _tools_cache.get("tools")
+    if cached is not None:
+        body, content_type = cached
+        return Response(body, content_type=content_type)
     try:
-        r = requests.get(LOCAL_TOOLS_URL, headers={"X-Internal-Token": INTERNAL_TOKEN}, timeout=10)
-        return jsonify(r.json())
+        r = UPSTREAM.get(LOCAL_TOOLS_URL, headers={"X-Internal-Token": INTERNAL_TOKEN}, timeout=10)
+        if r.status_code == 200:
+            with _tools_cache_lock:
+                _tools_cache["tools"] = (r.content, r.headers.get("content-type", "application/json"))
+        return _passthrough(r)
     except Exception as e:
-        return jsonify({"error": str(e), "tools": []}), 500
+        return _upstream_error(e, _ERR_TOOLS_BODIES)
 
 @app.route("/proxy_logout", methods=["POST"])
 def proxy_logout():
+    user_id = session.get("user_id")
+    token = session.get("token")
     session.clear()
+    # 让 Agent 吊销该用户的登录令牌：浏览器里保存的令牌即使泄露，登出后也不能再用
+    if user_id and token:
+        try:
+            UPSTREAM.post(LOCAL_LOGOUT_URL, json={"user_id": user_id, "password": token}, timeout=5)
+        except requests.RequestException as e:
+            app.logger.warning("登出时吊销令牌失败: %s", e)
     return jsonify({"status": "success"})
 
 
@@ -2862,63 +1036,98 @@ def proxy_logout():
 def proxy_sessions():
     """代理获取用户会话列表"""
     user_id = session.get("user_id")
-    password = session.get("password")
-    if not user_id or not password:
+    token = session.get("token")
+    if not user_id or not token:
         return jsonify({"error": "未登录"}), 401
     try:
-        r = requests.post(LOCAL_SESSIONS_URL, json={"user_id": user_id, "password": password}, timeout=15)
-        return jsonify(r.json()), r.status_code
+        r = UPSTREAM.post(LOCAL_SESSIONS_URL, json={"user_id": user_id, "password": token}, timeout=15)
+        return _passthrough(r)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 
 @app.route("/proxy_session_history", methods=["POST"])
 def proxy_session_history():
     """代理获取指定会话的历史消息"""
     user_id = session.get("user_id")
-    password = session.get("password")
-    if not user_id or not password:
+    token = session.get("token")
+    if not user_id or not token:
         return jsonify({"error": "未登录"}), 401
     sid = request.json.get("session_id", "")
     try:
-        r = requests.post(LOCAL_SESSION_HISTORY_URL, json={
-            "user_id": user_id, "password": password, "session_id": sid
+        r = UPSTREAM.post(LOCAL_SESSION_HISTORY_URL, json={
+            "user_id": user_id, "password": token, "session_id": sid
         }, timeout=15)
-        return jsonify(r.json()), r.status_code
+        return _passthrough(r)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 
 @app.route("/proxy_delete_session", methods=["POST"])
 def proxy_delete_session():
     """代理删除会话请求到后端 Agent"""
     user_id = session.get("user_id")
-    password = session.get("password")
-    if not user_id or not password:
+    token = session.get("token")
+    if not user_id or not token:
         return jsonify({"error": "未登录"}), 401
     sid = request.json.get("session_id", "") if request.is_json else ""
     try:
-        r = requests.post(LOCAL_DELETE_SESSION_URL, json={
-            "user_id": user_id, "password": password, "session_id": sid
+        r = UPSTREAM.post(LOCAL_DELETE_SESSION_URL, json={
+            "user_id": user_id, "password": token, "session_id": sid
         }, timeout=15)
-        return jsonify(r.json()), r.status_code
+        return _passthrough(r)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 
 # ===== OASIS Proxy Routes =====
 
+# 话题列表 / 专家列表是公开只读数据：极短 TTL 缓存，页面集中加载时 N 个并发请求只打一次 OASIS。
+# 同一 URL 并发未命中时只放一个请求去上游，其余等它写入缓存后直接复用。0 = 关闭
+OASIS_PROXY_CACHE_TTL = float(os.getenv("OASIS_PROXY_CACHE_TTL", "2"))
+_oasis_cache: TTLCache = TTLCache(maxsize=8, ttl=OASIS_PROXY_CACHE_TTL or 1)
+_oasis_cache_lock = threading.Lock()
+_oasis_fetch_locks = {OASIS_TOPICS_URL: threading.Lock(), OASIS_EXPERTS_URL: threading.Lock()}
+
+
+def _oasis_cached_get(url: str) -> tuple[int, bytes, str]:
+    """返回 (status, body, content_type)；只缓存 200 响应"""
+    if OASIS_PROXY_CACHE_TTL <= 0:
+        r = UPSTREAM.get(url, timeout=10)
+        return r.status_code, r.content, r.headers.get("content-type", "application/json")
+    with _oasis_cache_lock:
+        hit = _oasis_cache.get(url)
+    if hit is not None:
+        return hit
+    with _oasis_fetch_locks[url]:
+        with _oasis_cache_lock:
+            hit = _oasis_cache.get(url)
+        if hit is not None:
+            return hit
+        r = UPSTREAM.get(url, timeout=10)
+        entry = (r.status_code, r.content, r.headers.get("content-type", "application/json"))
+        if r.status_code == 200:
+            with _oasis_cache_lock:
+                _oasis_cache[url] = entry
+        return entry
+
+
 @app.route("/proxy_oasis/topics")
 def proxy_oasis_topics():
     """Proxy: list all OASIS discussion topics."""
     # Note: OASIS is a public forum, don't filter by user_id
     try:
-        print(f"[OASIS Proxy] Fetching topics from {OASIS_BASE_URL}/topics")
-        r = requests.get(f"{OASIS_BASE_URL}/topics", timeout=10)
-        print(f"[OASIS Proxy] Response status: {r.status_code}, count: {len(r.json()) if r.text else 0}")
-        return jsonify(r.json()), r.status_code
+        status, body, content_type = _oasis_cached_get(OASIS_TOPICS_URL)
+        oasis_log.debug("topics: status=%s, %d bytes", status, len(body))
+        if status != 200:
+            return Response(body, status=status, content_type=content_type)
+        # 列表没变时回 304：面板定时刷新时省掉传输、JSON 解析和重新渲染
+        resp = Response(body, mimetype="application/json")
+        resp.set_etag(hashlib.blake2b(body, digest_size=16).hexdigest())
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp.make_conditional(request)
     except Exception as e:
-        print(f"[OASIS Proxy] Error fetching topics: {e}")
+        oasis_log.warning("获取话题列表失败: %s", e)
         return jsonify([]), 200  # Return empty list on error
 
 
@@ -2926,51 +1135,80 @@ def proxy_oasis_topics():
 def proxy_oasis_topic_detail(topic_id):
     """Proxy: get full detail of a specific OASIS discussion."""
     try:
-        url = f"{OASIS_BASE_URL}/topics/{topic_id}"
-        print(f"[OASIS Proxy] Fetching topic detail from {url}")
-        r = requests.get(url, timeout=10)
-        print(f"[OASIS Proxy] Detail response status: {r.status_code}")
-        return jsonify(r.json()), r.status_code
+        r = UPSTREAM.get(f"{OASIS_TOPICS_URL}/{topic_id}", timeout=10)
+        oasis_log.debug("topic %s: status=%s", topic_id, r.status_code)
+        return _passthrough(r)
     except Exception as e:
-        print(f"[OASIS Proxy] Error fetching topic detail: {e}")
-        return jsonify({"error": str(e)}), 500
+        oasis_log.warning("获取话题详情失败: %s", e)
+        return _upstream_error(e)
 
 
 @app.route("/proxy_oasis/topics/<topic_id>/stream")
 def proxy_oasis_topic_stream(topic_id):
     """Proxy: SSE stream for real-time OASIS discussion updates."""
     try:
-        r = requests.get(f"{OASIS_BASE_URL}/topics/{topic_id}/stream", stream=True, timeout=300)
+        r = UPSTREAM_STREAM.get(f"{OASIS_TOPICS_URL}/{topic_id}/stream", stream=True, timeout=300)
         if r.status_code != 200:
+            r.close()
             return jsonify({"error": f"OASIS returned {r.status_code}"}), r.status_code
 
-        def generate():
-            for line in r.iter_lines(decode_unicode=True):
-                if line:
-                    yield line + "\n\n"
+        # 上游帧已自带 SSE 分隔符，原样转发字节：不按行缓冲、不做逐行解码
+        return Response(
+            _relay_stream(r),
+            mimetype="text/event-stream",
+            direct_passthrough=True,
+            headers=_SSE_HEADERS,
+        )
+    except Exception as e:
+        return _upstream_error(e)
+
+
+@app.route("/proxy_oasis/topics/<topic_id>/events")
+def proxy_oasis_topic_events(topic_id):
+    """Proxy: structured SSE (TopicDetail JSON snapshots) for the discussion panel."""
+    try:
+        r = UPSTREAM_STREAM.get(f"{OASIS_TOPICS_URL}/{topic_id}/events", stream=True, timeout=(5, 60))
+        if r.status_code != 200:
+            return _passthrough(r)
 
         return Response(
-            generate(),
+            _relay_stream(r),
             mimetype="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            },
+            direct_passthrough=True,
+            headers=_SSE_HEADERS,
         )
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 
 @app.route("/proxy_oasis/experts")
 def proxy_oasis_experts():
     """Proxy: list all OASIS expert agents."""
     try:
-        r = requests.get(f"{OASIS_BASE_URL}/experts", timeout=10)
-        return jsonify(r.json()), r.status_code
+        status, body, content_type = _oasis_cached_get(OASIS_EXPERTS_URL)
+        return Response(body, status=status, content_type=content_type)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _upstream_error(e)
 
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=int(os.getenv("PORT_FRONTEND", "51209")), debug=False, threaded=True)
+    port = int(os.getenv("PORT_FRONTEND", "51209"))
+    # 上游地址在导入时已固定，启动前打印一次，配置错误在接流量之前就能发现
+    agent_via = f"uds:{AGENT_UDS}" if AGENT_UDS else f"127.0.0.1:{PORT_AGENT}"
+    print(f"[front] upstream agent={agent_via} oasis={OASIS_BASE_URL} msgpack={PROXY_AGENT_MSGPACK}")
+    if monkey is not None:
+        from gevent.pywsgi import WSGIServer
+
+        class _NoDelayWSGIServer(WSGIServer):
+            """面向浏览器的连接关闭 Nagle：SSE 的小帧和短 JSON 响应立即发出，不等待合并"""
+
+            def handle(self, sock, address):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                super().handle(sock, address)
+
+        # spawn 为整数时即协程池上限，超出的连接排队而不是无限创建 greenlet
+        max_conns = int(os.getenv("FRONT_MAX_CONNECTIONS", "1000"))
+        print(f"[front] gevent WSGIServer on 127.0.0.1:{port} (max {max_conns} connections)")
+        _NoDelayWSGIServer(("127.0.0.1", port), app, spawn=max_conns).serve_forever()
+    else:
+        app.run(host="127.0.0.1", port=port, debug=False, threaded=True)
@@ -11,6 +11,7 @@ LLM 厂商路由工厂 —— 全局共享
 """
 
 import os
+import httpx
 from langchain_core.language_models.chat_models import BaseChatModel
 
 
@@ -41,6 +42,42 @@ def extract_text(content) -> str:
         return "".join(parts)
     return str(content)
 
+# ======================================================================
+# 共享 HTTP 客户端：同一进程内所有 OpenAI 兼容模型复用一个连接池
+# ======================================================================
+
+_shared_http_async_client: httpx.AsyncClient | None = None
+
+
+def get_shared_http_async_client() -> httpx.AsyncClient:
+    """返回进程级共享的 httpx.AsyncClient（惰性创建）。
+
+    较大的 keep-alive 连接池让并发用户的请求复用已建立的连接；
+    安装了 h2 时启用 HTTP/2，多个请求复用同一条 TCP 连接。
+    """
+    global _shared_http_async_client
+    if _shared_http_async_client is None or _shared_http_async_client.is_closed:
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        _shared_http_async_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=60,
+        )
+    return _shared_http_async_client
+
+
+async def aclose_shared_http_async_client():
+    """关闭共享 HTTP 客户端（服务退出时调用）。"""
+    global _shared_http_async_client
+    if _shared_http_async_client is not None:
+        await _shared_http_async_client.aclose()
+        _shared_http_async_client = None
+
+
 # 模型名 -> 厂商 的自动推断映射
 _MODEL_PROVIDER_PATTERNS: dict[str, str] = {
     # 有专用 LangChain 包的厂商
@@ -73,11 +110,13 @@ def create_chat_model(
     max_tokens: int = 2048,
     timeout: int = 60,
     max_retries: int = 2,
+    http_async_client: httpx.AsyncClient | None = None,
 ) -> BaseChatModel:
     """
     读取环境变量，自动路由到正确的厂商 SDK 并返回 ChatModel。
 
     可覆盖的参数：temperature / max_tokens / timeout / max_retries
+    http_async_client: 可选的共享异步 HTTP 客户端（仅 OpenAI 兼容 / DeepSeek 生效）
     模型、API Key、Base URL、Provider 均从环境变量读取。
     """
     api_key = os.getenv("LLM_API_KEY")
@@ -137,6 +176,7 @@ def create_chat_model(
             max_tokens=max_tokens,
             timeout=timeout,
             max_retries=max_retries,
+            http_async_client=http_async_client,
         )
 
     # 默认: OpenAI 兼容格式
@@ -150,4 +190,5 @@ def create_chat_model(
         max_tokens=max_tokens,
         timeout=timeout,
         max_retries=max_retries,
+        http_async_client=http_async_client,
     )
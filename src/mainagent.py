@@ -1,6 +1,7 @@
 import os
 import json
 import hashlib
+import hmac
 import asyncio
 import secrets
 import base64
@@ -10,13 +11,18 @@ from contextlib import asynccontextmanager
 
 import aiosqlite
 import httpx
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Any
 import uvicorn
 
+try:
+    import msgpack  # 可选：前端代理内部跳的二进制编码
+except ImportError:
+    msgpack = None
+
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 
 from dotenv import load_dotenv
@@ -25,7 +31,7 @@ from dotenv import load_dotenv
 from api_patch import patch_langchain_file_mime, build_audio_part
 patch_langchain_file_mime()
 
-from agent import MiniTimeAgent
+from agent import MiniTimeAgent, LLMUnavailableError, freeze_enabled_tools
 from llm_factory import extract_text as _extract_text
 
 # --- Path setup ---
@@ -35,6 +41,7 @@ root_dir = os.path.dirname(current_dir)
 env_path = os.path.join(root_dir, "config", ".env")
 db_path = os.path.join(root_dir, "data", "agent_memory.db")
 users_path = os.path.join(root_dir, "config", "users.json")
+token_generations_path = os.path.join(root_dir, "data", "token_generations.json")
 prompts_dir = os.path.join(root_dir, "data", "prompts")
 
 load_dotenv(dotenv_path=env_path)
@@ -90,6 +97,61 @@ def verify_password(username: str, password: str) -> bool:
     return pw_hash == users[username]
 
 
+# --- 登录会话令牌 ---
+# 登录成功后签发 "<过期时间>.<签名>"，前端代理只保存令牌、不再保存明文密码。
+# 签名用 INTERNAL_TOKEN 做 HMAC，消息里带上用户当前的密码哈希和令牌代数：
+# 改密码后旧令牌自动失效；登出时代数 +1，该用户已签发的令牌（所有设备）一并失效。
+# 代数落盘保存，Agent 重启后已吊销的令牌仍然无效。令牌不含 ":"，可以直接放进 Bearer <user>:<token>
+USER_TOKEN_TTL = int(os.getenv("USER_TOKEN_TTL", str(7 * 24 * 3600)))
+
+
+def _load_token_generations() -> dict:
+    try:
+        with open(token_generations_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+_token_generations: dict = _load_token_generations()
+
+
+def revoke_user_tokens(username: str):
+    """令牌代数 +1 并落盘：此前为该用户签发的所有令牌立即失效"""
+    _token_generations[username] = _token_generations.get(username, 0) + 1
+    os.makedirs(os.path.dirname(token_generations_path), exist_ok=True)
+    tmp_path = token_generations_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_token_generations, f)
+    os.replace(tmp_path, token_generations_path)
+
+
+def _user_token_sig(username: str, pw_hash: str, expires: int) -> str:
+    generation = _token_generations.get(username, 0)
+    msg = f"{username}\x00{pw_hash}\x00{generation}\x00{expires}".encode("utf-8")
+    return hmac.new(INTERNAL_TOKEN.encode("utf-8"), msg, hashlib.sha256).hexdigest()
+
+
+def issue_user_token(username: str) -> str:
+    """为已通过密码校验的用户签发会话令牌"""
+    expires = int(time.time()) + USER_TOKEN_TTL
+    pw_hash = load_users().get(username, "")
+    return f"{expires}.{_user_token_sig(username, pw_hash, expires)}"
+
+
+def verify_user(username: str, secret: str | None) -> bool:
+    """校验用户凭证：secret 可以是登录令牌，也可以是密码（兼容直接调用 API 的客户端）"""
+    if not username or not secret:
+        return False
+    expires, dot, sig = secret.partition(".")
+    if dot and expires.isdigit() and len(sig) == 64:
+        if int(expires) < time.time():
+            return False
+        pw_hash = load_users().get(username)
+        return pw_hash is not None and hmac.compare_digest(sig, _user_token_sig(username, pw_hash, int(expires)))
+    return verify_password(username, secret)
+
+
 # --- Create agent instance ---
 agent = MiniTimeAgent(src_dir=current_dir, db_path=db_path)
 
@@ -115,6 +177,12 @@ app.add_middleware(
 )
 
 
+# LLM 熔断中：非流式接口返回 503；流式接口由各自 _stream_worker 的异常分支把提示写进流里
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailableError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
 # --- Request models ---
 class LoginRequest(BaseModel):
     user_id: str
@@ -332,7 +400,7 @@ async def get_tools_list(
         parts = token.split(":")
         if token == INTERNAL_TOKEN:
             return {"status": "success", "tools": agent.get_tools_info()}
-        if len(parts) >= 2 and verify_password(parts[0], parts[1]):
+        if len(parts) >= 2 and verify_user(parts[0], parts[1]):
             return {"status": "success", "tools": agent.get_tools_info()}
     raise HTTPException(status_code=403, detail="认证失败")
 
@@ -340,14 +408,23 @@ async def get_tools_list(
 @app.post("/login")
 async def login(req: LoginRequest):
     if verify_password(req.user_id, req.password):
-        return {"status": "success", "message": "登录成功"}
+        return {"status": "success", "message": "登录成功", "token": issue_user_token(req.user_id)}
     raise HTTPException(status_code=401, detail="用户名或密码错误")
 
 
+@app.post("/logout")
+async def logout(req: LoginRequest):
+    """登出：吊销该用户已签发的全部登录令牌（令牌泄露后登出即失效）"""
+    if not verify_user(req.user_id, req.password):
+        raise HTTPException(status_code=401, detail="用户名或密码错误")
+    revoke_user_tokens(req.user_id)
+    return {"status": "success", "message": "已登出"}
+
+
 @app.post("/ask", deprecated=True)
 async def ask_agent(req: UserRequest):
     """[已弃用] 请使用 POST /v1/chat/completions (非流式, stream=false)"""
-    if not verify_password(req.user_id, req.password):
+    if not verify_user(req.user_id, req.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
 
     # Compose thread_id: user_id#session_id for conversation isolation
@@ -356,7 +433,7 @@ async def ask_agent(req: UserRequest):
     user_input = {
         "messages": [_build_human_message(req.text, req.images, req.files, req.audios)],
         "trigger_source": "user",
-        "enabled_tools": req.enabled_tools,
+        "enabled_tools": freeze_enabled_tools(req.enabled_tools),
         "user_id": req.user_id,
         "session_id": req.session_id,
     }
@@ -368,7 +445,7 @@ async def ask_agent(req: UserRequest):
 @app.post("/ask_stream", deprecated=True)
 async def ask_agent_stream(req: UserRequest):
     """[已弃用] 请使用 POST /v1/chat/completions (流式, stream=true)"""
-    if not verify_password(req.user_id, req.password):
+    if not verify_user(req.user_id, req.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
 
     # Cancel previous active task for this user+session
@@ -381,7 +458,7 @@ async def ask_agent_stream(req: UserRequest):
     user_input = {
         "messages": [_build_human_message(req.text, req.images, req.files, req.audios)],
         "trigger_source": "user",
-        "enabled_tools": req.enabled_tools,
+        "enabled_tools": freeze_enabled_tools(req.enabled_tools),
         "user_id": req.user_id,
         "session_id": req.session_id,
     }
@@ -465,7 +542,7 @@ async def ask_agent_stream(req: UserRequest):
 @app.post("/cancel")
 async def cancel_agent(req: CancelRequest):
     """终止指定用户的智能体思考"""
-    if not verify_password(req.user_id, req.password):
+    if not verify_user(req.user_id, req.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
     task_key = f"{req.user_id}#{req.session_id}"
     await agent.cancel_task(task_key)
@@ -485,7 +562,7 @@ class TTSRequest(BaseModel):
 @app.post("/tts")
 async def text_to_speech(req: TTSRequest):
     """将文本转为语音，返回 mp3 音频流"""
-    if not verify_password(req.user_id, req.password):
+    if not verify_user(req.user_id, req.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
 
     tts_text = req.text.strip()
@@ -560,7 +637,7 @@ class DeleteSessionRequest(BaseModel):
 @app.post("/sessions")
 async def list_sessions(req: SessionListRequest):
     """列出用户的所有会话，返回 session_id 列表及每个会话的摘要信息。"""
-    if not verify_password(req.user_id, req.password):
+    if not verify_user(req.user_id, req.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
 
     prefix = f"{req.user_id}#"
@@ -622,7 +699,7 @@ async def list_sessions(req: SessionListRequest):
 @app.post("/session_history")
 async def get_session_history(req: SessionHistoryRequest):
     """获取指定会话的完整对话历史（仅返回 Human/AI 消息）。"""
-    if not verify_password(req.user_id, req.password):
+    if not verify_user(req.user_id, req.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
 
     thread_id = f"{req.user_id}#{req.session_id}"
@@ -681,7 +758,7 @@ async def delete_session(
     """
     # 支持内部 token 认证（OASIS 专家 session 清理使用）
     internal_auth = x_internal_token and x_internal_token == INTERNAL_TOKEN
-    if not internal_auth and not verify_password(req.user_id, req.password):
+    if not internal_auth and not verify_user(req.user_id, req.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
 
     try:
@@ -910,7 +987,7 @@ def _auth_openai_request(req: ChatCompletionRequest, auth_header: str | None):
 
     if not user_id or not password:
         return None, False, None
-    if not verify_password(user_id, password):
+    if not verify_user(user_id, password):
         return None, False, None
     return user_id, True, session_override
 
@@ -993,7 +1070,7 @@ async def openai_chat_completions(
     user_input = {
         "messages": input_messages,
         "trigger_source": "user",
-        "enabled_tools": req.enabled_tools,
+        "enabled_tools": freeze_enabled_tools(req.enabled_tools),
         "user_id": user_id,
         "session_id": session_id,
         "external_tools": req.tools,
@@ -1138,6 +1215,23 @@ async def openai_chat_completions(
     )
 
 
+@app.post("/v1/chat/completions/msgpack", include_in_schema=False)
+async def openai_chat_completions_msgpack(
+    request: Request,
+    authorization: str | None = Header(None),
+):
+    """内部接口：请求体和响应体均为 msgpack 的非流式 /v1/chat/completions，供本机前端代理使用。"""
+    if msgpack is None:
+        raise HTTPException(status_code=501, detail="msgpack 未安装")
+    try:
+        req = ChatCompletionRequest(**msgpack.unpackb(await request.body(), raw=False))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"msgpack 请求体解析失败: {e}")
+    req.stream = False
+    result = await openai_chat_completions(req, authorization)
+    return Response(msgpack.packb(result), media_type="application/msgpack")
+
+
 # ------------------------------------------------------------------
 # OpenAI-compatible: /v1/models (列出可用模型)
 # ------------------------------------------------------------------
@@ -1156,5 +1250,30 @@ async def list_models():
     }
 
 
+async def _serve_tcp_and_uds(port: int, uds_path: str):
+    """
+    TCP 端口照常服务（定时器、OASIS、chatbot 等仍走 127.0.0.1），
+    额外在 Unix domain socket 上提供同一个 app 给同机的前端代理使用。
+    UDS 实例不跑 lifespan，等 TCP 实例完成 Agent 初始化后再开始监听。
+    """
+    tcp_server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port))
+    uds_server = uvicorn.Server(uvicorn.Config(app, uds=uds_path, lifespan="off"))
+    tasks = [asyncio.create_task(tcp_server.serve())]
+    while not tcp_server.started and not tasks[0].done():
+        await asyncio.sleep(0.1)
+    if not tasks[0].done():
+        tasks.append(asyncio.create_task(uds_server.serve()))
+        print(f"[mainagent] 同时监听 UDS: {uds_path}")
+    # 信号只会落到其中一个实例上：任一实例退出即让另一个一起退出
+    _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    tcp_server.should_exit = uds_server.should_exit = True
+    await asyncio.gather(*pending)
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("PORT_AGENT", "51200")))
+    port = int(os.getenv("PORT_AGENT", "51200"))
+    uds_path = os.getenv("AGENT_UDS", "").strip()
+    if uds_path:
+        asyncio.run(_serve_tcp_and_uds(port, uds_path))
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=port)
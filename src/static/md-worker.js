@@ -0,0 +1,20 @@
+// Markdown 渲染 Worker：与页面使用同一份本地化的 marked / highlight.js，配置保持一致
+importScripts('/vendor/marked-9.1.2.min.js', '/vendor/highlight-11.8.0.min.js');
+// marked 9 已移除 highlight 选项，Worker 内没有 DOM 不能用 highlightElement，改为自定义 code 渲染；
+// 输出带 data-highlighted，主线程的 queueHighlight 据此跳过，不再重复高亮
+marked.use({
+    renderer: {
+        code: function(code, infostring) {
+            // 未标注或未知语言时自动识别，与主线程 hljs.highlightElement 的结果一致
+            const lang = (infostring || '').trim().split(' ')[0];
+            const result = hljs.getLanguage(lang) ? hljs.highlight(code, { language: lang }) : hljs.highlightAuto(code);
+            const language = result.language || 'plaintext';
+            return '<pre><code class="hljs language-' + language + '" data-highlighted="yes">' + result.value + '</code></pre>';
+        }
+    }
+});
+self.onmessage = function(e) {
+    let html = null;
+    try { html = marked.parse(e.data.text); } catch (err) { /* 主线程回退同步渲染 */ }
+    self.postMessage({ id: e.data.id, html: html });
+};
@@ -0,0 +1,92 @@
+// Xavier AnyControl Service Worker
+// 部署新版本时改 CACHE_NAME，activate 时会清掉旧缓存
+const CACHE_NAME = 'anycontrol-v2';
+// v3：旧版本按 URL 缓存过用户私有接口（会话列表等），改名让 activate 清掉
+const API_CACHE_NAME = 'anycontrol-api-v3';
+const PRECACHE_URLS = ['/'];
+// 公开接口网络优先：超过这个时间还没响应且有缓存时先用缓存顶上
+const API_TIMEOUT_MS = 3000;
+
+self.addEventListener('install', event => {
+    self.skipWaiting();
+    event.waitUntil(
+        caches.open(CACHE_NAME).then(cache => cache.addAll(PRECACHE_URLS))
+    );
+});
+
+self.addEventListener('activate', event => {
+    const keep = [CACHE_NAME, API_CACHE_NAME];
+    event.waitUntil(
+        caches.keys().then(keys =>
+            Promise.all(keys.filter(k => !keep.includes(k)).map(k => caches.delete(k)))
+        ).then(() => self.clients.claim())
+    );
+});
+
+function isApiRequest(url) {
+    return url.pathname.startsWith('/proxy_') || url.pathname.startsWith('/ask') || url.pathname.startsWith('/v1/');
+}
+
+// 只有不区分用户的公开接口（OASIS 公共论坛）可以进缓存；
+// 会话列表、工具列表等按登录用户返回的数据缓存键只有 URL，换人登录或会话过期后会串给别人
+function isPublicApiRequest(url) {
+    return url.pathname.startsWith('/proxy_oasis/');
+}
+
+function isEventStream(request, url) {
+    return (request.headers.get('accept') || '').includes('text/event-stream')
+        || url.pathname.endsWith('/stream') || url.pathname.endsWith('/events');
+}
+
+// 网络优先 + 超时：网络在 API_TIMEOUT_MS 内返回就用网络结果（并更新缓存）；
+// 超时且有缓存时先返回缓存，没有缓存就继续等网络；网络失败时退回缓存
+function networkFirstWithTimeout(event) {
+    const request = event.request;
+    const network = fetch(request).then(response => {
+        if (response.status === 200) {
+            const clone = response.clone();
+            event.waitUntil(caches.open(API_CACHE_NAME).then(cache => cache.put(request, clone)));
+        }
+        return response;
+    });
+    const fallback = new Promise(resolve => {
+        setTimeout(() => caches.match(request).then(cached => cached && resolve(cached)), API_TIMEOUT_MS);
+    });
+    return Promise.race([
+        network.catch(() => caches.match(request).then(cached => cached || Promise.reject(new Error('offline')))),
+        fallback,
+    ]);
+}
+
+// stale-while-revalidate：有缓存立即返回，同时后台拉取新版本更新缓存，下次打开即生效
+function staleWhileRevalidate(event) {
+    const request = event.request;
+    return caches.open(CACHE_NAME).then(cache =>
+        cache.match(request).then(cached => {
+            const network = fetch(request).then(response => {
+                if (response.ok) cache.put(request, response.clone());
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(network.catch(() => {}));
+                return cached;
+            }
+            return network;
+        })
+    );
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    // 只处理同源 GET；POST（聊天、登录等）和 SSE 流直接走网络，不经过缓存
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin || isEventStream(request, url)) return;
+
+    if (isApiRequest(url)) {
+        // 用户私有接口不经过 Service Worker，直接走网络
+        if (isPublicApiRequest(url)) event.respondWith(networkFirstWithTimeout(event));
+    } else {
+        event.respondWith(staleWhileRevalidate(event));
+    }
+});